@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorized metrics of scraped option data over any range of download dates:
+volume by time bucket, EOD volume, number of pulls and intervals between
+pulls with positive volume. post_analysis.py is built on top of it.
+
+Most functions take the volume by time table made by load_volume_by_time()
+or volume_by_time(), i.e. one row per symbol and pull with columns 'Symbol',
+'Download Date', 'Download Time' and 'Volume' (incremental volume).
+"""
+
+import numpy as np
+import pandas as pd
+
+from sqlite_store import SQLiteStore
+
+KEYS = ['Symbol', 'Download Date', 'Download Time']
+
+
+def load_volume_by_time(config, start_date, end_date=None, symbols=None):
+    """Total volume per symbol and pull from the SQLite database
+
+    Parameters:
+    -----------
+    config : ConfigParser
+        Config read from config_nasdaq100.ini.
+
+    start_date, end_date : str, 'YYYY-MM-DD'
+        Inclusive range of 'Download Date'. end_date defaults to start_date.
+
+    symbols : list of str, default None
+        Symbols to load. None means all.
+
+    Return:
+    -------
+    vol_by_time : DataFrame
+        'Symbol', 'Download Date', 'Download Time' and 'Volume'.
+    """
+
+    end_date = start_date if end_date is None else end_date
+    params = [start_date, end_date]
+
+    sql = ('SELECT Symbol, "Download Date", "Download Time", '
+           'sum(Volume) as Volume FROM '
+           + config['CURRENT']['DataTableName']
+           + ' WHERE "Download Date" BETWEEN ? AND ?')
+    if symbols is not None:
+        sql += ' AND Symbol IN ({})'.format(','.join('?' * len(symbols)))
+        params += list(symbols)
+    sql += ' GROUP BY Symbol, "Download Date", "Download Time"'
+
+    store = SQLiteStore.open(config['CURRENT']['DatabasePath'])
+    vol_by_time = store.read(sql, params)
+
+    return vol_by_time
+
+
+def volume_by_time(df):
+    """Total volume per symbol and pull of scraped data
+
+    Parameters:
+    -----------
+    df : DataFrame
+        Option data, e.g. YahooScraper.data or ParquetStore.read(), with
+        incremental 'Volume'.
+
+    Return:
+    -------
+    vol_by_time : DataFrame
+        Same as load_volume_by_time().
+    """
+
+    keys = [df[key].astype(str) for key in KEYS]
+    vol_by_time = df['Volume'].groupby(keys).sum().reset_index()
+
+    return vol_by_time
+
+
+def pull_times(vol_by_time):
+    """Timestamp of each pull from 'Download Date' and 'Download Time'"""
+
+    return pd.to_datetime(vol_by_time['Download Date'].astype(str) + ' '
+                          + vol_by_time['Download Time'].astype(str))
+
+
+def volume_by_bucket(vol_by_time, freq='15min'):
+    """Total volume per symbol and time bucket
+
+    A bucket is labeled by its start and holds the pulls after its start up
+    to and including its end, e.g. 09:45 holds (09:45, 10:00].
+
+    Parameters:
+    -----------
+    vol_by_time : DataFrame
+        See load_volume_by_time().
+
+    freq : str, pandas offset alias, default '15min'
+        Bucket size.
+
+    Return:
+    -------
+    vol_by_bucket : DataFrame
+        Symbols as rows and bucket start times as columns, NaN where a
+        symbol was not pulled.
+    """
+
+    times = pull_times(vol_by_time)
+    buckets = (times - pd.Timedelta(1, 'ns')).dt.floor(freq)
+
+    vol_by_bucket = vol_by_time['Volume'].groupby(
+        [vol_by_time['Symbol'].values, buckets.values]).sum()
+
+    return vol_by_bucket.unstack()
+
+
+def eod_volume(vol_by_time):
+    """Total volume per symbol (rows) and download date (columns)"""
+
+    return vol_by_time.groupby(['Symbol', 'Download Date'])['Volume'].sum(
+        ).unstack()
+
+
+def pull_counts(vol_by_time):
+    """Number of pulls per symbol (rows) and download date (columns)"""
+
+    return vol_by_time.groupby(['Symbol', 'Download Date']).size().unstack()
+
+
+def tag_positive_volume(vol_by_time):
+    """Running count of pulls with positive volume within each symbol
+
+    Rows are taken in the given order, as the loop in the original
+    post_analysis.py did.
+    """
+
+    positive = (vol_by_time['Volume'] > 0).astype(np.int64)
+    return positive.groupby(vol_by_time['Symbol'].values).cumsum()
+
+
+def positive_volume_intervals(vol_by_time):
+    """Intervals between consecutive pulls with positive volume
+
+    Intervals are only measured within a download date, so the overnight gap
+    never counts.
+
+    Return:
+    -------
+    intervals : DataFrame
+        Indexed by 'Symbol' and 'Download Date', with 'Positive Pulls' and
+        'Min Interval', 'Mean Interval' and 'Max Interval' in seconds.
+    """
+
+    df = vol_by_time.loc[vol_by_time['Volume'] > 0,
+                         ['Symbol', 'Download Date']].copy()
+    df['Time'] = pull_times(vol_by_time.loc[df.index])
+    df = df.sort_values(['Symbol', 'Download Date', 'Time'])
+
+    groups = df.groupby(['Symbol', 'Download Date'])
+    df['Interval'] = groups['Time'].diff().dt.total_seconds()
+
+    intervals = df.groupby(['Symbol', 'Download Date']).agg(**{
+        'Positive Pulls': ('Time', 'size'),
+        'Min Interval': ('Interval', 'min'),
+        'Mean Interval': ('Interval', 'mean'),
+        'Max Interval': ('Interval', 'max')
+    })
+
+    return intervals
+
+
+def symbol_bins(symbols, batch_size):
+    """Batch number of each symbol as assigned by live_nasdaq100.py
+
+    Parameters:
+    -----------
+    symbols : list of str
+        Symbol list in database order.
+
+    batch_size : int, positive
+
+    Return:
+    -------
+    bins : Series
+        Batch number indexed by symbol.
+    """
+
+    num_bins = int(np.ceil(len(symbols) / batch_size))
+    bins = pd.cut(np.arange(len(symbols)), num_bins, labels=False)
+
+    return pd.Series(bins, index=list(symbols), name='Bin')
+
+
+def heatmap_scores(vol_by_bucket, bins=None):
+    """Scale bucket volume into [0, 1] per symbol for a heat map
+
+    Volume is square rooted and divided by the max of its symbol. Buckets
+    without a pull get -1, and symbols are ordered by batch if bins (see
+    symbol_bins()) is given.
+    """
+
+    scores = np.sqrt(vol_by_bucket)
+    scores = scores.div(scores.max(axis=1), axis=0).fillna(-1)
+
+    if bins is not None:
+        order = bins.reindex(scores.index).sort_values(kind='mergesort')
+        scores = scores.loc[order.index]
+
+    return scores
@@ -0,0 +1,371 @@
+# -*- coding: utf-8 -*-
+"""
+Asyncio crawl engine for YahooScraper. Every symbol and every expiration page
+is requested at once over aiohttp, bounded by a concurrency limit and a
+per-host rate limit, so a whole NASDAQ-100 chain fits in a single process.
+"""
+
+import asyncio
+import inspect
+import queue
+import threading
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from fetch_backends import (FetchError, option_url, parse_option_text,
+                            YAHOO_API_URL, YAHOO_WEB_URL)
+from yahoo_scraper import (YahooScraper, Timer, Page404Error,
+                           ElementEmptyError, SymbolNotFoundError,
+                           make_time_marks)
+
+_DONE = object() # Ends the stream of scrape_iter()
+
+
+class RateLimiter:
+    """Per-host Token Bucket
+
+    Parameters:
+    -----------
+    rate : float, positive
+        Requests per second allowed for each host.
+
+    burst : int, positive, default None
+        Bucket size, i.e. requests that can go out back-to-back. Defaults to
+        rate.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1)
+        self._buckets = {} # host -> (tokens, last refill time)
+        self._locks = {}
+
+    async def acquire(self, host):
+        """Wait until a request to host is allowed"""
+
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            now = time.monotonic()
+            tokens, last = self._buckets.get(host, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+
+            if tokens < 1:
+                await asyncio.sleep((1 - tokens) / self.rate)
+                now, tokens = time.monotonic(), 1
+
+            self._buckets[host] = (tokens - 1, now)
+
+
+class AsyncYahooScraper(YahooScraper):
+    """Yahoo Finance Option Scraper on Asyncio
+
+    Same interface and results as YahooScraper, but all pages are fetched
+    concurrently without a browser. Retry semantics are kept: a page is tried
+    at most max_tries times, a page that keeps returning 404 raises
+    Page404Error and a page that never has option data raises
+    ElementEmptyError.
+
+    Parameters:
+    -----------
+    symbols : str or list of str
+        Symbol list of stocks of interest. Make sure it matches Yahoo tickers.
+
+    max_tries : int, positive, default 3
+        Max number of tries of loading a page before giving up on it.
+
+    concurrency : int, positive, default 20
+        Max number of requests in flight at any time.
+
+    rate : float, positive, default 10
+        Max requests per second sent to each host.
+
+    mode : str, 'json' or 'html', default 'json'
+        See fetch_backends.HttpBackend.
+
+    base_url : str, default None
+        See fetch_backends.HttpBackend.
+
+    timeout : float, positive, default 10
+        Seconds to wait for each response.
+
+    date_cache : ExpirationDateCache or None, default None
+        See YahooScraper.
+
+    symbol_cache : SymbolCache or None, default None
+        See YahooScraper. There is no lookup page without a browser, so
+        aliases are only read, never discovered.
+
+    metrics : Metrics or None, default None
+        See YahooScraper.
+
+    change_detector : ChangeDetector or None, default None
+        See YahooScraper.
+    """
+
+    def __init__(self, symbols, max_tries=3, concurrency=20, rate=10,
+                 mode='json', base_url=None, timeout=10, date_cache=None,
+                 symbol_cache=None, metrics=None, change_detector=None):
+        super().__init__(symbols, max_tries=max_tries, date_cache=date_cache,
+                         symbol_cache=symbol_cache, metrics=metrics,
+                         change_detector=change_detector)
+
+        if mode not in ('json', 'html'):
+            raise ValueError('mode must be either json or html')
+
+        self.mode = mode
+        if base_url is None:
+            base_url = YAHOO_API_URL if mode == 'json' else YAHOO_WEB_URL
+        self.base_url = base_url.rstrip('/')
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.limiter = RateLimiter(rate)
+
+    async def _fetch_page(self, session, semaphore, symbol, date=None):
+        """Fetch and parse one page with retries. Returns an OptionPage"""
+
+        url = option_url(self.base_url, self.mode, symbol, date)
+        host = urlsplit(url).netloc
+        num_404 = num_empty = 0
+        error = None
+
+        for attempt in range(self.max_tries):
+            if attempt:
+                self.retry.record(error)
+                await asyncio.sleep(self.retry.delay(attempt - 1))
+            await self.limiter.acquire(host)
+            async with semaphore:
+                timer = Timer() # Time page loading, not the wait for a slot
+                try:
+                    async with session.get(url) as response:
+                        status = response.status
+                        text = await response.text()
+                except (aiohttp.ClientError, asyncio.TimeoutError) as inst:
+                    error = inst
+                    continue
+                finally:
+                    self._record_time('Page Load', timer.stop(),
+                                      symbol=symbol, expiry=date)
+
+            if status == 404:
+                self.metrics.inc('page_404_total', source='async')
+                num_404 += 1
+                error = Page404Error()
+                continue
+            if status != 200:
+                error = 'HTTP {}'.format(status)
+                continue
+
+            try:
+                return parse_option_text(text, self.mode)
+            except FetchError:
+                error = ElementEmptyError()
+                num_empty += 1
+
+        if num_404 == self.max_tries: # Got only 404 pages
+            raise Page404Error
+        if num_empty:
+            raise ElementEmptyError
+
+        raise FetchError('Failed to open {} so many times'.format(url))
+
+    async def _scrape_one_stock_async(self, session, semaphore, symbol,
+                                      dates=None, sink=None):
+        """Scrape one symbol with all its expiration pages in flight
+
+        Results go to self.data, or to sink one expiration date at a time
+        if it is given.
+        """
+
+        time_marks = make_time_marks()
+
+        yahoo_symbol = symbol
+        if self.symbol_cache is not None:
+            yahoo_symbol = self.symbol_cache.resolve(symbol)
+        self.yahoo_symbols[symbol] = yahoo_symbol
+
+        from_cache = self._load_cached_dates(yahoo_symbol)
+        nearest = None
+        if not from_cache:
+            page = await self._fetch_page(session, semaphore, yahoo_symbol)
+            if not page.expiration_dates:
+                raise ElementEmptyError
+
+            self.expiration_dates[yahoo_symbol] = page.expiration_dates
+            self._cache_dates(yahoo_symbol)
+
+            # The base page already holds the nearest expiration date
+            nearest = page.expiration_dates[0]
+
+        dates = self._select_dates(yahoo_symbol, dates)
+        results = await asyncio.gather(
+            *[self._fetch_page(session, semaphore, yahoo_symbol, date[0])
+              for date in dates if date != nearest],
+            return_exceptions=True)
+        if nearest in dates:
+            results.insert(0, page)
+
+        if from_cache and any(isinstance(x, Exception) or not x.tables
+                              for x in results):
+            self._reject_cached_dates(yahoo_symbol)
+
+        # A date page that kept 404ing does not make a live symbol missing
+        found = any(not isinstance(x, Exception) for x in results)
+
+        for date, result in zip(dates, results):
+            if isinstance(result, ElementEmptyError):
+                print('No option price for {0} on expiration date: {1}'.format(
+                        yahoo_symbol, date[0]))
+                continue
+            if isinstance(result, Page404Error) and found:
+                raise FetchError('Got only 404 pages of {0} on expiration '
+                                 'date: {1}'.format(yahoo_symbol, date[0]))
+            if isinstance(result, Exception):
+                raise result
+            if not self._page_changed(symbol, date[0], result.yahoo_time,
+                                      result.tables):
+                continue
+
+            buffer = None if sink is None else self._new_buffer()
+            self._append_tables(result.tables, date, result.price,
+                                result.yahoo_time, symbol, yahoo_symbol,
+                                time_marks, buffer)
+            if buffer is not None and len(buffer):
+                result = sink(buffer.to_frame())
+                if inspect.isawaitable(result):
+                    await result
+
+    async def _scrape_symbol(self, session, semaphore, symbol, dates=None,
+                             sink=None):
+        """Scrape one symbol and report failures the way scrape_all() does"""
+
+        if self.symbol_cache is not None and self.symbol_cache.is_dead(symbol):
+            return # Not found in the last rounds
+
+        timer = Timer() # Time each symbol
+        try:
+            await self._scrape_one_stock_async(session, semaphore, symbol,
+                                               dates, sink)
+            if self.symbol_cache is not None:
+                self.symbol_cache.mark_found(symbol)
+        except (SymbolNotFoundError, Page404Error):
+            print(symbol + ' was not found.')
+            if self.symbol_cache is not None:
+                self.symbol_cache.remove_alias(symbol)
+                self.symbol_cache.mark_missing(symbol)
+        except ElementEmptyError:
+            print(symbol + ' has no option data')
+        except FetchError as inst:
+            print('Max tries reached. No data is available for '
+                  'symbol {0}: {1}'.format(symbol, inst))
+
+        self._record_time('Total Time', timer.stop(), symbol=symbol)
+
+    async def scrape_all_async(self, dates=None, sink=None):
+        """Scrape All Symbols Concurrently
+
+        Scrape and crawl all symbols in self.symbols. Results are appended to
+        self.data as in YahooScraper.scrape_all().
+
+        Parameters:
+        -----------
+        dates : dict, default None
+            Symbol -> list of expiration date values to scrape. Symbols not
+            in it, or None, mean all dates.
+
+        sink : callable or coroutine function, default None
+            If given, called with the DataFrame of each expiration date as
+            soon as its symbol is done, instead of appending to self.data.
+            A sink that may block must be a coroutine function, so that it
+            does not stall the event loop.
+        """
+
+        if dates is None:
+            dates = {}
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        headers = {'User-Agent': 'Mozilla/5.0'}
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                         headers=headers) as session:
+            await asyncio.gather(
+                *[self._scrape_symbol(session, semaphore, symbol,
+                                      dates.get(symbol), sink)
+                  for symbol in self.symbols])
+
+    def scrape_all(self, browser_quit=True, dates=None):
+        """Blocking wrapper of scrape_all_async(). browser_quit is ignored"""
+
+        asyncio.run(self.scrape_all_async(dates))
+
+    def scrape_iter(self, browser_quit=True, dates=None, max_pending=64):
+        """Scrape All Symbols as a Stream, see YahooScraper.scrape_iter()
+
+        The event loop runs on a background thread and hands batches over
+        through a queue of max_pending batches. When the consumer falls
+        behind, the symbols with a batch to hand over wait on the full queue
+        in an executor thread, while the requests in flight carry on, so
+        the round is not buffered. If the consumer stops early, the round is
+        cancelled and its connections closed. browser_quit is ignored.
+        """
+
+        batches = queue.Queue(max_pending)
+        errors = []
+        stop = threading.Event() # The consumer is gone
+        started = threading.Event()
+        state = {}
+
+        def put(item):
+            """Block until item is queued or the consumer is gone"""
+
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+
+        async def sink(batch):
+            await asyncio.get_running_loop().run_in_executor(None, put,
+                                                             batch)
+
+        async def main():
+            state['loop'] = asyncio.get_running_loop()
+            state['task'] = asyncio.current_task()
+            started.set()
+            await self.scrape_all_async(dates, sink=sink)
+
+        def run():
+            try:
+                asyncio.run(main())
+            except asyncio.CancelledError:
+                pass
+            except Exception as inst:
+                errors.append(inst)
+            finally:
+                started.set()
+                put(_DONE)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        try:
+            while True:
+                batch = batches.get()
+                if batch is _DONE:
+                    break
+                yield batch
+        finally:
+            stop.set()
+            started.wait()
+            if thread.is_alive() and 'task' in state:
+                try:
+                    state['loop'].call_soon_threadsafe(state['task'].cancel)
+                except RuntimeError: # The loop closed in the meantime
+                    pass
+            thread.join()
+
+        if errors:
+            raise errors[0]
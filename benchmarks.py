@@ -0,0 +1,972 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the scraper internals on synthetic data, so that changes can
+be measured without hitting Yahoo. Run all of them or only some by name:
+
+    python benchmarks.py
+    python benchmarks.py buffer
+"""
+
+import glob
+import io
+import json
+import math
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import tracemalloc
+from datetime import datetime, time, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+import analytics
+from async_scraper import AsyncYahooScraper
+from browser_profiles import BrowserProfile, PROFILES
+from change_detector import ChangeDetector
+from configparser import ConfigParser
+from fetch_backends import HttpBackend, option_url
+from live_nasdaq100 import save_increments
+from option_buffer import OptionBuffer
+from option_greeks import black_scholes, chain_analytics
+from option_parser import OPTION_COLUMNS, parse_option_tables
+from option_schema import SCHEMA, normalize_table, normalize_constants
+from replay import FixtureStore, ReplayServer, request_path
+from rollups import Rollups
+from sqlite_store import SQLiteStore, DATA_INDEX
+from tick_store import TickStore
+from volume_tracker import VolumeTracker
+from vol_surface import SurfaceBuilder
+from yahoo_scraper import YahooScraper, Timer
+
+# Expiration dates of synthetic chains, weekly from Jan 1, 2100 midnight UTC
+FIRST_EXPIRY = 4102444800
+
+
+def synthetic_option_table(symbol='AAPL', option_type='C', num_rows=30,
+                           seed=0):
+    """A random option table laid out as scraped from the Yahoo page"""
+
+    rng = np.random.RandomState(seed)
+    strikes = 100 + 2.5 * np.arange(num_rows)
+    last = np.round(rng.uniform(0.01, 20, num_rows), 2)
+
+    return pd.DataFrame({
+        'Strike': strikes,
+        'Contract Name': ['{0}170317{1}{2:08d}'.format(symbol, option_type,
+                                                       int(k * 1000))
+                          for k in strikes],
+        'Last Price': last,
+        'Bid': last - 0.05,
+        'Ask': last + 0.05,
+        'Change': np.round(rng.normal(0, 0.5, num_rows), 2),
+        '% Change': ['{:+.2f}%'.format(x)
+                     for x in rng.normal(0, 5, num_rows)],
+        'Volume': rng.randint(0, 5000, num_rows),
+        'Open Interest': rng.randint(0, 50000, num_rows),
+        'Implied Volatility': ['{:.2f}%'.format(x)
+                               for x in rng.uniform(10, 90, num_rows)]
+    }, columns=OPTION_COLUMNS)
+
+
+def synthetic_option_page(num_rows=30, num_noise=200, seed=0):
+    """HTML shaped like a Yahoo options page with num_noise unrelated blocks
+
+    The calls and puts tables sit where YahooScraper looks for them, and the
+    noise blocks stand in for the rest of the Yahoo DOM, a few of them being
+    tables that pd.read_html has to parse as well.
+    """
+
+    def table_html(df):
+        head = ''.join('<th>{}</th>'.format(c) for c in df.columns)
+        body = ''.join(
+            '<tr>' + ''.join('<td>{}</td>'.format(v) for v in row) + '</tr>'
+            for row in df.astype(str).values)
+        return ('<table><thead><tr>' + head + '</tr></thead><tbody>' + body
+                + '</tbody></table>')
+
+    noise = ''.join(
+        '<div class="nav"><a href="/quote/X{0}">X{0}</a><span>{0}</span>'
+        '</div>'.format(i) if i % 20 else
+        '<table><tr><td>Prev Close</td><td>{}</td></tr></table>'.format(i)
+        for i in range(num_noise))
+
+    calls = synthetic_option_table(option_type='C', num_rows=num_rows,
+                                   seed=seed)
+    puts = synthetic_option_table(option_type='P', num_rows=num_rows,
+                                  seed=seed + 1)
+    calls['Volume'] = calls['Volume'].astype(object)
+    calls.loc[::7, 'Volume'] = '-'
+
+    return (
+        '<html><body>' + noise
+        + '<div id="quote-header-info"><div></div><div><div><div>'
+        '<span>139.50</span></div></div></div></div>'
+        '<div id="quote-market-notice"><span>As of 10:00AM EST.</span></div>'
+        '<div id="main-0-Quote-Proxy"><section><div></div><div><section>'
+        '<div><section>'
+        '<section>' + table_html(calls) + '</section>'
+        '<section>' + table_html(puts) + '</section>'
+        '</section></div></section></div></section></div>'
+        + noise + '</body></html>')
+
+
+def synthetic_constants(i):
+    """Constant columns YahooScraper tags on the i-th table"""
+
+    return {
+        'Expiration Date': 'March 17, 2017',
+        'Download Time': '10:15:00.000000',
+        'Download Date': '2017-03-02',
+        'Download DateTime': '2017-03-02 10:15:00.000000',
+        'Download Source': 'Yahoo Finance',
+        'Price @ DL Time': '139.50',
+        'Yahoo Time': 'As of 10:00AM EST. Market open.',
+        'Symbol': 'SYM{}'.format(i // 20),
+        'Yahoo Symbol': 'SYM{}'.format(i // 20),
+        'Option Type': 'Call' if i % 2 else 'Put'
+    }
+
+
+def synthetic_option_chain(symbol, dates, date=None, num_rows=30, seed=0):
+    """A random response of Yahoo's JSON option endpoint
+
+    Parameters:
+    -----------
+    dates : list of int
+        Expiration dates in epoch seconds the chain lists.
+
+    date : int, default None
+        Expiration date of the calls and puts. None means dates[0], as on
+        the base page.
+    """
+
+    rng = np.random.RandomState(seed)
+    date = dates[0] if date is None else date
+    expiry = datetime.fromtimestamp(date, timezone.utc).strftime(
+        '%y%m%d')
+
+    def rows(option_type):
+        strikes = 100 + 2.5 * np.arange(num_rows)
+        last = np.round(rng.uniform(0.01, 20, num_rows), 2)
+        return [{
+            'contractSymbol': '{0}{1}{2}{3:08d}'.format(
+                symbol, expiry, option_type, int(strike * 1000)),
+            'strike': strike, 'lastPrice': price,
+            'bid': round(price - 0.05, 2), 'ask': round(price + 0.05, 2),
+            'change': 0.1, 'percentChange': 1.5,
+            'volume': int(rng.randint(0, 5000)),
+            'openInterest': int(rng.randint(0, 50000)),
+            'impliedVolatility': float(rng.uniform(0.1, 0.9))
+        } for strike, price in zip(strikes, last)]
+
+    return {'optionChain': {'result': [{
+        'expirationDates': list(dates),
+        'quote': {'regularMarketPrice': 139.5,
+                  'regularMarketTime': 1488467700},
+        'options': [{'calls': rows('C'), 'puts': rows('P')}]
+    }]}}
+
+
+def synthetic_fixtures(store, num_symbols=20, num_dates=8, num_rows=30):
+    """Fill a FixtureStore with the JSON option pages of SYM0, SYM1..."""
+
+    dates = [FIRST_EXPIRY + 7 * 86400 * i for i in range(num_dates)]
+    symbols = ['SYM{}'.format(i) for i in range(num_symbols)]
+    for i, symbol in enumerate(symbols):
+        for date in [None] + dates:
+            chain = synthetic_option_chain(symbol, dates, date, num_rows,
+                                           seed=i)
+            store.put(request_path(option_url('', 'json', symbol, date)),
+                      200, json.dumps(chain), 'application/json',
+                      save=False)
+    store.save()
+
+    return symbols
+
+
+def synthetic_typed_chains(num_contracts=50000, seed=0):
+    """Typed option data priced by Black-Scholes from random volatilities
+
+    Expiries are weekly up to a year out from a download on Mar 2, 2017.
+    Returns the data and the volatilities its mid prices came from.
+    """
+
+    rng = np.random.RandomState(seed)
+    download = pd.Timestamp('2017-03-02 10:15')
+    expiry = (pd.Timestamp('2017-03-03')
+              + pd.to_timedelta(7 * rng.randint(0, 52, num_contracts), 'D'))
+    expiry = expiry.values.astype('datetime64[ns]').view(np.int64)
+    spot = np.float32(139.5)
+    strike = np.round(spot * rng.uniform(0.5, 1.5, num_contracts) * 2) / 2
+    is_call = rng.rand(num_contracts) < 0.5
+    vol = rng.uniform(0.1, 0.9, num_contracts)
+    years = (expiry + 16 * 3600 * 10**9
+             - download.value) / 1e9 / (365 * 86400)
+    mid = black_scholes(is_call, float(spot), strike, years, vol)
+
+    df = pd.DataFrame({
+        'Option Type': pd.Categorical(np.where(is_call, 'Call', 'Put'),
+                                      categories=['Call', 'Put']),
+        'Strike': strike.astype(np.float32),
+        'Expiration Date': expiry,
+        'Last Price': mid.astype(np.float32),
+        'Bid': (mid - 0.005).astype(np.float32),
+        'Ask': (mid + 0.005).astype(np.float32),
+        'Price @ DL Time': spot,
+        'Download DateTime': download.value
+    })
+
+    return df, vol
+
+
+def synthetic_volume_by_time(num_symbols=100, interval=60, seed=0):
+    """A trading day of volume by time as made by analytics
+
+    Every symbol is pulled about every interval seconds from 09:45 to 16:15,
+    and about a third of the pulls see positive volume.
+    """
+
+    rng = np.random.RandomState(seed)
+    start = pd.Timestamp('2017-03-02 09:45').value // 10**9
+    end = pd.Timestamp('2017-03-02 16:15').value // 10**9
+    num_pulls = int(6.5 * 3600 / interval)
+
+    frames = []
+    for i in range(num_symbols):
+        seconds = start + np.cumsum(rng.uniform(0.5, 1.5, num_pulls)
+                                    * interval)
+        seconds = seconds[seconds <= end]
+        volume = (rng.randint(0, 500, len(seconds))
+                  * (rng.rand(len(seconds)) < 0.3))
+        times = pd.to_datetime(seconds, unit='s')
+        frames.append(pd.DataFrame({
+            'Symbol': 'SYM{}'.format(i),
+            'Download Date': times.strftime('%Y-%m-%d'),
+            'Download Time': times.strftime('%H:%M:%S.%f'),
+            'Volume': volume
+        }))
+
+    return pd.concat(frames, ignore_index=True)
+
+
+def measure(func, trace_memory=True):
+    """Run func and return (seconds, peak traced memory in MB, result)
+
+    Time and memory come from two separate runs since tracing allocations
+    slows pandas down several-fold.
+    """
+
+    timer = Timer()
+    result = func()
+    seconds = timer.stop()
+
+    peak = np.nan
+    if trace_memory:
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+
+    return seconds, peak, result
+
+
+def report(name, seconds, peak, extra=''):
+    print('  {0:<24}{1:>10.3f} s{2:>10.1f} MB  {3}'.format(
+            name, seconds, peak, extra))
+
+
+def bench_buffer(num_tables=500, num_rows=30):
+    """Repeated DataFrame append versus OptionBuffer
+
+    The append is quadratic in num_tables and runs twice, for time and for
+    memory, so a few thousand tables take minutes.
+    """
+
+    print('Accumulating {0} tables of {1} rows'.format(num_tables, num_rows))
+    tables = [synthetic_option_table(num_rows=num_rows, seed=i)
+              for i in range(num_tables)]
+
+    def legacy():
+        data = pd.DataFrame()
+        for i, table in enumerate(tables):
+            df = table.copy()
+            for column, value in synthetic_constants(i).items():
+                df[column] = value
+            data = pd.concat([data, df], ignore_index=True)
+        return data
+
+    def buffered():
+        buffer = OptionBuffer()
+        for i, table in enumerate(tables):
+            buffer.append(table, synthetic_constants(i))
+        return buffer.to_frame()
+
+    results = []
+    for name, func in [('DataFrame append', legacy),
+                       ('OptionBuffer', buffered)]:
+        seconds, peak, df = measure(func)
+        report(name, seconds, peak, '{} rows'.format(df.shape[0]))
+        results.append(df)
+
+    assert results[0].shape == results[1].shape
+
+
+def bench_parser(num_pages=200, fixture_dir=None):
+    """pd.read_html on the full page versus option_parser
+
+    Parameters:
+    -----------
+    num_pages : int, positive, default 200
+        Number of synthetic pages, ignored if fixture_dir is given.
+
+    fixture_dir : str, default None
+        Folder of saved options pages (*.html) to parse instead.
+    """
+
+    if fixture_dir is not None:
+        pages = []
+        for path in sorted(glob.glob(os.path.join(fixture_dir, '*.html'))):
+            with open(path, encoding='utf-8') as f:
+                pages.append(f.read())
+    else:
+        pages = [synthetic_option_page(seed=i) for i in range(num_pages)]
+
+    print('Parsing {} option pages'.format(len(pages)))
+
+    def legacy():
+        return [[df for df in pd.read_html(io.StringIO(page))
+                 if df.shape[1] == 10] for page in pages]
+
+    def targeted():
+        return [parse_option_tables(page) for page in pages]
+
+    results = []
+    for name, func in [('pd.read_html', legacy),
+                       ('parse_option_tables', targeted)]:
+        seconds, peak, tables = measure(func)
+        report(name, seconds, peak, '{:.2f} ms/page'.format(
+                1000 * seconds / max(len(pages), 1)))
+        results.append(tables)
+
+    assert ([len(x) for x in results[0]] == [len(x) for x in results[1]])
+
+
+def bench_schema(num_tables=2000, num_rows=30):
+    """Memory per row of the scraped data as text versus typed schema"""
+
+    print('Buffering {0} tables of {1} rows'.format(num_tables, num_rows))
+    tables = [synthetic_option_table(num_rows=num_rows, seed=i)
+              for i in range(num_tables)]
+
+    raw = OptionBuffer()
+    typed = OptionBuffer(categorical=True, columns=list(SCHEMA))
+    for i, table in enumerate(tables):
+        constants = synthetic_constants(i)
+        raw.append(table.astype(str), constants)
+        typed.append(normalize_table(table), normalize_constants(constants))
+
+    for name, buffer in [('Text', raw), ('Typed schema', typed)]:
+        df = buffer.to_frame()
+        size = df.memory_usage(index=False, deep=True).sum()
+        print('  {0:<24}{1:>10.1f} B/row{2:>10.1f} MB'.format(
+                name, size / df.shape[0], size / 2**20))
+
+
+def bench_analytics(num_symbols=100, interval=60):
+    """post_analysis.py loops versus vectorized analytics on one day
+
+    The loops are the 15-minute bucket loop and the row by row tagging of
+    positive volume of the original post_analysis.py.
+    """
+
+    vol_by_time = synthetic_volume_by_time(num_symbols, interval)
+    print('Analyzing {} pulls'.format(len(vol_by_time)))
+
+    def legacy_buckets():
+        df = vol_by_time.copy()
+        df['Time'] = df['Download Time'].apply(
+            lambda x: datetime.strptime(x, '%H:%M:%S.%f').time())
+        frames = []
+        lower_bound = datetime.combine(datetime.today(), time(9, 45))
+        while lower_bound.time() <= time(16, 1):
+            upper_bound = lower_bound + timedelta(0, 900)
+            crit = ((df['Time'] > lower_bound.time())
+                    & (df['Time'] <= upper_bound.time()))
+            volume = df.loc[crit].groupby('Symbol')['Volume'].sum()
+            frames.append(volume.rename(str(lower_bound.time())))
+            lower_bound += timedelta(0, 900)
+        return pd.concat(frames, axis=1)
+
+    def legacy_tags():
+        df = vol_by_time.copy()
+        df['tag'] = np.nan
+        for i in range(df.shape[0]):
+            if not i or df['Symbol'][i - 1] != df['Symbol'][i]:
+                tag = 0
+            if df['Volume'][i]:
+                tag += 1
+            df.loc[i, 'tag'] = tag
+        return df['tag']
+
+    for name, func in [
+            ('Bucket loop', legacy_buckets),
+            ('volume_by_bucket', lambda: analytics.volume_by_bucket(
+                vol_by_time)),
+            ('Tagging loop', legacy_tags),
+            ('tag_positive_volume', lambda: analytics.tag_positive_volume(
+                vol_by_time)),
+            ('Positive intervals',
+             lambda: analytics.positive_volume_intervals(vol_by_time)),
+            ('eod_volume + pull_counts',
+             lambda: (analytics.eod_volume(vol_by_time),
+                      analytics.pull_counts(vol_by_time)))]:
+        seconds, peak, _ = measure(func)
+        report(name, seconds, peak)
+
+    assert (legacy_tags().values == analytics.tag_positive_volume(
+        vol_by_time).values).all()
+    assert np.allclose(legacy_buckets().sum(axis=1).sort_index(),
+                       analytics.volume_by_bucket(vol_by_time).sum(
+                           axis=1).sort_index())
+
+
+def bench_greeks(num_contracts=50000, num_loop=2000):
+    """Per row Black-Scholes loop versus chain_analytics()
+
+    The loop solves each contract with math.erf and bisection, the way one
+    would in plain Python, on the first num_loop contracts only.
+    """
+
+    df, vol = synthetic_typed_chains(num_contracts)
+    print('Pricing {} contracts'.format(num_contracts))
+
+    def cdf(x):
+        return 0.5 * math.erfc(-x / math.sqrt(2))
+
+    def price(is_call, spot, strike, years, sigma):
+        d1 = ((math.log(spot / strike) + 0.5 * sigma ** 2 * years)
+              / (sigma * math.sqrt(years)))
+        d2 = d1 - sigma * math.sqrt(years)
+        if is_call:
+            return spot * cdf(d1) - strike * cdf(d2)
+        return strike * cdf(-d2) - spot * cdf(-d1)
+
+    def row_loop():
+        rows = []
+        for _, row in df.iloc[:num_loop].iterrows():
+            years = (row['Expiration Date'] + 16 * 3600 * 10**9
+                     - row['Download DateTime']) / 1e9 / (365 * 86400)
+            target = 0.5 * (row['Bid'] + row['Ask'])
+            is_call = row['Option Type'] == 'Call'
+            lo, hi = 1e-4, 5.0
+            while hi - lo > 1e-6:
+                sigma = 0.5 * (lo + hi)
+                if price(is_call, row['Price @ DL Time'], row['Strike'],
+                         years, sigma) > target:
+                    hi = sigma
+                else:
+                    lo = sigma
+            rows.append(sigma)
+        return rows
+
+    seconds, peak, loop_vol = measure(row_loop)
+    report('Row loop', seconds, peak, '{:.0f} contracts/s'.format(
+            num_loop / seconds))
+
+    seconds, peak, analytics = measure(lambda: chain_analytics(df))
+    report('chain_analytics', seconds, peak, '{:.0f} contracts/s'.format(
+            num_contracts / seconds))
+
+    # Prices barely move with the volatility of the others
+    model_vol = analytics['Model IV'].values / 100
+    sensitive = analytics['Vega'].values >= 0.01
+    print('  Solved {0:.1%} of contracts. Where vega >= 0.01, max error '
+          '{1:.1e} and {2:.1e} from the loop'.format(
+                np.isfinite(model_vol).mean(),
+                np.abs(model_vol - vol)[sensitive].max(),
+                np.abs(model_vol[:num_loop] - loop_vol)[
+                    sensitive[:num_loop]].max()))
+
+
+def bench_surface(num_symbols=20, num_contracts=2000, num_rounds=20):
+    """Incremental surfaces versus refitting from the day so far
+
+    Each round is a pull of every symbol a minute after the last one. The
+    refit builds every surface again from all the pulls of the day, which
+    is what an offline rebuild after each round would cost.
+    """
+
+    print('{0} rounds of {1} symbols x {2} contracts'.format(
+            num_rounds, num_symbols, num_contracts))
+
+    chains, _ = synthetic_typed_chains(num_symbols * num_contracts)
+    chains['Symbol'] = pd.Categorical(
+        ['SYM{}'.format(i % num_symbols) for i in range(len(chains))])
+    rounds = []
+    for i in range(num_rounds):
+        df = chains.copy()
+        df['Download DateTime'] += i * 60 * 10**9
+        rounds.append(df)
+
+    def incremental():
+        surfaces = SurfaceBuilder()
+        for df in rounds:
+            surfaces.observe_frame(df)
+            surfaces.snapshot()
+        return surfaces
+
+    def refit():
+        for i in range(len(rounds)):
+            surfaces = SurfaceBuilder()
+            surfaces.observe_frame(pd.concat(rounds[:i + 1],
+                                             ignore_index=True))
+            surfaces.snapshot()
+        return surfaces
+
+    for name, func in [('Refit per round', refit),
+                       ('SurfaceBuilder', incremental)]:
+        seconds, peak, surfaces = measure(func, trace_memory=False)
+        report(name, seconds, peak, '{:.1f} ms per round'.format(
+                1000 * seconds / num_rounds))
+
+    times, grids = surfaces.store.history('SYM0')
+    print('  {0} snapshots of SYM0, {1:.0f} bytes each'.format(
+            len(times), grids[0].nbytes + times[0].nbytes))
+
+
+def bench_rollups(num_days=5, num_symbols=20, num_contracts=50,
+                  num_pulls=100):
+    """Queries of the raw data table versus rollups as history grows
+
+    Every pull of every symbol is written as it would be by the live loop,
+    with and without rollups, then the 15 minute heat map of the last day
+    and the EOD volume of all days are read both ways.
+    """
+
+    print('{0} days of {1} symbols x {2} contracts x {3} pulls'.format(
+            num_days, num_symbols, num_contracts, num_pulls))
+
+    rng = np.random.RandomState(0)
+    contracts = np.array(['SYM{0}170317C{1:08d}'.format(i, j * 1000)
+                          for i in range(num_symbols)
+                          for j in range(num_contracts)])
+    pulls = []
+    for day in pd.date_range('2017-03-01', periods=num_days):
+        for t in pd.date_range(day + pd.Timedelta('09:46:00'),
+                               periods=num_pulls, freq='229s'):
+            pulls.append(pd.DataFrame({
+                'Symbol': np.repeat(['SYM{}'.format(i) for i
+                                     in range(num_symbols)], num_contracts),
+                'Contract Name': contracts,
+                'Last Price': rng.uniform(0, 20, len(contracts)),
+                'Volume': rng.randint(0, 20, len(contracts)),
+                'Open Interest': rng.randint(0, 5000, len(contracts)),
+                'Download DateTime': t.value,
+                'Download Date': str(t.date()),
+                'Download Time': t.strftime('%H:%M:%S.%f')
+            }))
+
+    with tempfile.TemporaryDirectory() as folder:
+        for name, ingest in [('Write data', False),
+                             ('Write data + rollups', True)]:
+            # The second run ends up in the database queried below
+            store = SQLiteStore.open(os.path.join(folder, name + '.db'))
+            store.add_index('data', DATA_INDEX)
+            rollups = Rollups(store, 'data')
+
+            def write():
+                for df in pulls:
+                    store.write('data', df)
+                    if ingest:
+                        rollups.ingest(df)
+                    store.flush()
+
+            seconds, peak, _ = measure(write, trace_memory=False)
+            report(name, seconds, peak, '{:.0f} rows/s'.format(
+                    len(pulls) * len(contracts) / seconds))
+            if not ingest:
+                store.close()
+
+        config = ConfigParser()
+        config['CURRENT'] = {'DatabasePath': store.path,
+                             'DataTableName': 'data'}
+
+        last_day = pulls[-1]['Download Date'][0]
+        first_day = pulls[0]['Download Date'][0]
+        for name, func in [
+                ('Raw 15m heat map', lambda: analytics.volume_by_bucket(
+                    analytics.load_volume_by_time(config, last_day))),
+                ('Rollup 15m heat map', lambda: rollups.volume_by_bucket(
+                    last_day)),
+                ('Raw EOD volume', lambda: analytics.eod_volume(
+                    analytics.load_volume_by_time(config, first_day,
+                                                  last_day))),
+                ('Rollup EOD volume', lambda: rollups.eod_volume(
+                    first_day, last_day))]:
+            seconds, peak, _ = measure(func, trace_memory=False)
+            report(name, seconds, peak)
+        store.close()
+
+
+def bench_ticks(num_days=10, num_symbols=10, num_contracts=100,
+                num_pulls=50):
+    """One contract's and one expiry's history from SQLite versus TickStore
+
+    Both stores get every pull of every day as the live loop writes them,
+    the data table with its usual index. Then the history of one contract
+    and of one expiry over all days is read from each.
+    """
+
+    print('{0} days of {1} symbols x {2} contracts x {3} pulls'.format(
+            num_days, num_symbols, num_contracts, num_pulls))
+
+    rng = np.random.RandomState(0)
+    symbols = np.repeat(['SYM{}'.format(i) for i in range(num_symbols)],
+                        num_contracts)
+    contracts = np.array(['SYM{0}1703{1:02d}C{2:08d}'.format(
+        i, 10 + 7 * (j % 2), j * 1000) for i in range(num_symbols)
+        for j in range(num_contracts)])
+    pulls = []
+    for day in pd.date_range('2017-03-01', periods=num_days):
+        for t in pd.date_range(day + pd.Timedelta('09:46:00'),
+                               periods=num_pulls, freq='7min'):
+            pulls.append(pd.DataFrame({
+                'Symbol': symbols,
+                'Contract Name': contracts,
+                'Last Price': rng.uniform(0, 20, len(contracts)),
+                'Bid': rng.uniform(0, 20, len(contracts)),
+                'Ask': rng.uniform(0, 20, len(contracts)),
+                'Volume': rng.randint(0, 20, len(contracts)),
+                'Open Interest': rng.randint(0, 5000, len(contracts)),
+                'Download DateTime': t.value,
+                'Download Date': str(t.date()),
+                'Download Time': t.strftime('%H:%M:%S.%f')
+            }))
+    num_rows = len(pulls) * len(contracts)
+
+    with tempfile.TemporaryDirectory() as folder:
+        store = SQLiteStore.open(os.path.join(folder, 'data.db'))
+        store.add_index('data', DATA_INDEX)
+        ticks = TickStore(os.path.join(folder, 'ticks'))
+
+        def write_sqlite():
+            for df in pulls:
+                store.write('data', df)
+                store.flush()
+
+        def write_ticks():
+            for df in pulls:
+                ticks.append(df)
+            ticks.seal()
+
+        for name, func in [('Write SQLite', write_sqlite),
+                           ('Write TickStore', write_ticks)]:
+            seconds, peak, _ = measure(func, trace_memory=False)
+            report(name, seconds, peak, '{:.0f} rows/s'.format(
+                    num_rows / seconds))
+
+        contract = contracts[len(contracts) // 2]
+        symbol = symbols[len(contracts) // 2]
+        contract_sql = ('SELECT * FROM data WHERE "Contract Name" = ? '
+                        'ORDER BY "Download DateTime"')
+        expiry_sql = ('SELECT * FROM data WHERE Symbol = ? AND '
+                      '"Contract Name" LIKE ?')
+        for name, func in [
+                ('SQLite contract', lambda: store.read(
+                    contract_sql, [contract])),
+                ('TickStore contract', lambda: ticks.history(contract)),
+                ('SQLite expiry', lambda: store.read(
+                    expiry_sql, [symbol, symbol + '170317%'])),
+                ('TickStore expiry', lambda: ticks.expiry_history(
+                    symbol, '2017-03-17'))]:
+            seconds, peak, df = measure(func, trace_memory=False)
+            report(name, seconds, peak, '{} rows'.format(len(df)))
+        store.close()
+
+
+def bench_profiles(num_loads=10, url=None, names=None):
+    """Page load timings of each browser profile
+
+    Needs Chrome and chromedriver. Profiles that fail to launch are skipped.
+
+    Parameters:
+    -----------
+    num_loads : int, positive, default 10
+        Page loads per profile, after one warm-up load.
+
+    url : str, default None
+        Page to load. Defaults to the options page of AAPL.
+
+    names : list of str, default None
+        Presets in browser_profiles.PROFILES. None means all of them.
+    """
+
+    if url is None:
+        url = 'http://finance.yahoo.com/quote/AAPL/options?p=AAPL'
+
+    print('Loading {0} {1} times per profile'.format(url, num_loads))
+    for name in names or list(PROFILES):
+        profile = BrowserProfile.from_name(name)
+        timer = Timer()
+        try:
+            browser = profile.launch()
+        except Exception as inst:
+            print('  {0:<24}skipped: {1}'.format(name, repr(inst)[:60]))
+            continue
+        launch = timer.stop()
+
+        try:
+            browser.get(url) # Warm up the disk cache
+            seconds = []
+            for _ in range(num_loads):
+                timer = Timer()
+                browser.get(url)
+                seconds.append(timer.stop())
+        finally:
+            browser.quit()
+
+        print('  {0:<24}{1:>8.2f} s launch{2:>8.2f} s median{3:>8.2f} s '
+              'p90'.format(name, launch, np.median(seconds),
+                           np.percentile(seconds, 90)))
+
+
+def bench_sqlite(num_writers=4, num_cycles=30, num_tables=30, num_rows=30):
+    """to_sql on a fresh connection per cycle versus SQLiteStore
+
+    Writer threads stand in for the batch processes of live_nasdaq100.py,
+    each with connections of its own, while a reader keeps running the
+    volume totals query of seed_volume_tracker(). Cycles are spread over ten
+    download dates so the query has a date to filter on.
+    """
+
+    print('{0} writers of {1} cycles of {2} tables of {3} rows, one '
+          'reader'.format(num_writers, num_cycles, num_tables, num_rows))
+    cycles = []
+    for i in range(num_cycles):
+        buffer = OptionBuffer(categorical=True, columns=list(SCHEMA))
+        for j in range(num_tables):
+            buffer.append(normalize_table(synthetic_option_table(
+                num_rows=num_rows, seed=j)), normalize_constants(
+                synthetic_constants(i * num_tables + j)))
+        df = buffer.to_frame()
+        df['Download Date'] = '2017-03-{:02d}'.format(i % 10 + 1)
+        cycles.append(df)
+
+    sql = ('SELECT "Contract Name", sum(Volume) as Volume_sum FROM data '
+           'WHERE "Download Date" = ? GROUP BY "Contract Name"')
+
+    def legacy_write(path):
+        for df in cycles:
+            conn = sqlite3.connect(path)
+            df.to_sql('data', conn, if_exists='append', index=False)
+            conn.close()
+
+    def legacy_read(path):
+        conn = sqlite3.connect(path)
+        pd.read_sql_query(sql, conn, params=['2017-03-01'])
+        conn.close()
+
+    def store_write(path):
+        store = SQLiteStore(path) # One per process
+        for df in cycles:
+            store.write('data', df)
+            store.flush() # Each cycle waits for its commit, as live does
+        store.close()
+
+    def store_read(path):
+        SQLiteStore.open(path).read(sql, ['2017-03-01'])
+
+    def run(path, write, read):
+        errors, reads = [], [0]
+
+        def writer():
+            try:
+                write(path)
+            except Exception as inst:
+                errors.append(inst)
+
+        threads = [threading.Thread(target=writer)
+                   for _ in range(num_writers)]
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            try:
+                read(path)
+                reads[0] += 1
+            except Exception as inst:
+                errors.append(inst)
+        for thread in threads:
+            thread.join()
+        return errors, reads[0]
+
+    with tempfile.TemporaryDirectory() as folder:
+        for name, write, read in [
+                ('to_sql per cycle', legacy_write, legacy_read),
+                ('SQLiteStore', store_write, store_read)]:
+            path = os.path.join(folder, name.replace(' ', '_') + '.db')
+            conn = sqlite3.connect(path)
+            cycles[0].iloc[:0].to_sql('data', conn, index=False)
+            conn.close()
+            if write is store_write:
+                SQLiteStore.open(path).add_index('data', DATA_INDEX)
+
+            seconds, peak, (errors, reads) = measure(
+                lambda: run(path, write, read), trace_memory=False)
+            SQLiteStore.open(path).close()
+            conn = sqlite3.connect(path)
+            num_rows = conn.execute('SELECT count(*) FROM data').fetchone()[0]
+            conn.close()
+            report(name, seconds, peak, '{0:.0f} rows/s, {1} reads, {2} '
+                   'errors'.format(num_rows / seconds, reads, len(errors)))
+
+
+def bench_replay(num_symbols=20, num_dates=8, num_rows=30, latency=0.01,
+                 error_rate=0.02, num_cycles=5):
+    """End to end scraping and saving against a local replay server
+
+    Synthetic fixtures are served by replay.ReplayServer with latency,
+    jitter and injected 503s. scrape_all() runs through the HTTP backend
+    and the asyncio engine, then the data goes through the delta and
+    persist step of live_nasdaq100.py for num_cycles cycles. Record real
+    pages with replay.py to measure on those instead.
+    """
+
+    print('Replaying {0} symbols x {1} dates x {2} rows, {3:.0f} ms '
+          'latency, {4:.0%} errors'.format(
+                num_symbols, num_dates, 2 * num_rows, 1000 * latency,
+                error_rate))
+
+    with tempfile.TemporaryDirectory() as folder:
+        store = FixtureStore(os.path.join(folder, 'fixtures'))
+        symbols = synthetic_fixtures(store, num_symbols, num_dates, num_rows)
+
+        with ReplayServer(store, latency=latency, jitter=latency,
+                          error_rate=error_rate, seed=0) as server:
+            scrapers = [
+                ('HttpBackend', lambda: YahooScraper(
+                    symbols, backend=HttpBackend(base_url=server.url,
+                                                 max_tries=5))),
+                ('AsyncYahooScraper', lambda: AsyncYahooScraper(
+                    symbols, max_tries=5, rate=1000, base_url=server.url))
+            ]
+            for name, make in scrapers:
+                def scrape():
+                    ys = make()
+                    ys.scrape_all()
+                    return ys
+
+                seconds, peak, ys = measure(scrape)
+                report(name, seconds, peak, '{0:.0f} pages/s, {1:.0f} '
+                       'rows/s'.format(len(ys.timer['Page Load']) / seconds,
+                                       len(ys.data) / seconds))
+            data = ys.data
+
+        config = ConfigParser()
+        config['CURRENT'] = {
+            'DatabasePath': os.path.join(folder, 'replay.db'),
+            'DataTableName': 'data'
+        }
+        tracker = VolumeTracker(os.path.join(folder, 'volume_totals.npz'))
+        rng = np.random.RandomState(0)
+
+        def persist():
+            df = data.copy()
+            for _ in range(num_cycles):
+                df['Volume'] = df['Volume'] + rng.randint(0, 10, len(df))
+                save_increments(df.copy(), tracker, config)
+
+        seconds, peak, _ = measure(persist)
+        SQLiteStore.open(config['CURRENT']['DatabasePath']).close()
+        report('save_increments', seconds, peak, '{:.0f} rows/s'.format(
+                num_cycles * len(data) / seconds))
+
+
+def bench_changes(num_symbols=20, num_dates=8, num_rows=30, num_cycles=10,
+                  change_rate=0.1):
+    """Rounds of mostly unchanged data with and without a ChangeDetector
+
+    Every page is scraped twice from a replay server, the second time
+    unchanged. Then num_cycles rounds, where change_rate of the contracts
+    traded, go through save_increments().
+    """
+
+    print('{0} symbols x {1} dates x {2} rows, {3:.0%} of contracts '
+          'changing per round'.format(num_symbols, num_dates, 2 * num_rows,
+                                      change_rate))
+
+    with tempfile.TemporaryDirectory() as folder:
+        store = FixtureStore(os.path.join(folder, 'fixtures'))
+        symbols = synthetic_fixtures(store, num_symbols, num_dates, num_rows)
+
+        with ReplayServer(store) as server:
+            for name, detect in [('scrape twice', False),
+                                 ('scrape twice, detector', True)]:
+                def scrape():
+                    detector = ChangeDetector() if detect else None
+                    for _ in range(2):
+                        ys = YahooScraper(
+                            symbols, change_detector=detector,
+                            backend=HttpBackend(base_url=server.url))
+                        ys.scrape_all()
+                        if detector is not None:
+                            detector.commit_pages() # As if saved
+                    return ys
+
+                seconds, peak, ys = measure(scrape)
+                report(name, seconds, peak,
+                       '{} rows in the second round'.format(len(ys.data)))
+            data = YahooScraper(symbols,
+                                backend=HttpBackend(base_url=server.url))
+            data.scrape_all()
+            data = data.data
+
+        for name, detector in [('save', None),
+                               ('save, detector', ChangeDetector())]:
+            config = ConfigParser()
+            config['CURRENT'] = {
+                'DatabasePath': os.path.join(folder, name + '.db'),
+                'DataTableName': 'data'
+            }
+            tracker = VolumeTracker(os.path.join(folder, name + '.npz'))
+            rng = np.random.RandomState(0)
+
+            def persist():
+                df = data.copy()
+                for _ in range(num_cycles):
+                    traded = rng.random_sample(len(df)) < change_rate
+                    df['Volume'] = df['Volume'] + traded * rng.randint(
+                        1, 10, len(df))
+                    save_increments(df.copy(), tracker, config,
+                                    detector=detector)
+
+            seconds, peak, _ = measure(persist, trace_memory=False)
+            sqlite_store = SQLiteStore.open(config['CURRENT']['DatabasePath'])
+            num_written = sqlite_store.read(
+                'SELECT count(*) AS n FROM data')['n'][0]
+            sqlite_store.close()
+            report(name, seconds, peak, '{0} of {1} rows written'.format(
+                    num_written, num_cycles * len(data)))
+
+
+BENCHMARKS = {
+    'buffer': bench_buffer,
+    'parser': bench_parser,
+    'schema': bench_schema,
+    'analytics': bench_analytics,
+    'profiles': bench_profiles,
+    'sqlite': bench_sqlite,
+    'replay': bench_replay,
+    'changes': bench_changes,
+    'greeks': bench_greeks,
+    'surface': bench_surface,
+    'rollups': bench_rollups,
+    'ticks': bench_ticks
+}
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
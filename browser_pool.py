@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""
+A pool of warm Chrome WebDriver sessions leased out to YahooScraper instances,
+so that scrape rounds stop paying for a browser cold start every time.
+"""
+
+import os
+import queue
+import signal
+import threading
+import time
+from contextlib import contextmanager
+
+from browser_profiles import BrowserProfile
+
+
+def process_tree(pid):
+    """pid and all its descendants, from /proc. Only pid if there is none"""
+
+    children = {}
+    entries = os.listdir('/proc') if os.path.isdir('/proc') else []
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open('/proc/{}/stat'.format(entry)) as f:
+                stat = f.read()
+        except OSError:
+            continue # Gone in between
+        ppid = int(stat.rsplit(')', 1)[1].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+
+    tree = [pid]
+    for parent in tree:
+        tree.extend(children.get(parent, []))
+
+    return tree
+
+
+class BrowserPool:
+    """Pool of Warm WebDriver Sessions
+
+    Sessions are launched lazily up to size, health-checked on every lease
+    and recycled once they have loaded max_page_loads pages or their JS heap
+    has grown by more than max_memory_growth bytes. A pool lives as long as
+    its process, so one pool serves every symbol and every scrape round of
+    that process.
+
+    Parameters:
+    -----------
+    size : int, positive, default 1
+        Max number of sessions alive at once.
+
+    profile : BrowserProfile, default None
+        Profile used to launch each session, see browser_profiles.py.
+        Defaults to a plain Chrome profile.
+
+    ext_path : str, a file path, default None
+        Extension path to a .crx file for Chrome. Ignored if profile is given.
+
+    max_page_loads : int, positive, default 500
+        Page loads after which a session is recycled.
+
+    max_memory_growth : int, positive, default 300 * 2**20
+        Growth of the JS heap in bytes after which a session is recycled.
+
+    Attributes:
+    -----------
+    stats : dict
+        Counters of 'Launched', 'Recycled' and 'Unhealthy' sessions.
+    """
+
+    def __init__(self, size=1, profile=None, ext_path=None,
+                 max_page_loads=500, max_memory_growth=300 * 2**20):
+        self.size = size
+        self.max_page_loads = max_page_loads
+        self.max_memory_growth = max_memory_growth
+
+        if profile is None:
+            profile = BrowserProfile(ext_path=ext_path)
+        self.profile = profile
+
+        self.stats = {'Launched': 0, 'Recycled': 0, 'Unhealthy': 0}
+
+        self._idle = queue.LifoQueue() # Warmest session first
+        self._lock = threading.Lock()
+        self._num_alive = 0
+        self._page_loads = {} # id(browser) -> page loads
+        self._base_memory = {} # id(browser) -> JS heap size at launch
+        self._slots = {} # id(browser) -> slot of the profile, see launch()
+        self._sessions = {} # id(browser) -> browser, leased ones included
+        self._free_slots = set(range(size))
+
+    @staticmethod
+    def _memory(browser):
+        """JS heap size in bytes of a session, 0 if unavailable"""
+
+        try:
+            return int(browser.execute_script(
+                'return window.performance.memory ? '
+                'window.performance.memory.usedJSHeapSize : 0') or 0)
+        except Exception:
+            return 0
+
+    @staticmethod
+    def is_healthy(browser):
+        """Check if a session still responds"""
+
+        try:
+            return browser.execute_script('return 1') == 1
+        except Exception:
+            return False
+
+    def _launch(self):
+        """Start a new session. The caller holds a slot in self._num_alive"""
+
+        with self._lock:
+            slot = min(self._free_slots)
+            self._free_slots.discard(slot)
+
+        try:
+            browser = self.profile.launch(slot)
+        except Exception:
+            with self._lock:
+                self._num_alive -= 1
+                self._free_slots.add(slot)
+            raise
+
+        with self._lock:
+            self.stats['Launched'] += 1
+            self._slots[id(browser)] = slot
+            self._sessions[id(browser)] = browser
+            self._page_loads[id(browser)] = 0
+            self._base_memory[id(browser)] = self._memory(browser)
+
+        return browser
+
+    def _quit(self, browser):
+        """Quit a session and free its slot"""
+
+        try:
+            browser.quit()
+        except Exception:
+            pass # Already dead
+
+        with self._lock:
+            self._num_alive -= 1
+            self._page_loads.pop(id(browser), None)
+            self._base_memory.pop(id(browser), None)
+            self._sessions.pop(id(browser), None)
+            if id(browser) in self._slots:
+                self._free_slots.add(self._slots.pop(id(browser)))
+
+    def _is_exhausted(self, browser):
+        """Check if a session should be recycled"""
+
+        if self._page_loads.get(id(browser), 0) >= self.max_page_loads:
+            return True
+
+        growth = self._memory(browser) - self._base_memory.get(id(browser), 0)
+        return growth > self.max_memory_growth
+
+    def acquire(self, timeout=None):
+        """Lease a healthy session
+
+        Parameters:
+        -----------
+        timeout : float, default None
+            Seconds to wait for a session when all are leased. None means
+            wait forever. queue.Empty is raised on timeout.
+        """
+
+        with self._lock:
+            can_launch = self._idle.empty() and self._num_alive < self.size
+            if can_launch:
+                self._num_alive += 1
+
+        if can_launch:
+            return self._launch()
+
+        browser = self._idle.get(timeout=timeout)
+        if not self.is_healthy(browser):
+            self.stats['Unhealthy'] += 1
+            return self.replace(browser)
+
+        return browser
+
+    def release(self, browser):
+        """Return a leased session, recycling it if it is worn out"""
+
+        if browser is None:
+            return
+
+        if not self.is_healthy(browser) or self._is_exhausted(browser):
+            self.stats['Recycled'] += 1
+            self._quit(browser)
+        else:
+            self._idle.put(browser)
+
+    def replace(self, browser):
+        """Quit a broken leased session and lease a fresh one instead"""
+
+        self._quit(browser)
+        with self._lock:
+            self._num_alive += 1
+
+        return self._launch()
+
+    def record_page_load(self, browser):
+        """Count one page load of a session towards max_page_loads"""
+
+        with self._lock:
+            if id(browser) in self._page_loads:
+                self._page_loads[id(browser)] += 1
+
+    @contextmanager
+    def lease(self, timeout=None):
+        """Context manager version of acquire() and release()"""
+
+        browser = self.acquire(timeout)
+        try:
+            yield browser
+        finally:
+            self.release(browser)
+
+    def close(self):
+        """Quit all idle sessions. The pool relaunches sessions on demand"""
+
+        while True:
+            try:
+                browser = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._quit(browser)
+
+    def kill(self, timeout=10):
+        """Quit all sessions, leased ones included
+
+        Meant for a process giving up on a scrape that hangs. A session that
+        has not quit within timeout seconds has its driver process killed,
+        along with the browser processes under it.
+        """
+
+        with self._lock:
+            browsers = list(self._sessions.values())
+
+        threads = [threading.Thread(target=self._quit, args=(browser,),
+                                    daemon=True) for browser in browsers]
+        for thread in threads:
+            thread.start()
+
+        deadline = time.time() + timeout
+        for browser, thread in zip(browsers, threads):
+            thread.join(max(deadline - time.time(), 0))
+            if not thread.is_alive():
+                continue
+
+            process = getattr(getattr(browser, 'service', None), 'process',
+                              None)
+            if process is None:
+                continue
+            for pid in process_tree(process.pid):
+                try:
+                    os.kill(pid, getattr(signal, 'SIGKILL', signal.SIGTERM))
+                except OSError:
+                    pass # Already gone
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+Browser profiles for YahooScraper and BrowserPool. A profile knows how to
+launch a tuned Chrome or Firefox session: headless, with images, fonts, ads
+and trackers blocked, a disk cache kept across runs and capped memory. The
+presets in PROFILES can be picked and tweaked from config_nasdaq100.ini.
+"""
+
+import copy
+import os
+
+from selenium import webdriver
+
+# Ad, analytics and tracking hosts seen on Yahoo quote pages
+AD_HOSTS = ['doubleclick.net', 'googlesyndication.com', 'googletagmanager.com',
+            'googletagservices.com', 'google-analytics.com', 'adtech.com',
+            'advertising.com', 'scorecardresearch.com', 'moatads.com',
+            'adsafeprotected.com', 'amazon-adsystem.com', 'yieldmo.com',
+            'rubiconproject.com', 'pubmatic.com', 'openx.net',
+            'casalemedia.com', 'criteo.com', 'taboola.com', 'outbrain.com',
+            'bluekai.com', 'krxd.net', 'chartbeat.com', 'flurry.com',
+            'analytics.yahoo.com', 'ads.yahoo.com', 'yimg.com/rq/darla']
+
+IMAGE_PATTERNS = ['*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg',
+                  '*.ico']
+FONT_PATTERNS = ['*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot']
+
+# Presets by name. Keys are keyword arguments of BrowserProfile
+PROFILES = {
+    'default': {},
+    'headless': {'headless': True},
+    'lean': {'headless': True, 'block_images': True, 'block_fonts': True,
+             'block_ads': True, 'max_memory': 512}
+}
+
+# Option name in the ini -> (keyword argument, type)
+CONFIG_KEYS = {
+    'Browser': ('browser', str),
+    'Headless': ('headless', bool),
+    'BlockImages': ('block_images', bool),
+    'BlockFonts': ('block_fonts', bool),
+    'BlockAds': ('block_ads', bool),
+    'DiskCachePath': ('cache_dir', str),
+    'DiskCacheSize': ('cache_size', int),
+    'MaxMemory': ('max_memory', int),
+    'ExtensionPath': ('ext_path', str)
+}
+
+
+class BrowserProfile:
+    """Launcher of Tuned WebDriver Sessions
+
+    Chrome blocks requests by URL pattern through the DevTools protocol, so
+    images, fonts and the hosts in AD_HOSTS never leave the browser. Firefox
+    has no such hook in Selenium, so only images and downloadable fonts are
+    turned off there, by preference.
+
+    Parameters:
+    -----------
+    browser : str, 'chrome' or 'firefox', default 'chrome'
+
+    headless : boolean, default False
+
+    block_images : boolean, default False
+
+    block_fonts : boolean, default False
+
+    block_ads : boolean, default False
+        Block the ad and tracking hosts in AD_HOSTS. Chrome only.
+
+    cache_dir : str, a folder path, default None
+        Disk cache kept across runs. Each session launched at the same time
+        gets its own slot folder in it, since browsers do not share a cache
+        folder between running instances. None means the browser default.
+
+    cache_size : int, positive, default None
+        Disk cache size in MB.
+
+    max_memory : int, positive, default None
+        Cap of the JS heap of each page in MB. Chrome also gets a single
+        renderer process.
+
+    ext_path : str, a file path, default None
+        Extension path to a .crx file for Chrome, e.g. uBlock Origin.
+        Headless Chrome cannot load extensions, so it is ignored there.
+    """
+
+    def __init__(self, browser='chrome', headless=False, block_images=False,
+                 block_fonts=False, block_ads=False, cache_dir=None,
+                 cache_size=None, max_memory=None, ext_path=None):
+        if browser not in ('chrome', 'firefox'):
+            raise ValueError('browser must be either chrome or firefox')
+
+        self.browser = browser
+        self.headless = headless
+        self.block_images = block_images
+        self.block_fonts = block_fonts
+        self.block_ads = block_ads
+        self.cache_dir = cache_dir
+        self.cache_size = cache_size
+        self.max_memory = max_memory
+
+        self.ext_path = None
+        if ext_path:
+            if not os.path.isfile(str(ext_path)):
+                print('File specified by ext_path does not exit!')
+            elif headless:
+                print('Headless Chrome cannot load extensions, ignoring '
+                      + ext_path)
+            else:
+                self.ext_path = ext_path
+
+    @classmethod
+    def from_name(cls, name, **kwargs):
+        """Profile of a preset in PROFILES, with kwargs overriding it"""
+
+        if name not in PROFILES:
+            raise ValueError('Unknown browser profile: ' + name)
+
+        options = dict(PROFILES[name])
+        options.update(kwargs)
+        return cls(**options)
+
+    @classmethod
+    def from_config(cls, section):
+        """Profile from a section of config_nasdaq100.ini
+
+        'BrowserProfile' picks the preset in PROFILES ('default' if missing)
+        and any of the options in CONFIG_KEYS overrides it, e.g.
+
+            BrowserProfile = lean
+            DiskCachePath = C:\\Temp\\yahoo_cache
+            BlockFonts = no
+        """
+
+        kwargs = {}
+        for key, (name, kind) in CONFIG_KEYS.items():
+            if not section.get(key):
+                continue
+            if kind is bool:
+                kwargs[name] = section.getboolean(key)
+            else:
+                kwargs[name] = kind(section[key])
+
+        return cls.from_name(section.get('BrowserProfile', 'default'),
+                             **kwargs)
+
+    def for_process(self, name):
+        """Copy of this profile with its own folder in the disk cache
+
+        Processes running at the same time need one each, e.g. every batch
+        of live_nasdaq100.py or every worker of supervisor.py.
+        """
+
+        profile = copy.copy(self)
+        if self.cache_dir is not None:
+            profile.cache_dir = os.path.join(self.cache_dir, str(name))
+
+        return profile
+
+    def blocked_urls(self):
+        """URL patterns Chrome is told not to load"""
+
+        urls = []
+        if self.block_images:
+            urls += IMAGE_PATTERNS
+        if self.block_fonts:
+            urls += FONT_PATTERNS
+        if self.block_ads:
+            urls += ['*' + host + '*' for host in AD_HOSTS]
+
+        return urls
+
+    def _cache_slot(self, slot):
+        path = os.path.join(self.cache_dir, 'slot-{}'.format(slot))
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def chrome_options(self, slot=0):
+        """ChromeOptions of this profile"""
+
+        options = webdriver.ChromeOptions()
+        if self.headless:
+            options.add_argument('--headless')
+            options.add_argument('--disable-dev-shm-usage')
+            options.add_argument('--disable-gpu')
+        if self.block_images:
+            options.add_argument('--blink-settings=imagesEnabled=false')
+            options.add_experimental_option('prefs', {
+                'profile.managed_default_content_settings.images': 2})
+        if self.cache_dir is not None:
+            options.add_argument('--disk-cache-dir=' + self._cache_slot(slot))
+        if self.cache_size is not None:
+            options.add_argument('--disk-cache-size={}'.format(
+                    self.cache_size * 2**20))
+        if self.max_memory is not None:
+            options.add_argument('--js-flags=--max-old-space-size={}'.format(
+                    self.max_memory))
+            options.add_argument('--renderer-process-limit=1')
+        if self.ext_path is not None:
+            options.add_extension(self.ext_path)
+
+        return options
+
+    def firefox_options(self, slot=0):
+        """FirefoxOptions of this profile, preferences included
+
+        Preferences go on the options rather than on a FirefoxProfile, and
+        headless is an argument rather than the headless property, since
+        Selenium 4 dropped the firefox_profile argument and the property.
+        """
+
+        options = webdriver.FirefoxOptions()
+        if self.headless:
+            options.add_argument('-headless')
+        if self.block_images:
+            options.set_preference('permissions.default.image', 2)
+        if self.block_fonts:
+            options.set_preference('gfx.downloadable_fonts.enabled', False)
+        if self.cache_dir is not None:
+            options.set_preference('browser.cache.disk.parent_directory',
+                                   self._cache_slot(slot))
+        if self.cache_size is not None:
+            options.set_preference('browser.cache.disk.capacity',
+                                   self.cache_size * 1024)
+        if self.max_memory is not None:
+            options.set_preference('dom.ipc.processCount', 1)
+            options.set_preference('javascript.options.mem.max',
+                                   self.max_memory * 1024)
+
+        return options
+
+    def launch(self, slot=0):
+        """Start a new session
+
+        Parameters:
+        -----------
+        slot : int, non-negative, default 0
+            Index of the session among those running at the same time off
+            this profile. Picks the disk cache folder.
+        """
+
+        if self.browser == 'firefox':
+            return webdriver.Firefox(options=self.firefox_options(slot))
+
+        browser = webdriver.Chrome(options=self.chrome_options(slot))
+        urls = self.blocked_urls()
+        if urls:
+            browser.execute_cdp_cmd('Network.enable', {})
+            browser.execute_cdp_cmd('Network.setBlockedURLs', {'urls': urls})
+
+        return browser
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+Change detection of scraped option data. Yahoo's option data is 15 minutes
+delayed while the live loop pulls far more often than that, so most pages
+come back as they were. A ChangeDetector fingerprints every (symbol, expiry)
+page and every contract, so that unchanged pages are not parsed or stored
+again and only the rows that actually changed get written.
+"""
+
+import hashlib
+import json
+
+import numpy as np
+import pandas as pd
+
+# A row is written again only if one of these changed
+ROW_COLUMNS = ['Last Price', 'Bid', 'Ask', 'Volume', 'Open Interest']
+
+
+def fingerprint(tables):
+    """Digest of option tables, DataFrames or rows of cell texts"""
+
+    digest = hashlib.blake2b(digest_size=16)
+    for table in tables:
+        if isinstance(table, pd.DataFrame):
+            digest.update(pd.util.hash_pandas_object(
+                table, index=False).values.tobytes())
+        else:
+            digest.update(json.dumps(table).encode('utf-8'))
+        digest.update(b'|') # Table boundary
+
+    return digest.digest()
+
+
+class ChangeDetector:
+    """Fingerprints of Option Pages and Contracts
+
+    A page is unchanged if its tables hash the same as the last page of the
+    same symbol and expiry that was let through, or, with trust_yahoo_time,
+    if it carries the same 'Yahoo Time' market notice. Skipped pages keep
+    the fingerprint of that last page, so a change is never lost to a run of
+    skips. The fingerprint of a page let through is only staged, and counts
+    once commit_pages() is called after its data is stored, so a page whose
+    data failed to save is let through again. Contracts are fingerprinted
+    on ROW_COLUMNS and forgotten when the download date changes, so every
+    contract is written at least once a day.
+
+    Parameters:
+    -----------
+    trust_yahoo_time : boolean, default True
+        Also skip a page whose tables changed but whose 'Yahoo Time' did
+        not, which saves hashing and parsing it. Yahoo updates the notice
+        with the quotes, but only to the minute.
+    """
+
+    def __init__(self, trust_yahoo_time=True):
+        self.trust_yahoo_time = trust_yahoo_time
+        self.skipped = [] # (symbol, expiry) of pages skipped
+        self.date = None
+        self._pages = {} # (symbol, expiry) -> (yahoo time, digest)
+        self._staged = {} # Same, of the pages let through since the commit
+        # Row hash of each contract, grown as contracts are remembered
+        self._contracts = pd.Index([], dtype=object)
+        self._hashes = np.zeros(0, dtype=np.uint64)
+
+    def page_changed(self, symbol, expiry, yahoo_time, tables):
+        """True if the page should be parsed and stored
+
+        Parameters:
+        -----------
+        symbol : str
+
+        expiry : str or int
+            Expiration date value as in the &date= of the URL.
+
+        yahoo_time : str or None
+            'Yahoo Time' of the page. None if it was not rendered.
+
+        tables : list of DataFrame or list of lists of rows
+            Option tables of the page, parsed or as extracted.
+        """
+
+        key = (symbol, int(expiry))
+        last = self._pages.get(key)
+        if (last is not None and self.trust_yahoo_time
+                and yahoo_time is not None and last[0] == yahoo_time):
+            self.skipped.append(key)
+            return False
+
+        digest = fingerprint(tables)
+        if last is not None and last[1] == digest:
+            self.skipped.append(key)
+            return False
+
+        self._staged[key] = (yahoo_time, digest)
+        return True
+
+    def commit_pages(self):
+        """Count the pages staged, once their data is stored"""
+
+        self._pages.update(self._staged)
+        self._staged = {}
+
+    def discard_pages(self):
+        """Drop the pages staged, e.g. when their data failed to save"""
+
+        self._staged = {}
+
+    def pop_skipped(self):
+        """(symbol, expiry) of the pages skipped since the last call"""
+
+        skipped, self.skipped = self.skipped, []
+        return skipped
+
+    def changed_rows(self, df, date):
+        """Rows of df whose ROW_COLUMNS changed since they were remembered
+
+        Parameters:
+        -----------
+        df : DataFrame
+            Scraped option data with 'Contract Name' and ROW_COLUMNS, before
+            volume is turned into increments.
+
+        date : str
+            Download date. A new date forgets every contract.
+
+        Return:
+        -------
+        (mask, hashes) : boolean ndarray, uint64 ndarray
+            Rows to write, and the hashes to pass to remember() once they
+            are written.
+        """
+
+        if date != self.date:
+            self.date = date
+            self._forget_rows()
+
+        columns = [c for c in ROW_COLUMNS if c in df.columns]
+        hashes = pd.util.hash_pandas_object(df[columns], index=False).values
+        if not len(self._contracts):
+            return np.ones(len(df), dtype=bool), hashes
+
+        position = self._contracts.get_indexer(
+            df['Contract Name'].astype(str).values)
+        mask = (position < 0) | (self._hashes[position] != hashes)
+
+        return mask, hashes
+
+    def remember(self, contracts, hashes):
+        """Store the row hashes of contracts written to the database"""
+
+        contracts = pd.Index(pd.Series(contracts).astype(str).values,
+                             dtype=object)
+        hashes = np.asarray(hashes, dtype=np.uint64)
+
+        # Register contracts seen for the first time
+        new = contracts[self._contracts.get_indexer(contracts) < 0].unique()
+        if len(new):
+            self._contracts = self._contracts.append(new)
+            self._hashes = np.concatenate(
+                [self._hashes, np.zeros(len(new), dtype=np.uint64)])
+
+        self._hashes[self._contracts.get_indexer(contracts)] = hashes
+
+    def _forget_rows(self):
+        self._contracts = pd.Index([], dtype=object)
+        self._hashes = np.zeros(0, dtype=np.uint64)
+
+    def reset(self):
+        """Forget every fingerprint"""
+
+        self.skipped = []
+        self.date = None
+        self._pages = {}
+        self._staged = {}
+        self._forget_rows()
@@ -26,7 +26,17 @@ config['DEFAULT'] = {
     'BatchSize': '15',
     'SavePath': save_path,
     'ExtensionPath': ext_path,
+    'BrowserProfile': 'default', # See browser_profiles.PROFILES
     'DatabasePath': database_path,
+    'ParquetPath': '', # Folder of a Parquet copy, see parquet_store.py
+    'RefreshBudget': '0', # Pages per minute per batch, 0 to pull everything
+    'StreamRows': '0', # Rows per write while scraping, 0 to write per round
+    'MetricsPort': '0', # Prometheus endpoint of batch 0, +1 per batch
+    'MetricsPath': '', # JSON dump per cycle, {} is the batch number
+    'ChangeDetection': 'no', # Skip unchanged pages, write changed rows only
+    'SurfacePath': '', # .npz of IV surface history, {} is the batch number
+    'Rollups': 'no', # 1m, 15m and daily rollup tables, see rollups.py
+    'TickPath': '', # Folder of tick history, {} is the batch number
     'DataTableName': data_tb,
     'SymbolTableName': symbol_tb,
     'StartTimeLocal': '(9, 45, 30)',
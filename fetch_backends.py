@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""
+Browserless fetch backends for YahooScraper. Option chains are pulled with
+plain HTTP through a pooled keep-alive session and parsed from either Yahoo's
+JSON option endpoint or a statically rendered options page. YahooScraper falls
+back to Selenium whenever a backend raises FetchError.
+"""
+
+import json
+from collections import namedtuple
+from datetime import datetime, timezone
+
+import pandas as pd
+import requests
+from lxml import html as lxml_html
+from requests.adapters import HTTPAdapter
+
+from option_parser import (OPTION_COLUMNS, TABLES_XPATH, FALLBACK_XPATH,
+                           make_option_table, parse_option_tables)
+from retry_policy import RetryPolicy
+
+YAHOO_API_URL = 'https://query2.finance.yahoo.com'
+YAHOO_WEB_URL = 'http://finance.yahoo.com'
+
+# Yahoo JSON field for each of option_parser.OPTION_COLUMNS
+JSON_FIELDS = ['strike', 'contractSymbol', 'lastPrice', 'bid', 'ask',
+               'change', 'percentChange', 'volume', 'openInterest',
+               'impliedVolatility']
+
+PRICE_XPATH = '//*[@id="quote-header-info"]/div[2]/div[1]/div/span[1]'
+NOTICE_XPATH = '//*[@id="quote-market-notice"]/span'
+DATES_XPATH = ('//*[@id="main-0-Quote-Proxy"]/section/div[2]/section/div/'
+               'section/div[2]/div[1]/select/option')
+
+# Reads everything parse_option_html() needs in one WebDriver round trip and
+# returns it as a JSON string. Arguments are EXTRACT_ARGS.
+EXTRACT_JS = """
+function nodes(path) {
+    var result = document.evaluate(path, document, null,
+        XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+    var list = [];
+    for (var i = 0; i < result.snapshotLength; i++) {
+        list.push(result.snapshotItem(i));
+    }
+    return list;
+}
+function text(node) {
+    return node.textContent.trim();
+}
+function first(path) {
+    var list = nodes(path);
+    return list.length ? text(list[0]) : null;
+}
+var tables = nodes(arguments[2]);
+if (!tables.length) {
+    tables = nodes(arguments[3]);
+}
+return JSON.stringify({
+    ready: document.readyState === 'complete',
+    price: first(arguments[0]),
+    time: first(arguments[1]),
+    dates: nodes(arguments[4]).map(function(x) {
+        return [x.value, text(x)];
+    }),
+    tables: tables.map(function(table) {
+        return Array.prototype.map.call(
+            table.querySelectorAll('tbody > tr'), function(tr) {
+                return Array.prototype.map.call(tr.cells, text);
+            });
+    })
+});
+"""
+EXTRACT_ARGS = [PRICE_XPATH, NOTICE_XPATH, TABLES_XPATH, FALLBACK_XPATH,
+                DATES_XPATH]
+
+OptionPage = namedtuple('OptionPage',
+                        ['expiration_dates', 'price', 'yahoo_time', 'tables'])
+
+
+def parse_option_json(payload):
+    """Parse Yahoo's option chain JSON into an OptionPage
+
+    Parameters:
+    -----------
+    payload : dict
+        Decoded response of the /v7/finance/options endpoint.
+
+    Return:
+    -------
+    page : OptionPage
+        Expiration dates as (value, text) tuples, last price, market time and
+        the calls and puts tables laid out as OPTION_COLUMNS. Implied
+        volatility is converted to percent to match the web page.
+    """
+
+    try:
+        result = payload['optionChain']['result']
+    except (KeyError, TypeError):
+        raise FetchError('Unexpected JSON layout')
+
+    if not result:
+        raise FetchError('Empty option chain')
+
+    result = result[0]
+    quote = result.get('quote', {})
+
+    expiration_dates = [
+        (str(x), datetime.fromtimestamp(x, timezone.utc).strftime(
+            '%B %d, %Y'))
+        for x in result.get('expirationDates', [])
+    ]
+
+    price = quote.get('regularMarketPrice')
+    yahoo_time = quote.get('regularMarketTime')
+    if yahoo_time is not None:
+        yahoo_time = datetime.fromtimestamp(yahoo_time).strftime(
+            'As of %I:%M%p')
+
+    tables = []
+    for chain in result.get('options', []):
+        for side in ('calls', 'puts'):
+            rows = chain.get(side, [])
+            if not rows:
+                continue
+            df = pd.DataFrame(
+                [[row.get(f) for f in JSON_FIELDS] for row in rows],
+                columns=OPTION_COLUMNS)
+            # Missing fields are None, which leaves a column of objects
+            for column in OPTION_COLUMNS:
+                if column != 'Contract Name':
+                    df[column] = pd.to_numeric(df[column], errors='coerce')
+            df['Implied Volatility'] = df['Implied Volatility'] * 100
+            tables.append(df)
+
+    return OptionPage(expiration_dates, price, yahoo_time, tables)
+
+
+def parse_option_html(page_source):
+    """Parse a statically rendered Yahoo options page into an OptionPage
+
+    Parameters:
+    -----------
+    page_source : str
+        HTML of the options page.
+
+    Return:
+    -------
+    page : OptionPage
+        Same as parse_option_json(), with price and time kept as page text.
+    """
+
+    tree = lxml_html.fromstring(page_source)
+
+    def first_text(xpath_str):
+        elements = tree.xpath(xpath_str)
+        return elements[0].text_content().strip() if elements else None
+
+    expiration_dates = [(x.get('value'), x.text_content().strip())
+                        for x in tree.xpath(DATES_XPATH)]
+    price = first_text(PRICE_XPATH)
+    yahoo_time = first_text(NOTICE_XPATH)
+
+    tables = parse_option_tables(page_source)
+
+    if price is None or not (expiration_dates or tables):
+        raise FetchError('Option data not rendered in page source')
+
+    return OptionPage(expiration_dates, price, yahoo_time, tables)
+
+
+def parse_option_extract(payload):
+    """Build an OptionPage from the decoded result of EXTRACT_JS
+
+    Parameters:
+    -----------
+    payload : dict
+        json.loads() of what browser.execute_script(EXTRACT_JS,
+        *EXTRACT_ARGS) returned.
+
+    Return:
+    -------
+    page : OptionPage
+        Same as parse_option_html(). Price is None if it was not rendered
+        and tables without rows are left out.
+    """
+
+    tables = []
+    for rows in payload['tables']:
+        rows = [row for row in rows if len(row) == len(OPTION_COLUMNS)]
+        if rows:
+            tables.append(make_option_table(rows))
+
+    return OptionPage([tuple(x) for x in payload['dates']], payload['price'],
+                      payload['time'], tables)
+
+
+def option_url(base_url, mode, symbol, date=None):
+    """URL of the option page of a symbol and an expiration date
+
+    Parameters:
+    -----------
+    base_url : str
+        Host to fetch from, without trailing slash.
+
+    mode : str, 'json' or 'html'
+        Yahoo's option endpoint or the options web page.
+
+    symbol : str
+        Ticker of the stock of interest.
+
+    date : str or None, default None
+        Expiration date value. None means the nearest expiration date.
+    """
+
+    if mode == 'json':
+        url = base_url + '/v7/finance/options/' + symbol
+        if date is not None:
+            url += '?date=' + str(date)
+    else:
+        url = base_url + '/quote/' + symbol + '/options?p=' + symbol
+        if date is not None:
+            url += '&date=' + str(date)
+
+    return url
+
+
+def parse_option_text(text, mode):
+    """Parse a response body of the given mode into an OptionPage"""
+
+    if mode == 'json':
+        try:
+            payload = json.loads(text)
+        except ValueError:
+            raise FetchError('Response is not JSON')
+        return parse_option_json(payload)
+
+    return parse_option_html(text)
+
+
+class HttpBackend:
+    """Browserless Option Chain Fetcher
+
+    Pulls option pages with a pooled keep-alive requests.Session. Any failure
+    is raised as FetchError so that the caller can fall back to a browser.
+
+    Parameters:
+    -----------
+    mode : str, 'json' or 'html', default 'json'
+        'json' reads Yahoo's option endpoint and 'html' reads the options web
+        page, which only works if the page has the tables rendered.
+
+    base_url : str, default None
+        Host to fetch from. Defaults to YAHOO_API_URL for 'json' and
+        YAHOO_WEB_URL for 'html'. Point it to a local fixture server to test.
+
+    pool_size : int, positive, default 10
+        Number of keep-alive connections kept per host.
+
+    timeout : float, positive, default 10
+        Seconds to wait for a response before giving up.
+
+    max_tries : int, positive, default 3
+        Max number of requests per page before raising FetchError.
+
+    retry : RetryPolicy or None, default None
+        Backoff between the requests of a page. Defaults to jittered
+        exponential backoff, see retry_policy.py.
+    """
+
+    def __init__(self, mode='json', base_url=None, pool_size=10, timeout=10,
+                 max_tries=3, retry=None):
+        if mode not in ('json', 'html'):
+            raise ValueError('mode must be either json or html')
+
+        self.mode = mode
+        if base_url is None:
+            base_url = YAHOO_API_URL if mode == 'json' else YAHOO_WEB_URL
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.max_tries = max_tries
+        self.retry = retry if retry is not None else RetryPolicy(max_tries)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['User-Agent'] = 'Mozilla/5.0'
+
+    def url(self, symbol, date=None):
+        """URL of the option page of a symbol and an expiration date"""
+
+        return option_url(self.base_url, self.mode, symbol, date)
+
+    def _get(self, url):
+        """Get url with retries. Returns response body as text"""
+
+        error = None
+        for attempt in range(self.max_tries):
+            if attempt:
+                self.retry.record(error)
+                self.retry.sleep(attempt - 1)
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+            except requests.RequestException as inst:
+                error = inst
+                continue
+
+            if response.status_code == 200:
+                return response.text
+
+            error = 'HTTP {}'.format(response.status_code)
+            if response.status_code == 404:
+                self.retry.metrics.inc('page_404_total', source='http')
+                break # Not worth retrying
+
+        raise FetchError('Failed to get {0}: {1}'.format(url, error))
+
+    def get_option_page(self, symbol, date=None):
+        """Fetch and parse one option page. Returns an OptionPage"""
+
+        text = self._get(self.url(symbol, date))
+        return parse_option_text(text, self.mode)
+
+    def close(self):
+        """Close all pooled connections"""
+
+        self.session.close()
+
+class FetchError(Exception):
+    """Backend failed to fetch or parse an option page"""
+
+    pass
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+Performance instrumentation of the scraper: timed spans per symbol and
+expiration date, counters of retries, 404 pages, page refreshes and browser
+restarts, and latency histograms with p50, p95 and p99. Everything lands in
+a Metrics registry, REGISTRY by default, that can be served as Prometheus
+text, dumped to a JSON file or printed as a table at the end of a cycle.
+
+    metrics = Metrics()
+    with metrics.span('page_load_seconds', symbol='AAPL'):
+        ...
+    metrics.inc('retries_total', error='Page404Error')
+    print(metrics.report())
+"""
+
+import collections
+import contextlib
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+QUANTILES = [0.5, 0.95, 0.99]
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('{0}="{1}"'.format(
+        k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace(
+            '\n', '\\n'))
+        for k, v in pairs) + '}'
+
+
+class Histogram:
+    """Count, sum and the latest max_samples observations of a metric"""
+
+    def __init__(self, max_samples=10000):
+        self.count = 0
+        self.sum = 0.0
+        self.samples = collections.deque(maxlen=max_samples)
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.samples.append(value)
+
+    def quantiles(self, qs=QUANTILES):
+        """Quantiles of the samples kept, NaN if there are none"""
+
+        if not self.samples:
+            return [np.nan] * len(qs)
+        return list(np.percentile(np.fromiter(self.samples, float),
+                                  [100 * q for q in qs]))
+
+
+class Metrics:
+    """Registry of Spans, Counters and Histograms
+
+    All methods are thread safe. Label values should have a small number of
+    distinct values, e.g. an error class but not a symbol; per symbol and
+    expiry detail belongs in the attributes of a span, which only go to the
+    span log.
+
+    Parameters:
+    -----------
+    max_samples : int, positive, default 10000
+        Latest observations kept per histogram for its quantiles.
+
+    max_spans : int, non-negative, default 10000
+        Latest spans kept in the span log.
+    """
+
+    def __init__(self, max_samples=10000, max_spans=10000):
+        self.max_samples = max_samples
+        self.counters = {} # (name, labels) -> value
+        self.histograms = {} # (name, labels) -> Histogram
+        self.spans = collections.deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        """Add value to a counter"""
+
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """Add an observation to a histogram"""
+
+        key = _key(name, labels)
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(self.max_samples)
+            self.histograms[key].observe(value)
+
+    def record(self, name, seconds, **attrs):
+        """Record a span that took seconds and ended now
+
+        The duration goes to the histogram name, and the span with its
+        attributes, e.g. symbol and expiry, to the span log.
+        """
+
+        self.observe(name, seconds)
+        span = {'name': name, 'start': time.time() - seconds,
+                'seconds': seconds}
+        span.update(attrs)
+        with self._lock:
+            self.spans.append(span)
+
+    @contextlib.contextmanager
+    def span(self, name, **attrs):
+        """Time the body of a with statement as a span, see record()"""
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, **attrs)
+
+    def counter(self, name, **labels):
+        """Current value of a counter"""
+
+        with self._lock:
+            return self.counters.get(_key(name, labels), 0)
+
+    def reset(self):
+        """Drop everything recorded"""
+
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.spans.clear()
+
+    def report(self):
+        """Count, total and quantiles of every histogram as a DataFrame"""
+
+        with self._lock:
+            rows = [[name, _format_labels(labels), h.count, h.sum]
+                    + h.quantiles() for (name, labels), h
+                    in sorted(self.histograms.items())]
+
+        return pd.DataFrame(rows, columns=[
+            'Metric', 'Labels', 'Count', 'Total', 'p50', 'p95', 'p99'])
+
+    def to_dict(self, spans=True):
+        """Everything recorded as a JSON serializable dict"""
+
+        with self._lock:
+            data = {
+                'time': time.time(),
+                'counters': [
+                    {'name': name, 'labels': dict(labels), 'value': value}
+                    for (name, labels), value in sorted(
+                        self.counters.items())],
+                'histograms': [
+                    dict({'name': name, 'labels': dict(labels),
+                          'count': h.count, 'sum': h.sum},
+                         **{'p{:g}'.format(100 * q): v for q, v
+                            in zip(QUANTILES, h.quantiles())})
+                    for (name, labels), h in sorted(self.histograms.items())]
+            }
+            if spans:
+                data['spans'] = list(self.spans)
+
+        return data
+
+    def to_prometheus(self):
+        """Prometheus text exposition format. Histograms are summaries"""
+
+        lines = []
+        with self._lock:
+            names = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in names:
+                    lines.append('# TYPE {} counter'.format(name))
+                    names.add(name)
+                lines.append('{0}{1} {2}'.format(
+                    name, _format_labels(labels), value))
+
+            for (name, labels), h in sorted(self.histograms.items()):
+                if name not in names:
+                    lines.append('# TYPE {} summary'.format(name))
+                    names.add(name)
+                for q, v in zip(QUANTILES, h.quantiles()):
+                    lines.append('{0}{1} {2}'.format(
+                        name, _format_labels(labels, [('quantile', q)]), v))
+                lines.append('{0}_sum{1} {2}'.format(
+                    name, _format_labels(labels), h.sum))
+                lines.append('{0}_count{1} {2}'.format(
+                    name, _format_labels(labels), h.count))
+
+        return '\n'.join(lines) + '\n'
+
+    def dump_json(self, path, spans=True):
+        """Write to_dict() to path, replacing it in one go"""
+
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.to_dict(spans), f, default=str)
+        os.replace(tmp_path, path)
+
+    def serve(self, port, host=''):
+        """Serve /metrics (Prometheus) and /metrics.json on a daemon thread
+
+        Return:
+        -------
+        server : ThreadingHTTPServer
+            Call server.shutdown() to stop it.
+        """
+
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body = metrics.to_prometheus()
+                    kind = 'text/plain; version=0.0.4'
+                elif self.path == '/metrics.json':
+                    body = json.dumps(metrics.to_dict(), default=str)
+                    kind = 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+
+                body = body.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', kind)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass # Keep scrapes of the endpoint out of the console
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        return server
+
+
+# Registry of the process, used wherever no other Metrics is given
+REGISTRY = Metrics()
@@ -22,11 +22,24 @@ TODO:
 PROJECT_PATH = (r'C:\Users\GlowingToilet\Google Drive\Projects'
                 + r'\yahoo-option-scraper')
 
-from yahoo_scraper import YahooScraper
+from yahoo_scraper import YahooScraper, Timer
+from browser_pool import BrowserPool
+from change_detector import ChangeDetector
+from browser_profiles import BrowserProfile
+from volume_tracker import VolumeTracker
+from option_schema import to_text_format
+from parquet_store import ParquetStore
+from refresh_scheduler import RefreshScheduler
+from rollups import Rollups
+from scrape_cache import ExpirationDateCache, SymbolCache
+from sqlite_store import SQLiteStore, DATA_INDEX
+from stream_writer import StreamWriter
+from tick_store import TickStore
+from vol_surface import SurfaceBuilder
+from instrumentation import REGISTRY
 from configparser import ConfigParser
 import pandas as pd
 import numpy as np
-import sqlite3
 import time
 import sys
 import os
@@ -82,32 +95,21 @@ def report_time(fmt='%Y-%m-%d %H:%M:%S'):
     
     return datetime.now().strftime(fmt)
 
+def get_session_times(config):
+    """Trading Session of Today
+    
+    Parameter:
+    ----------
+    config : ConfigParser
+        Config read from config_nasdaq100.ini.
         
-# Read config
-config_path = PROJECT_PATH + '/config_nasdaq100.ini'
-config = ConfigParser()
-config.read(config_path)
-
-# Update batch number and close
-batch_num = int(config['CURRENT']['BatchNumber'])
-config['CURRENT']['BatchNumber'] = str(batch_num + 1)
-with open(config_path, 'w') as configfile:
-    config.write(configfile)
+    Return:
+    -------
+    (start_time, end_time, weekdays) : datetime, datetime, list of int
+        Start and end of today's session and the weekdays to run on.
+    
+    """
     
-print('[{0}]Current Batch Number: {1}'.format(report_time(), batch_num))
-read_symbols = True
-
-# Inception
-if len(sys.argv) > 1 and batch_num + 1 < int(sys.argv[1]):
-    cmd = (r'start cmd /c python "' 
-           + sys.argv[0]
-           + '" {}'.format(sys.argv[1]))
-    os.system(cmd)
-else:
-    print('[{}]End of batch chain.'.format(report_time()))
-
-while True:
-    # Get start and end times
     start_time = eval(config['CURRENT']['StartTimeLocal'])
     start_time = datetime.now().replace(hour=start_time[0],
                                         minute=start_time[1],
@@ -120,124 +122,409 @@ while True:
                                       second=end_time[2],
                                       microsecond=0)
     
-    # Get running weekdays
     weekdays = eval(config['CURRENT']['RunWeekdays'])
+    
+    return start_time, end_time, weekdays
 
-    if (datetime.now() > start_time and
-        datetime.now() < end_time and
-        datetime.now().weekday() in weekdays):
-        if read_symbols: # Only run once per trading session
-            # Check if symbol list is updated today
-            try:
-                sql = ('SELECT DISTINCT max(Date) as Date FROM '
-                       + config['CURRENT']['SymbolTableName'])
-                conn = sqlite3.connect(config['CURRENT']['DatabasePath'])
-                last_update_date = pd.read_sql_query(sql, conn)
-                last_update_date = last_update_date.values[0][0]
-                is_upto_date = last_update_date == str(datetime.now().date())
-            except:
-                print('[{}]Failed to request symbols from database, '
-                      'downloading symbol list now.'.format(report_time()))
-                is_upto_date = False
-
-            if not is_upto_date:
-                if not batch_num: # Batch 0 will update the list
-                    try:
-                        df = pd.read_html('http://www.cnbc.com/nasdaq-100/')
-                        df = pd.DataFrame(df[0].append(df[1], 
-                                          ignore_index=True)['Symbol'])
-                        df = df.append([{'Symbol': 'SPY'}, {'Symbol': 'QQQ'}], 
-                                       ignore_index=True)
-                        df['Date'] = str(datetime.date(datetime.now()))
-                        conn = sqlite3.connect(
-                            config['CURRENT']['DatabasePath'])
-                        df.to_sql(config['CURRENT']['SymbolTableName'], conn, 
-                                  if_exists='append', index=False)
-                        conn.close()
-                    except Exception as inst:
-                        print(repr(inst))
-                else:
-                    is_updated = False
-                    while not is_updated: # Wait for list to be updated
-                        print('[{}]Waiting for symbol list to be updated'
-                              '...'.format(report_time()))
-                        try:
-                            conn = sqlite3.connect(
-                                config['CURRENT']['DatabasePath'])
-                            last_update_date = pd.read_sql_query(sql, conn)
-                            last_update_date = last_update_date.values[0][0]
-                            is_updated = (
-                                last_update_date == str(datetime.now().date()))
-                        except:
-                            is_updated = False
-                            
-                        time.sleep(1)
-                                    
-            # Read symbol list from database
-            sql = ('SELECT DISTINCT Symbol FROM '
-                   + config['CURRENT']['SymbolTableName']
-                   + ' WHERE Date IN '
-                   + '(SELECT Date FROM '
-                   + config['CURRENT']['SymbolTableName']
-                   + ' ORDER BY date DESC LIMIT 1)')
-            conn = sqlite3.connect(config['CURRENT']['DatabasePath'])
-            symbols = pd.read_sql_query(sql, conn)
-            conn.close() 
-                
-            read_symbols = False
+def is_in_session(config):
+    """Check if now is within the trading session. Returns (bool, start)"""
+    
+    start_time, end_time, weekdays = get_session_times(config)
+    
+    is_in = (datetime.now() > start_time and
+             datetime.now() < end_time and
+             datetime.now().weekday() in weekdays)
+    
+    return is_in, start_time
 
-            # Assign symbols to bins
-            batch_size = int(config['CURRENT']['BatchSize'])
-            num_bins = np.ceil(symbols.shape[0] / batch_size)
-            bins = pd.cut(symbols.index, num_bins, labels=False)
-            symbols = list(symbols.iloc[bins == batch_num, 0])
-            
-            # If no symbols
-            if not len(symbols):
-                break
+def is_symbol_list_updated(config):
+    """Check if the symbol list in the database is from today"""
+    
+    sql = ('SELECT DISTINCT max(Date) as Date FROM '
+           + config['CURRENT']['SymbolTableName'])
+    store = SQLiteStore.open(config['CURRENT']['DatabasePath'])
+    last_update_date = store.read(sql)
+    last_update_date = last_update_date.values[0][0]
+    
+    return last_update_date == str(datetime.now().date())
 
-        ys = YahooScraper(symbols, ext_path=config['CURRENT']['ExtensionPath'])
-        print('[{}]Start scraping option data...'.format(report_time()))
-        ys.scrape_all()
+def download_symbol_list(config):
+    """Download the NASDAQ-100 symbols plus SPY and QQQ to the database"""
+    
+    df = pd.read_html(config['CURRENT']['NASDAQ100'])
+    df = pd.DataFrame(pd.concat([df[0], df[1]], 
+                                ignore_index=True)['Symbol'])
+    df = pd.concat([df, pd.DataFrame({'Symbol': ['SPY', 'QQQ']})], 
+                   ignore_index=True)
+    df['Date'] = str(datetime.date(datetime.now()))
+    store = SQLiteStore.open(config['CURRENT']['DatabasePath'])
+    store.write(config['CURRENT']['SymbolTableName'], df)
+    store.flush()
 
-        try:
-            # Pull cumulative sum of option volumes till now for today
-            sql_symbols = ','.join(['"' + s + '"' for s in ys.symbols])
-            
-            sql = ('SELECT "Contract Name", sum(Volume) as Volume_sum FROM '
-                   + config['CURRENT']['DataTableName']
-                   + ' WHERE "Download Date" = "'
-                   + str(datetime.now().date())
-                   + '" AND Volume IS NOT NULL'
-                   + ' AND Symbol in ('
-                   + sql_symbols
-                   + ')'
-                   + ' GROUP BY "Contract Name" ')
-            conn = sqlite3.connect(config['CURRENT']['DatabasePath'])
-            vol_sum = pd.read_sql_query(sql, conn)
-            conn.close()
-            
-            # Calculate the incremental change
-            df = ys.data.merge(vol_sum, how='left', on='Contract Name')
-            df['Volume_sum'] = df['Volume_sum'].apply(
-                    lambda x: 0 if np.isnan(x) else x)
+def read_symbol_list(config):
+    """Read the most recent symbol list from the database as a DataFrame"""
+    
+    sql = ('SELECT DISTINCT Symbol FROM '
+           + config['CURRENT']['SymbolTableName']
+           + ' WHERE Date IN '
+           + '(SELECT Date FROM '
+           + config['CURRENT']['SymbolTableName']
+           + ' ORDER BY date DESC LIMIT 1)')
+    store = SQLiteStore.open(config['CURRENT']['DatabasePath'])
+    symbols = store.read(sql)
+    
+    return symbols
+
+def seed_volume_tracker(tracker, config, symbols):
+    """Seed volume totals from the database if the tracker is not of today"""
+    
+    today = str(datetime.now().date())
+    if tracker.date == today:
+        return
+    
+    try:
+        sql = ('SELECT "Contract Name", sum(Volume) as Volume_sum FROM '
+               + config['CURRENT']['DataTableName']
+               + ' WHERE "Download Date" = ?'
+               + ' AND Symbol IN ({})'.format(','.join('?' * len(symbols)))
+               + ' AND Volume IS NOT NULL'
+               + ' GROUP BY "Contract Name" ')
+        store = SQLiteStore.open(config['CURRENT']['DatabasePath'])
+        vol_sum = store.read(sql, [today] + list(symbols))
+        tracker.seed(today, vol_sum['Contract Name'], vol_sum['Volume_sum'])
+    except DatabaseError:
+        print('[{}]No historical data of today. Starting volume totals from '
+              'scratch...'.format(report_time()))
+        tracker.reset(today)
+
+def save_increments(df, tracker, config, parquet_store=None, detector=None,
+                    rollups=None, tick_store=None):
+    """Turn cumulative volume of scraped data into increments and persist it
+    
+    Parameter:
+    ----------
+    df : DataFrame
+        Data of the latest round, e.g. YahooScraper.data. Its 'Volume' is
+        replaced by the increments.
+        
+    tracker : VolumeTracker
+        Running volume totals of today. Only counts the data, and is saved,
+        once the data is written.
+        
+    config : ConfigParser
+        Config read from config_nasdaq100.ini.
+        
+    parquet_store : ParquetStore, default None
+        Optional second sink of the data.
+        
+    detector : ChangeDetector, default None
+        If given, only rows whose prices, volume or open interest changed
+        since they were last saved are written.
+        
+    rollups : Rollups, default None
+        Rollup tables updated in the same transaction as the data.
+        
+    tick_store : TickStore, default None
+        Per-contract history the rows written are appended to.
+    
+    """
+    
+    if not len(df):
+        return
+    
+    today = str(datetime.now().date())
+    if detector is not None:
+        # Hashed on cumulative volume, before it turns into increments
+        changed, hashes = detector.changed_rows(df, today)
+    
+    # Calculate the incremental change, counted once it is stored
+    volumes = df['Volume'].values
+    df['Volume'] = tracker.increments(
+        today, df['Contract Name'], volumes).astype(np.int64)
+    
+    rows = df
+    if detector is not None:
+        rows = df[changed]
+        REGISTRY.inc('rows_unchanged_total', len(df) - len(rows))
+
+    # Export the incremental volume to database
+    store = SQLiteStore.open(config['CURRENT']['DatabasePath'])
+    store.write(config['CURRENT']['DataTableName'], to_text_format(rows))
+    if rollups is not None:
+        rollups.ingest(rows)
+    store.flush() # Committed before the totals count it
+    tracker.add(today, df['Contract Name'], volumes)
+    if parquet_store is not None and len(rows):
+        parquet_store.write(rows)
+    if tick_store is not None:
+        tick_store.append(rows)
+    if detector is not None:
+        detector.remember(rows['Contract Name'], hashes[changed])
+    tracker.save()
+
+
+def scrape_and_save(ys, tracker, config, parquet_store=None, scheduler=None,
+                    dates=None, stream_rows=0, surfaces=None, rollups=None,
+                    tick_store=None):
+    """Scrape a round with ys and persist it through save_increments()
+    
+    Parameter:
+    ----------
+    ys : YahooScraper
+        The pages its change_detector let through are committed once the
+        round is saved, and let through again if it failed.
+    
+    tracker, config, parquet_store, rollups, tick_store : see
+        save_increments()
+        
+    scheduler : RefreshScheduler, default None
+        Observes the volume of every chain saved, and no volume of the
+        chains ys.change_detector found unchanged. Symbols it has no chains
+        of are synced first, so that their first pull counts.
+        
+    dates : dict, default None
+        See YahooScraper.scrape_all().
+        
+    stream_rows : int, non-negative, default 0
+        If positive, the round is streamed and saved every stream_rows rows
+        while it is being scraped, so a crash loses at most one chunk.
+        0 means the whole round is saved at once at the end.
+        
+    surfaces : SurfaceBuilder, default None
+        Updated with every chain saved, and snapshot once the round is over.
+    
+    """
+    
+    detector = ys.change_detector
+    
+    def save(df):
+        save_increments(df, tracker, config, parquet_store, detector,
+                        rollups, tick_store)
+        if scheduler is not None:
+            for symbol in set(df['Symbol'].astype(str)) - scheduler.symbols:
+                scheduler.sync(symbol, [x[0] for x in ys.symbol_dates(symbol)])
+            scheduler.observe_frame(df)
+        if surfaces is not None:
+            surfaces.observe_frame(df)
+    
+    try:
+        if stream_rows <= 0:
+            ys.scrape_all(dates=dates)
+            save(ys.data)
+        else:
+            with StreamWriter(save, max_rows=stream_rows) as writer:
+                for batch in ys.scrape_iter(dates=dates):
+                    writer.put(batch)
+            print('[{0}]Saved {1} rows in {2} chunks'.format(
+                    report_time(), writer.rows, writer.chunks))
+    except Exception:
+        if detector is not None:
+            detector.discard_pages() # Let through again next round
+        raise
+    
+    if detector is not None:
+        detector.commit_pages()
+        # Nothing traded on a page that did not change
+        for symbol, expiry in detector.pop_skipped():
+            if scheduler is not None:
+                scheduler.observe(symbol, expiry, 0)
+    
+    if surfaces is not None:
+        surfaces.snapshot()
+
+        
+if __name__ == '__main__':
+    # Read config
+    config_path = PROJECT_PATH + '/config_nasdaq100.ini'
+    config = ConfigParser()
+    config.read(config_path)
+    
+    # Update batch number and close
+    batch_num = int(config['CURRENT']['BatchNumber'])
+    config['CURRENT']['BatchNumber'] = str(batch_num + 1)
+    with open(config_path, 'w') as configfile:
+        config.write(configfile)
+        
+    print('[{0}]Current Batch Number: {1}'.format(report_time(), batch_num))
+    read_symbols = True
+    
+    # Inception
+    if len(sys.argv) > 1 and batch_num + 1 < int(sys.argv[1]):
+        cmd = (r'start cmd /c python "' 
+               + sys.argv[0]
+               + '" {}'.format(sys.argv[1]))
+        os.system(cmd)
+    else:
+        print('[{}]End of batch chain.'.format(report_time()))
+        
+    # Warm browser sessions shared by every scrape round of this process
+    profile = BrowserProfile.from_config(config['CURRENT'])
+    pool = BrowserPool(profile=profile.for_process(
+        'batch-{}'.format(batch_num)))
+    
+    # Volume stored so far today per contract, kept across restarts
+    tracker = VolumeTracker(os.path.join(
+        config['CURRENT']['SavePath'], 
+        'volume_totals_{}.npz'.format(batch_num)))
+    
+    # Long-lived connections and indexes of the database
+    SQLiteStore.open(config['CURRENT']['DatabasePath']).add_index(
+        config['CURRENT']['DataTableName'], DATA_INDEX)
+    
+    # Expiration dates, renamed and dead symbols shared by all batches
+    cache_path = os.path.join(config['CURRENT']['SavePath'], 
+                              'scrape_cache.db')
+    date_cache = ExpirationDateCache(cache_path)
+    symbol_cache = SymbolCache(cache_path)
+    
+    # Optional partitioned Parquet copy of the data, compacted by batch 0
+    parquet_store = None
+    if config['CURRENT'].get('ParquetPath'):
+        parquet_store = ParquetStore(config['CURRENT']['ParquetPath'])
+        if not batch_num:
+            parquet_store.start_compaction()
+    
+    # Optional budget of pages per minute, spent on the most active chains
+    scheduler = None
+    if config['CURRENT'].getfloat('RefreshBudget', 0) > 0:
+        scheduler = RefreshScheduler(
+            config['CURRENT'].getfloat('RefreshBudget'))
+    
+    # Optional streaming of each round to the database while scraping
+    stream_rows = config['CURRENT'].getint('StreamRows', 0)
+    
+    # Optional skipping of unchanged pages and rows across rounds
+    detector = None
+    if config['CURRENT'].getboolean('ChangeDetection', False):
+        detector = ChangeDetector()
+    
+    # Optional rollups of the data table, updated as data is saved
+    rollups = None
+    if config['CURRENT'].getboolean('Rollups', False):
+        rollups = Rollups.from_config(config)
+    
+    # Optional memory-mapped tick history, one folder per batch
+    tick_store = None
+    if config['CURRENT'].get('TickPath'):
+        tick_store = TickStore(config['CURRENT']['TickPath'].format(
+            batch_num))
+    
+    # Optional volatility surfaces of every round, saved per batch
+    surfaces = None
+    if config['CURRENT'].get('SurfacePath'):
+        surfaces = SurfaceBuilder(
+            path=config['CURRENT']['SurfacePath'].format(batch_num))
+    
+    # Optional metrics endpoint, one port per batch, and JSON dump per cycle
+    if config['CURRENT'].getint('MetricsPort', 0):
+        REGISTRY.serve(config['CURRENT'].getint('MetricsPort') + batch_num)
+    metrics_path = config['CURRENT'].get('MetricsPath')
+    
+    while True:
+        is_in, start_time = is_in_session(config)
+        
+        if is_in:
+            if read_symbols: # Only run once per trading session
+                # Check if symbol list is updated today
+                try:
+                    is_upto_date = is_symbol_list_updated(config)
+                except:
+                    print('[{}]Failed to request symbols from database, '
+                          'downloading symbol list now.'.format(report_time()))
+                    is_upto_date = False
+    
+                if not is_upto_date:
+                    if not batch_num: # Batch 0 will update the list
+                        try:
+                            download_symbol_list(config)
+                        except Exception as inst:
+                            print(repr(inst))
+                    else:
+                        is_updated = False
+                        while not is_updated: # Wait for list to be updated
+                            print('[{}]Waiting for symbol list to be updated'
+                                  '...'.format(report_time()))
+                            try:
+                                is_updated = is_symbol_list_updated(config)
+                            except:
+                                is_updated = False
+                                
+                            time.sleep(1)
+                                        
+                # Read symbol list from database
+                symbols = read_symbol_list(config)
+                read_symbols = False
+    
+                # Assign symbols to bins
+                batch_size = int(config['CURRENT']['BatchSize'])
+                num_bins = np.ceil(symbols.shape[0] / batch_size)
+                bins = pd.cut(symbols.index, num_bins, labels=False)
+                symbols = list(symbols.iloc[bins == batch_num, 0])
+                
+                # If no symbols
+                if not len(symbols):
+                    break
+                
+                seed_volume_tracker(tracker, config, symbols)
+    
+            timer = Timer() # Time each cycle
+            if scheduler is None:
+                ys = YahooScraper(symbols, pool=pool, date_cache=date_cache,
+                                  symbol_cache=symbol_cache, 
+                                  change_detector=detector)
+                print('[{}]Start scraping option data...'.format(
+                        report_time()))
+                scrape_and_save(ys, tracker, config, parquet_store,
+                                stream_rows=stream_rows, surfaces=surfaces,
+                                rollups=rollups, tick_store=tick_store)
+            else:
+                # Chains that are due, plus whole symbols not scheduled yet
+                dates = scheduler.due()
+                admitted = set(scheduler.admit(symbols))
+                todo = [s for s in symbols if s in dates or s in admitted]
+                if not todo:
+                    time.sleep(1)
+                    continue
+                
+                ys = YahooScraper(todo, pool=pool, date_cache=date_cache,
+                                  symbol_cache=symbol_cache, 
+                                  change_detector=detector)
+                print('[{0}]Start scraping option data of {1} symbols'
+                      '...'.format(report_time(), len(todo)))
+                scrape_and_save(ys, tracker, config, parquet_store, scheduler,
+                                dates, stream_rows, surfaces, rollups,
+                                tick_store)
+                # Pages beyond the base pages and due chains let in above
+                scheduler.charge(len(ys.timer['Page Load']) - len(admitted)
+                                 - sum(len(x) for x in dates.values()))
+                for symbol in admitted:
+                    expiries = [date[0] for date in ys.symbol_dates(symbol)]
+                    if expiries:
+                        scheduler.sync(symbol, expiries)
+                    else: # Not found or no options, try again later
+                        scheduler.defer(symbol)
+                for symbol in dates: # Drop chains no longer listed
+                    expiries = [date[0] for date in ys.symbol_dates(symbol)]
+                    if expiries:
+                        scheduler.sync(symbol, expiries)
             
-            df['Volume'] = df['Volume'] - df['Volume_sum']
-            df['Volume'] = df['Volume'].apply(
-                    lambda x: 0 if x < 0 or np.isnan(x) else x)
+            REGISTRY.record('cycle_seconds', timer.stop(), batch=batch_num)
+            if metrics_path:
+                REGISTRY.dump_json(metrics_path.format(batch_num))
+            if surfaces is not None:
+                surfaces.store.save()
             
-            ys.data = df.drop('Volume_sum', axis=1)
-        except DatabaseError:
-            print('[{}]No historical data of today. Writing to the database '
-                  'directly...'.format(report_time()))
-        
-        # Export the incremental volume to database
-        conn = sqlite3.connect(config['CURRENT']['DatabasePath'])
-        ys.save_to_sqlite(config['CURRENT']['DataTableName'], conn)
-        conn.close()
-        time.sleep(1) # Prevent too frequent looping
-    else:
-        print('[{}]Out of trading session...Sleeping...'.format(report_time()))
-        interval = dynamic_sleep_interval(start_time)
-        time.sleep(interval)
-        read_symbols = True
+            time.sleep(1) # Prevent too frequent looping
+        else:
+            print('[{}]Out of trading session...Sleeping...'.format(
+                    report_time()))
+            pool.close() # No need to keep browsers warm overnight
+            if detector is not None:
+                detector.reset()
+            if surfaces is not None:
+                surfaces.reset()
+            if tick_store is not None:
+                tick_store.seal() # Sorted by contract for reading
+            interval = dynamic_sleep_interval(start_time)
+            time.sleep(interval)
+            read_symbols = True
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Append-only columnar buffer for scraped option tables. Tables are kept as
+they are parsed, with the columns that are constant within a table stored
+once per chunk, and only turned into one DataFrame when it is asked for.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class OptionBuffer:
+    """Columnar Buffer of Option Tables
+
+    Appending is O(rows appended). The combined DataFrame is built once by
+    to_frame() and cached until the next append, so accumulating n tables
+    costs O(n) instead of the O(n^2) of repeated DataFrame.append.
+
+    Parameters:
+    -----------
+    categorical : boolean, default False
+        If True, constant text columns are expanded as categoricals.
+
+    columns : list of str, default None
+        Column order of to_frame(). Columns not in the buffer are skipped.
+        None means table columns first, then constant columns.
+    """
+
+    def __init__(self, categorical=False, columns=None):
+        self.categorical = categorical
+        self.columns = columns
+        self._tables = []
+        self._constants = [] # One dict of column -> value per table
+        self._num_rows = 0
+        self._frame = None
+
+    @classmethod
+    def from_frame(cls, df, **kwargs):
+        """Make a buffer that holds an existing DataFrame as is"""
+
+        buffer = cls(**kwargs)
+        if len(df.columns):
+            buffer._tables.append(df)
+            buffer._constants.append({})
+            buffer._num_rows = df.shape[0]
+        buffer._frame = df
+
+        return buffer
+
+    def __len__(self):
+        return self._num_rows
+
+    def append(self, table, constants=None):
+        """Append a table and the columns that are constant over its rows
+
+        Parameters:
+        -----------
+        table : DataFrame
+            Parsed option table. It is kept by reference, not copied.
+
+        constants : dict, default None
+            Column name -> scalar value shared by every row of the table.
+        """
+
+        self._tables.append(table)
+        self._constants.append(constants or {})
+        self._num_rows += table.shape[0]
+        self._frame = None
+
+    def to_frame(self):
+        """Combine all chunks into one DataFrame, cached until next append"""
+
+        if self._frame is not None:
+            return self._frame
+
+        if not self._tables:
+            self._frame = pd.DataFrame()
+            return self._frame
+
+        df = pd.concat(self._tables, ignore_index=True, sort=False)
+
+        # Expand constant columns in one go, in the order they first appear
+        lengths = [table.shape[0] for table in self._tables]
+        columns = []
+        for constants in self._constants:
+            columns += [c for c in constants if c not in columns]
+
+        for column in columns:
+            values = [c.get(column, np.nan) for c in self._constants]
+            if column in df.columns: # A table held it, e.g. from_frame()
+                df[column] = self._fill(df[column], column, lengths)
+            else:
+                df[column] = self._expand(values, lengths)
+
+        if self.columns is not None:
+            df = df[[c for c in self.columns if c in df.columns]]
+
+        self._frame = df
+        return self._frame
+
+    def _expand(self, values, lengths):
+        """Repeat one constant per table into a full column"""
+
+        is_number = all(isinstance(v, (int, float, np.number))
+                        and not isinstance(v, bool) for v in values)
+        if is_number:
+            return np.repeat(np.array(values), lengths)
+
+        if self.categorical:
+            codes, categories = pd.factorize(pd.Series(values, dtype=object))
+            return pd.Categorical.from_codes(np.repeat(codes, lengths),
+                                             categories)
+
+        array = np.empty(len(values), dtype=object)
+        array[:] = values
+        return np.repeat(array, lengths)
+
+    def _fill(self, values, column, lengths):
+        """Fill a column of the tables with a constant where one is given"""
+
+        has = np.repeat([column in c for c in self._constants], lengths)
+        constants = np.empty(len(self._constants), dtype=object)
+        constants[:] = [c.get(column) for c in self._constants]
+        values = pd.Series(np.where(has, np.repeat(constants, lengths),
+                                    values.values.astype(object)))
+
+        values = values.infer_objects()
+        if self.categorical and values.dtype.kind not in 'iufb':
+            return pd.Categorical(values)
+        return values.values
+
+    def clear(self):
+        """Drop everything in the buffer"""
+
+        self.__init__(self.categorical, self.columns)
+
+
+def concat_frames(frames):
+    """Concatenate DataFrames of the same layout, keeping categoricals
+
+    Categories differ between frames scraped apart, e.g. by different
+    workers or for different symbols, so pd.concat falls back to object for
+    those columns. They are turned back into categoricals here.
+    """
+
+    if not frames:
+        return pd.DataFrame()
+    if len(frames) == 1:
+        return frames[0]
+
+    df = pd.concat(frames, ignore_index=True, sort=False)
+    for column, dtype in frames[0].dtypes.items():
+        if dtype.name == 'category' and df[column].dtype.name != 'category':
+            df[column] = df[column].astype('category')
+
+    return df
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""
+Black-Scholes implied volatility and greeks of whole option chains at once.
+Every function works on NumPy arrays of any length, so a chain, a round or
+a day of data read back from the database is priced in one go instead of
+contract by contract. chain_analytics() takes YahooScraper.data or rows of
+the data table as they are.
+
+    df = chain_analytics(ys.data, rate=0.01)
+"""
+
+import numpy as np
+import pandas as pd
+
+from option_schema import normalize
+
+DAYS_PER_YEAR = 365.0
+
+# Options expire at the close, 16:00 on their expiration date
+EXPIRY_TIME = 16 * 3600 * 10**9
+
+# Implied volatilities are searched for within these bounds
+MIN_VOL = 1e-4
+MAX_VOL = 5.0
+
+ANALYTICS_COLUMNS = ['Days to Expiry', 'Moneyness', 'Option Price',
+                     'Model IV', 'Delta', 'Gamma', 'Vega', 'Theta']
+
+_SQRT_2 = np.sqrt(2.0)
+_SQRT_2PI = np.sqrt(2.0 * np.pi)
+
+
+def norm_pdf(x):
+    """Standard normal density"""
+
+    return np.exp(-0.5 * np.square(x)) / _SQRT_2PI
+
+
+def norm_cdf(x):
+    """Standard normal distribution function
+
+    Uses the Chebyshev fit of erfc from Numerical Recipes, with a relative
+    error below 1.2e-7 everywhere, as NumPy has no erf of its own.
+    """
+
+    z = np.abs(x) / _SQRT_2
+    t = 1.0 / (1.0 + 0.5 * z)
+    erfc = t * np.exp(-z * z - 1.26551223 + t * (1.00002368 + t * (
+        0.37409196 + t * (0.09678418 + t * (-0.18628806 + t * (
+            0.27886807 + t * (-1.13520398 + t * (1.48851587 + t * (
+                -0.82215223 + t * 0.17087277)))))))))
+
+    return np.where(x >= 0, 1.0 - 0.5 * erfc, 0.5 * erfc)
+
+
+def _d1_d2(spot, strike, years, vol, rate, dividend):
+    vol_sqrt_t = vol * np.sqrt(years)
+    d1 = (np.log(spot / strike) + (rate - dividend) * years) / vol_sqrt_t \
+        + 0.5 * vol_sqrt_t
+    return d1, d1 - vol_sqrt_t
+
+
+def black_scholes(is_call, spot, strike, years, vol, rate=0.0, dividend=0.0):
+    """Black-Scholes price of European options
+
+    Parameters:
+    -----------
+    is_call : array-like of bool
+        True for calls, False for puts.
+
+    spot, strike : array-like of float
+        Price of the underlying and strike.
+
+    years : array-like of float
+        Time to expiry in years, positive.
+
+    vol : array-like of float
+        Volatility per year, e.g. 0.25 for 25%.
+
+    rate, dividend : float or array-like, default 0
+        Continuously compounded risk-free rate and dividend yield.
+    """
+
+    d1, d2 = _d1_d2(spot, strike, years, vol, rate, dividend)
+    spot_q = spot * np.exp(-dividend * years)
+    strike_r = strike * np.exp(-rate * years)
+
+    call = spot_q * norm_cdf(d1) - strike_r * norm_cdf(d2)
+    # Put from put-call parity
+    return np.where(is_call, call, call - spot_q + strike_r)
+
+
+def greeks(is_call, spot, strike, years, vol, rate=0.0, dividend=0.0):
+    """Delta, gamma, vega and theta of European options
+
+    Parameters are those of black_scholes().
+
+    Return:
+    -------
+    greeks : dict of ndarray
+        'Delta' and 'Gamma' per unit of the underlying, 'Vega' per
+        percentage point of volatility and 'Theta' per calendar day.
+    """
+
+    d1, d2 = _d1_d2(spot, strike, years, vol, rate, dividend)
+    sqrt_t = np.sqrt(years)
+    disc_q = np.exp(-dividend * years)
+    strike_r = strike * np.exp(-rate * years)
+    pdf = norm_pdf(d1)
+    cdf_d1 = norm_cdf(d1)
+    cdf_d2 = norm_cdf(d2)
+
+    # Put values follow from the call ones by put-call parity
+    delta = disc_q * np.where(is_call, cdf_d1, cdf_d1 - 1.0)
+    decay = -spot * disc_q * pdf * vol / (2.0 * sqrt_t)
+    theta = np.where(
+        is_call,
+        decay - rate * strike_r * cdf_d2 + dividend * spot * disc_q * cdf_d1,
+        decay + rate * strike_r * (1.0 - cdf_d2)
+        - dividend * spot * disc_q * (1.0 - cdf_d1))
+
+    return {
+        'Delta': delta,
+        'Gamma': disc_q * pdf / (spot * vol * sqrt_t),
+        'Vega': spot * disc_q * pdf * sqrt_t / 100.0,
+        'Theta': theta / DAYS_PER_YEAR
+    }
+
+
+def implied_volatility(price, is_call, spot, strike, years, rate=0.0,
+                       dividend=0.0, tol=1e-6, max_iter=100):
+    """Black-Scholes implied volatility of option prices
+
+    All contracts are solved at once with Newton steps, falling back to
+    bisection whenever a step leaves the bracket known to hold the root, so
+    every contract converges. Contracts that have converged drop out of the
+    arrays of the next iteration.
+
+    Parameters:
+    -----------
+    price : array-like of float
+        Option prices.
+
+    is_call, spot, strike, years, rate, dividend : see black_scholes()
+
+    tol : float, positive, default 1e-6
+        Volatility tolerance.
+
+    max_iter : int, positive, default 100
+
+    Return:
+    -------
+    vol : ndarray of float64
+        Volatility per year. NaN where the price is outside the no-arbitrage
+        bounds, the time to expiry is not positive, the volatility is not
+        within MIN_VOL and MAX_VOL or the search did not converge.
+    """
+
+    price, is_call, spot, strike, years, rate, dividend = (
+        np.ravel(x) for x in np.broadcast_arrays(
+            np.asarray(price, dtype=np.float64), np.asarray(is_call, bool),
+            np.asarray(spot, dtype=np.float64),
+            np.asarray(strike, dtype=np.float64),
+            np.asarray(years, dtype=np.float64),
+            np.asarray(rate, dtype=np.float64),
+            np.asarray(dividend, dtype=np.float64)))
+    vol = np.full(len(price), np.nan)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        spot_q = spot * np.exp(-dividend * years)
+        strike_r = strike * np.exp(-rate * years)
+        lower = np.maximum(np.where(is_call, spot_q - strike_r,
+                                    strike_r - spot_q), 0.0)
+        upper = np.where(is_call, spot_q, strike_r)
+        index = np.flatnonzero((years > 0) & (spot > 0) & (strike > 0)
+                               & (price > lower) & (price < upper))
+
+    price, is_call, spot, strike, years, rate, dividend = (
+        x[index] for x in (price, is_call, spot, strike, years, rate,
+                           dividend))
+    lo = np.full(len(index), MIN_VOL)
+    hi = np.full(len(index), MAX_VOL)
+    # Inflection point of price in vol, from where Newton is monotone
+    sigma = np.clip(np.sqrt(2.0 * np.abs(
+        np.log(spot / strike) + (rate - dividend) * years) / years),
+        0.1, MAX_VOL)
+
+    for _ in range(max_iter):
+        if not len(index):
+            break
+
+        d1, _ = _d1_d2(spot, strike, years, sigma, rate, dividend)
+        diff = black_scholes(is_call, spot, strike, years, sigma, rate,
+                             dividend) - price
+        vega = spot * np.exp(-dividend * years) * norm_pdf(d1) \
+            * np.sqrt(years)
+
+        hi = np.where(diff > 0, sigma, hi)
+        lo = np.where(diff < 0, sigma, lo)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            step = sigma - diff / vega
+        step = np.where((step > lo) & (step < hi), step, 0.5 * (lo + hi))
+
+        done = (np.abs(step - sigma) < tol) | (hi - lo < tol)
+        vol[index[done]] = step[done]
+
+        sigma = step[~done]
+        index, price, is_call, spot, strike, years, rate, dividend, lo, hi = (
+            x[~done] for x in (index, price, is_call, spot, strike, years,
+                               rate, dividend, lo, hi))
+
+    # Stuck at a bound, the price is beyond what the bounds can explain
+    vol[(vol < MIN_VOL + tol) | (vol > MAX_VOL - tol)] = np.nan
+    return vol
+
+
+def as_typed(df):
+    """df as typed by option_schema.normalize(), unless it already is"""
+
+    needed = ['Option Type', 'Strike', 'Expiration Date', 'Bid', 'Ask',
+              'Last Price', 'Price @ DL Time', 'Download DateTime']
+    if (any(c not in df.columns for c in needed)
+            or any(df[c].dtype.kind not in 'fiu' for c in needed[1:])):
+        return normalize(df)
+    return df
+
+
+def chain_analytics(df, rate=0.0, dividend=0.0, price='mid'):
+    """Implied volatility, greeks, moneyness and time to expiry of option data
+
+    Parameters:
+    -----------
+    df : DataFrame
+        Option data such as YahooScraper.data or rows read from the data
+        table, typed as option_schema.SCHEMA or raw. Needs 'Contract Name'
+        or the columns decoded from it, 'Bid', 'Ask', 'Last Price',
+        'Price @ DL Time' and 'Download DateTime'.
+
+    rate, dividend : float or array-like, default 0
+        Continuously compounded risk-free rate and dividend yield.
+
+    price : str, 'mid' or 'last', default 'mid'
+        Option price to solve for. 'mid' is the middle of bid and ask, or
+        the last price where there is no two-sided quote.
+
+    Return:
+    -------
+    analytics : DataFrame
+        ANALYTICS_COLUMNS on the index of df. 'Moneyness' is strike over
+        spot and 'Model IV' is in percent like 'Implied Volatility'. Greeks
+        are as returned by greeks().
+    """
+
+    if price not in ('mid', 'last'):
+        raise ValueError('price must be either mid or last')
+
+    df = as_typed(df)
+
+    def column(name):
+        return df[name].values.astype(np.float64)
+
+    spot = column('Price @ DL Time')
+    strike = column('Strike')
+    expiry = df['Expiration Date'].values
+    seconds = np.where(expiry >= 0, (
+        expiry + EXPIRY_TIME - df['Download DateTime'].values) / 1e9, np.nan)
+    years = seconds / (DAYS_PER_YEAR * 86400)
+    is_call = (df['Option Type'] == 'Call').values
+
+    option_price = column('Last Price')
+    if price == 'mid':
+        bid, ask = column('Bid'), column('Ask')
+        quoted = (bid > 0) & (ask >= bid)
+        option_price = np.where(quoted, 0.5 * (bid + ask), option_price)
+
+    vol = implied_volatility(option_price, is_call, spot, strike, years,
+                             rate, dividend)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        analytics = pd.DataFrame({
+            'Days to Expiry': seconds / 86400,
+            'Moneyness': strike / spot,
+            'Option Price': option_price,
+            'Model IV': 100 * vol
+        }, index=df.index)
+        for name, values in greeks(is_call, spot, strike, years, vol, rate,
+                                   dividend).items():
+            analytics[name] = values
+
+    return analytics[ANALYTICS_COLUMNS]
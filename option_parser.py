@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Targeted parser for the calls and puts tables of a Yahoo options page. It
+walks only the two option tables with lxml instead of letting pd.read_html
+parse every table in the DOM, and returns typed numeric columns.
+"""
+
+import numpy as np
+import pandas as pd
+from lxml import html as lxml_html
+
+# Column layout of the option tables as shown on the Yahoo options page
+OPTION_COLUMNS = ['Strike', 'Contract Name', 'Last Price', 'Bid', 'Ask',
+                  'Change', '% Change', 'Volume', 'Open Interest',
+                  'Implied Volatility']
+
+# Columns where Yahoo shows '-' for nothing traded, parsed as 0
+COUNT_COLUMNS = ['Volume', 'Open Interest']
+
+TABLES_XPATH = ('//*[@id="main-0-Quote-Proxy"]/section/div[2]/section/div/'
+                'section/section/table')
+FALLBACK_XPATH = '//table[thead/tr/th[contains(., "Contract Name")]]'
+
+
+_STRIP = str.maketrans('', '', ',%')
+
+
+def _to_float(text):
+    try:
+        return float(text.translate(_STRIP))
+    except ValueError: # '-' and other placeholders
+        return np.nan
+
+
+def to_number(values):
+    """Convert Yahoo display strings such as '1,024', '+1.5%' or '-' to float
+
+    Percentages keep their percent units, i.e. '25.00%' becomes 25.0.
+    Anything that is not a number becomes NaN.
+    """
+
+    return np.fromiter((_to_float(str(x)) for x in values), dtype=np.float64,
+                       count=len(values))
+
+
+def make_option_table(rows):
+    """Build a typed option table from rows of 10 cell strings"""
+
+    columns = list(zip(*rows))
+    data = {}
+
+    for i, name in enumerate(OPTION_COLUMNS):
+        if name == 'Contract Name':
+            data[name] = np.array(columns[i], dtype=object)
+            continue
+        values = to_number(columns[i])
+        if name in COUNT_COLUMNS:
+            values = np.nan_to_num(values).astype(np.int64)
+        data[name] = values
+
+    return pd.DataFrame(data, columns=OPTION_COLUMNS)
+
+
+def parse_option_tables(page_source):
+    """Extract the calls and puts tables of a Yahoo options page
+
+    Parameters:
+    -----------
+    page_source : str
+        HTML of the options page, e.g. browser.page_source.
+
+    Return:
+    -------
+    tables : list of DataFrame
+        One DataFrame per option table laid out as OPTION_COLUMNS, with
+        numeric columns as float64 and Volume and Open Interest as int64.
+        Tables without rows are left out.
+    """
+
+    tree = lxml_html.fromstring(page_source)
+    elements = tree.xpath(TABLES_XPATH) or tree.xpath(FALLBACK_XPATH)
+
+    tables = []
+    for element in elements:
+        rows = [[td.text_content().strip() for td in tr.xpath('./td')]
+                for tr in element.xpath('./tbody/tr')]
+        rows = [row for row in rows if len(row) == len(OPTION_COLUMNS)]
+        if rows:
+            tables.append(make_option_table(rows))
+
+    return tables
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+Fixed, typed schema of scraped option rows. Strike, expiration date and
+option type are decoded from the OCC contract name, prices are float32,
+counts are int64, timestamps are int64 nanoseconds since epoch and repeated
+text is categorical.
+
+Timestamps are taken from the local wall time, i.e. pd.to_datetime() of a
+'Download DateTime' gives back the local time it was scraped at.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from option_parser import to_number
+
+SCHEMA = OrderedDict([
+    ('Symbol', 'category'),
+    ('Yahoo Symbol', 'category'),
+    ('Contract Name', 'object'),
+    ('Option Type', 'category'),
+    ('Strike', 'float32'),
+    ('Expiration Date', 'int64'),
+    ('Last Price', 'float32'),
+    ('Bid', 'float32'),
+    ('Ask', 'float32'),
+    ('Change', 'float32'),
+    ('% Change', 'float32'),
+    ('Volume', 'int64'),
+    ('Open Interest', 'int64'),
+    ('Implied Volatility', 'float32'),
+    ('Price @ DL Time', 'float32'),
+    ('Download DateTime', 'int64'),
+    ('Download Date', 'category'),
+    ('Download Time', 'category'),
+    ('Yahoo Time', 'category'),
+    ('Download Source', 'category')
+])
+
+OPTION_TYPES = ['Call', 'Put']
+
+# Root symbol, expiration YYMMDD, C or P and strike times 1000
+OCC_PATTERN = r'^(?P<root>.+?)(?P<date>\d{6})(?P<type>[CP])(?P<strike>\d{8})$'
+
+# pandas 2 only parses text with and without microseconds when told to
+_ISO8601 = ({'format': 'ISO8601'}
+            if int(pd.__version__.split('.')[0]) >= 2 else {})
+
+
+def decode_contract_names(names):
+    """Decode OCC contract names such as 'AAPL170317C00130000'
+
+    Parameters:
+    -----------
+    names : array-like of str
+
+    Return:
+    -------
+    decoded : DataFrame
+        'Option Type' as categorical, 'Strike' as float32 and
+        'Expiration Date' as int64 nanoseconds since epoch. Names that are
+        not OCC symbols give NaN, NaN and NaT as int64, i.e. the minimum
+        int64, respectively.
+    """
+
+    parts = pd.Series(names, dtype=object).str.extract(OCC_PATTERN)
+
+    option_type = pd.Categorical(
+        parts['type'].map({'C': 'Call', 'P': 'Put'}), categories=OPTION_TYPES)
+    strike = pd.to_numeric(parts['strike'], errors='coerce').values / 1000
+    expiry = pd.to_datetime(parts['date'], format='%y%m%d', errors='coerce')
+
+    return pd.DataFrame({
+        'Option Type': option_type,
+        'Strike': strike.astype(np.float32),
+        'Expiration Date': to_epochs(expiry)
+    })
+
+
+def to_float32(values):
+    """Numbers or Yahoo display strings to float32"""
+
+    values = np.asarray(values)
+    if values.dtype.kind not in 'fiub':
+        values = to_number(values)
+
+    return values.astype(np.float32)
+
+
+def to_int64(values):
+    """Numbers or Yahoo display strings to int64, with '-' and NaN as 0"""
+
+    values = np.asarray(values)
+    if values.dtype.kind not in 'iub':
+        if values.dtype.kind != 'f':
+            values = to_number(values)
+        values = np.nan_to_num(values)
+
+    return values.astype(np.int64)
+
+
+def to_epoch(value):
+    """datetime, Timestamp or datetime string to int64 ns since epoch"""
+
+    return pd.Timestamp(value).value
+
+
+def to_epochs(values):
+    """Timestamps to int64 ns since epoch
+
+    values may already be int64 ns, or datetime64 of any unit, datetimes or
+    text such as str(datetime), which leaves out zero microseconds. NaT
+    gives the minimum int64.
+    """
+
+    values = pd.Series(values)
+    if values.dtype.kind in 'iu':
+        return values.values.astype(np.int64)
+    if values.dtype.kind != 'M':
+        values = pd.to_datetime(values, **_ISO8601)
+
+    # pandas 3 may keep seconds or microseconds instead of ns
+    return values.values.astype('datetime64[ns]').view(np.int64)
+
+
+def normalize_table(df):
+    """Type the 10 columns of one scraped option table
+
+    Parameters:
+    -----------
+    df : DataFrame
+        An option table laid out as option_parser.OPTION_COLUMNS.
+
+    Return:
+    -------
+    table : DataFrame
+        The table columns of SCHEMA, including the ones decoded from
+        'Contract Name'.
+    """
+
+    decoded = decode_contract_names(df['Contract Name'].values)
+    table = pd.DataFrame({
+        'Contract Name': df['Contract Name'].values.astype(object),
+        'Option Type': decoded['Option Type'].values,
+        'Strike': decoded['Strike'].values,
+        'Expiration Date': decoded['Expiration Date'].values
+    })
+
+    for column in ['Last Price', 'Bid', 'Ask', 'Change', '% Change',
+                   'Implied Volatility']:
+        table[column] = to_float32(df[column].values)
+    for column in ['Volume', 'Open Interest']:
+        table[column] = to_int64(df[column].values)
+
+    return table
+
+
+def normalize_constants(constants):
+    """Type the per-table constant columns YahooScraper tags on a table
+
+    'Expiration Date' and 'Option Type' are left out since they are decoded
+    per row from 'Contract Name' instead.
+    """
+
+    constants = dict(constants)
+    constants.pop('Expiration Date', None)
+    constants.pop('Option Type', None)
+
+    if 'Price @ DL Time' in constants:
+        constants['Price @ DL Time'] = np.float32(
+            to_float32([constants['Price @ DL Time']])[0])
+    if 'Download DateTime' in constants:
+        constants['Download DateTime'] = np.int64(
+            to_epoch(constants['Download DateTime']))
+
+    return constants
+
+
+def _format_epochs(values, fmt):
+    """Text of int64 ns since epoch, formatting each distinct value once"""
+
+    codes, uniques = pd.factorize(values)
+    times = pd.DatetimeIndex(uniques)
+    text = np.asarray(times.strftime(fmt), dtype=object)
+    if fmt.endswith('.%f'): # As str(datetime), without zero microseconds
+        whole = np.asarray(times.microsecond == 0)
+        text[whole] = [x[:-7] for x in text[whole]]
+    text[np.asarray(times.isna())] = None
+
+    return text[codes]
+
+
+def to_text_format(df):
+    """df with 'Expiration Date' and 'Download DateTime' as text again
+
+    The data table in SQLite holds both as text, as they were scraped before
+    SCHEMA: 'March 17, 2017' and str(datetime.now()). Typed rows are written
+    in the same format, so that WHERE and GROUP BY on these columns work
+    across old and new rows. Other columns are left as they are.
+    """
+
+    formats = {'Expiration Date': '%B %d, %Y',
+               'Download DateTime': '%Y-%m-%d %H:%M:%S.%f'}
+    columns = [c for c in formats
+               if c in df.columns and df[c].dtype.kind in 'iu']
+    if not columns:
+        return df
+
+    df = df.copy()
+    for column in columns:
+        df[column] = _format_epochs(df[column].values, formats[column])
+
+    return df
+
+
+def normalize(df):
+    """Cast a whole DataFrame of scraped option data to SCHEMA
+
+    Works on raw data as well, e.g. rows read back from the SQLite table.
+    Columns missing from df are left out and columns not in SCHEMA are
+    dropped.
+    """
+
+    if not len(df):
+        return pd.DataFrame(columns=[c for c in SCHEMA if c in df.columns])
+
+    df = df.copy()
+    if 'Contract Name' in df.columns:
+        table_columns = ['Option Type', 'Strike', 'Expiration Date']
+        decoded = decode_contract_names(df['Contract Name'].values)
+        for column in table_columns:
+            df[column] = decoded[column].values
+
+    if ('Download DateTime' in df.columns
+            and df['Download DateTime'].dtype.kind not in 'iu'):
+        df['Download DateTime'] = to_epochs(df['Download DateTime'])
+
+    for column, dtype in SCHEMA.items():
+        if column not in df.columns:
+            continue
+        if dtype == 'float32':
+            df[column] = to_float32(df[column].values)
+        elif dtype == 'int64':
+            df[column] = to_int64(df[column].values)
+        elif dtype == 'category':
+            df[column] = df[column].astype('category')
+        else: # Not the str dtype of pandas 3
+            df[column] = df[column].astype(dtype)
+
+    return df[[c for c in SCHEMA if c in df.columns]]
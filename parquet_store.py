@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar storage of scraped option data as typed Parquet files partitioned by
+'Download Date' and 'Symbol', with background compaction of small files and
+a reader that pushes date, symbol and column filters down to the files.
+"""
+
+import os
+import threading
+import uuid
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from option_parser import to_number
+
+PARTITION_COLUMNS = ['Download Date', 'Symbol']
+
+# Columns stored as numbers, everything else is stored as text
+FLOAT_COLUMNS = ['Strike', 'Last Price', 'Bid', 'Ask', 'Change', '% Change',
+                 'Implied Volatility', 'Price @ DL Time']
+INT_COLUMNS = ['Volume', 'Open Interest']
+
+
+def to_arrow(df):
+    """Convert scraped option data to an Arrow table of fixed column types"""
+
+    arrays, names = [], []
+    for column in df.columns:
+        values = df[column]
+        if column in FLOAT_COLUMNS:
+            if values.dtype.kind not in 'fiu':
+                values = to_number(values.values)
+            array = pa.array(np.asarray(values, dtype=np.float64),
+                             type=pa.float64())
+        elif column in INT_COLUMNS:
+            if values.dtype.kind not in 'fiu':
+                values = to_number(values.values)
+            array = pa.array(np.nan_to_num(np.asarray(
+                values, dtype=np.float64)).astype(np.int64), type=pa.int64())
+        elif values.dtype.kind in 'fiub':
+            array = pa.array(values.values)
+        else:
+            array = pa.array(values.astype(str).values, type=pa.string())
+        arrays.append(array)
+        names.append(column)
+
+    return pa.Table.from_arrays(arrays, names=names)
+
+
+class ParquetStore:
+    """Partitioned Parquet Store of Option Data
+
+    Files are laid out as root/Download Date=.../Symbol=.../*.parquet. Each
+    write() adds one small file per partition, and compact() merges the
+    small files of a partition into one.
+
+    Parameters:
+    -----------
+    root : str, a folder path
+        Root folder of the dataset. Created if it does not exist.
+
+    min_files : int, positive, default 8
+        A partition is compacted once it has at least this many files.
+    """
+
+    def __init__(self, root, min_files=8):
+        self.root = root
+        self.min_files = min_files
+        self._compactor = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock() # One compaction at a time
+
+        os.makedirs(root, exist_ok=True)
+
+    def _partitioning(self):
+        return ds.partitioning(
+            pa.schema([(c, pa.string()) for c in PARTITION_COLUMNS]),
+            flavor='hive')
+
+    def write(self, df):
+        """Append a DataFrame of scraped option data
+
+        Files are written under hidden names and renamed once complete, so
+        that neither read() nor compact(), maybe of another process, opens a
+        file that is still being written.
+        """
+
+        if not len(df):
+            return
+
+        written = []
+        pq.write_to_dataset(
+            to_arrow(df), self.root, partition_cols=PARTITION_COLUMNS,
+            basename_template='.part-' + uuid.uuid4().hex + '-{i}.parquet',
+            file_visitor=lambda f: written.append(f.path))
+
+        for path in written:
+            dirpath, name = os.path.split(path)
+            os.replace(path, os.path.join(dirpath, name[1:]))
+
+    def _partition_dirs(self):
+        """Folders holding the files of each partition"""
+
+        for dirpath, _, filenames in os.walk(self.root):
+            files = [os.path.join(dirpath, f) for f in filenames
+                     if f.endswith('.parquet') and not f.startswith('.')]
+            if files:
+                yield dirpath, sorted(files)
+
+    def compact(self):
+        """Merge the small files of every partition with enough of them
+
+        The merged file is moved in place before the small files are removed,
+        so a reader running at the same moment may see some rows twice but
+        never misses any.
+
+        Return:
+        -------
+        num_compacted : int
+            Number of partitions compacted.
+        """
+
+        num_compacted = 0
+        with self._lock:
+            for dirpath, files in list(self._partition_dirs()):
+                if len(files) < self.min_files:
+                    continue
+
+                schema = pa.unify_schemas([pq.read_schema(f) for f in files])
+                table = ds.dataset(files, schema=schema,
+                                   format='parquet').to_table()
+                name = 'compact-' + uuid.uuid4().hex + '.parquet'
+                tmp_path = os.path.join(dirpath, '.' + name)
+                pq.write_table(table, tmp_path)
+                os.replace(tmp_path, os.path.join(dirpath, name))
+
+                for f in files:
+                    os.remove(f)
+                num_compacted += 1
+
+        return num_compacted
+
+    def start_compaction(self, interval=300):
+        """Run compact() every interval seconds in a daemon thread"""
+
+        if self._compactor is not None:
+            return
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.compact()
+                except Exception as inst:
+                    print('Compaction failed: ' + repr(inst))
+
+        self._stop.clear()
+        self._compactor = threading.Thread(target=run, daemon=True)
+        self._compactor.start()
+
+    def stop_compaction(self):
+        """Stop the background compaction thread"""
+
+        if self._compactor is not None:
+            self._stop.set()
+            self._compactor.join()
+            self._compactor = None
+
+    def read(self, start_date=None, end_date=None, symbols=None,
+             columns=None, filter=None):
+        """Read option data with predicates pushed down to the files
+
+        Partitions outside the dates and symbols are never opened, and the
+        remaining filter is checked against row group statistics first.
+
+        Parameters:
+        -----------
+        start_date, end_date : str, 'YYYY-MM-DD', default None
+            Inclusive range of 'Download Date'. None means unbounded.
+
+        symbols : list of str, default None
+            Symbols to read. None means all.
+
+        columns : list of str, default None
+            Columns to read. None means all.
+
+        filter : pyarrow.dataset.Expression, default None
+            Extra row filter, e.g. ds.field('Volume') > 0.
+
+        Return:
+        -------
+        df : DataFrame
+        """
+
+        dataset = ds.dataset(self.root, format='parquet',
+                             partitioning=self._partitioning())
+
+        expression = filter
+        predicates = []
+        if start_date is not None:
+            predicates.append(ds.field('Download Date') >= start_date)
+        if end_date is not None:
+            predicates.append(ds.field('Download Date') <= end_date)
+        if symbols is not None:
+            predicates.append(ds.field('Symbol').isin(list(symbols)))
+        for predicate in predicates:
+            expression = (predicate if expression is None
+                          else expression & predicate)
+
+        table = dataset.to_table(columns=columns, filter=expression)
+        return table.to_pandas()
@@ -4,6 +4,11 @@ Created on Mon Feb 13 20:57:22 2017
 
 Post analysis on option data quality and a possible change to update frequency
 
+    python post_analysis.py [start date] [end date]
+
+Dates are 'YYYY-MM-DD' and default to today. The metrics themselves live in
+analytics.py.
+
 @author: Jingmin Zhang
 """
 
@@ -11,112 +16,66 @@ PROJECT_PATH = (r'C:\Users\GlowingToilet\Google Drive\Projects'
                 + r'\yahoo-option-scraper')
 
 from configparser import ConfigParser
-import pandas as pd
-import sqlite3
-import numpy as np
-from datetime import datetime, time, timedelta
+import sys
+from datetime import datetime
 import seaborn as sns
 import matplotlib.pyplot as plt
 
-# Read config
-config_path = PROJECT_PATH + '/config_nasdaq100.ini'
-config = ConfigParser()
-config.read(config_path)
-
-# Get the most recent symbol list from database
-sql = ('SELECT Symbol FROM '
-       + config['CURRENT']['SymbolTableName']
-       + ' WHERE Date in ('
-       + ' SELECT max(Date) FROM '
-       + config['CURRENT']['SymbolTableName']
-       + ')')
-
-conn = sqlite3.connect(config['CURRENT']['DatabasePath'])
-symbols = pd.read_sql(sql, conn)
-conn.close()
-
-# Add bin number to the symbols
-batch_size = int(config['CURRENT']['BatchSize'])
-num_bins = np.ceil(symbols.shape[0] / batch_size)
-bins = pd.cut(symbols.index, num_bins, labels=False)
-
-symbols = symbols.merge(pd.DataFrame(bins, columns=['Bin']), 
-                        left_index=True, right_index=True)
-
-
-# Loop through each symbol to get following statistics:
-#   1. Total option volume by timestamp
-#   2. Total volume by EOD
-#   3. Number of unique timestamps (# of pulls from Yahoo)
-#   4. Min and max intervals between nearest positive volumes
-
-# 1. Total optiona volume by timestamp
-sql = ('SELECT Symbol, sum(Volume) as Volume, "Download Time" FROM '
-       + config['CURRENT']['DataTableName']
-       + ' WHERE "Download Date" = "2017-02-21"'
-       + ' GROUP BY Symbol, "Download Time"')
-
-conn = sqlite3.connect(config['CURRENT']['DatabasePath'])
-vol_by_time = pd.read_sql(sql, conn)
-conn.close()
-
-# Make a heat map to visualize the data
-vol_by_15 = pd.DataFrame()
-vol_by_time['Time'] = vol_by_time['Download Time'].apply(
-        lambda x: datetime.strptime(x, '%H:%M:%S.%f').time())
-
-base_date = datetime.today()
-lower_bound = datetime.combine(base_date, time(9, 45))
-
-while lower_bound.time() <= time(16, 1):
-    upper_bound = lower_bound + timedelta(0, 900)
-    crit = (lambda x: np.bitwise_and(x['Time'] > lower_bound.time(),
-                                     x['Time'] <= upper_bound.time()))
-    df = pd.DataFrame(vol_by_time.loc[crit].pivot_table(
-            values='Volume', columns='Symbol', aggfunc=np.sum))
-    df['Time'] = str(lower_bound.time())
-    vol_by_15 = vol_by_15.append(df)
-    
-    lower_bound += timedelta(0, 900)
-    
-vol_by_15 = vol_by_15.pivot(None, 'Time', 'Volume')
-vol_by_15 = vol_by_15.merge(symbols, how='left', left_index=True, 
-                            right_on='Symbol')
-vol_by_15 = vol_by_15.sort_values(by='Bin')
-vol_by_15.index = vol_by_15['Symbol']
-vol_by_15 = vol_by_15.drop(['Bin', 'Symbol'], axis=1)
-
-score_0_1 = lambda x: x / x.max()
-vol_by_15 = vol_by_15.apply(np.sqrt)
-vol_by_15 = vol_by_15.apply(score_0_1, axis=1)
-vol_by_15 = vol_by_15.fillna(-1)
-
-plt.figure(figsize=(10, 20))
-sns.heatmap(vol_by_15)
-
-# 2. Total volume by EOD
-vol_by_eod = vol_by_time.pivot_table(values='Volume', 
-                                     columns=['Symbol'], 
-                                     aggfunc=np.sum)
-
-# 3. Number of unique timestamps (# of pulls from Yahoo)
-unique_pulls = vol_by_time.pivot_table(values='Volume',
-                                       columns=['Symbol'],
-                                       aggfunc=len)
-
-# 4. Min and max intervals between nearest positive volumes
-# The following code is criminally slow...Need to use groupby
-vol_by_time['tag'] = np.nan
-for i in range(vol_by_time.shape[0]):
-    if (not i or 
-        vol_by_time['Symbol'][i - 1] != vol_by_time['Symbol'][i]):
-        tag = 0
-        
-    if vol_by_time['Volume'][i]:
-        tag += 1
-        
-    vol_by_time['tag'][i] = tag
-
-
-
-    
\ No newline at end of file
+import analytics
+from rollups import Rollups
+from sqlite_store import SQLiteStore
+
+if __name__ == '__main__':
+    # Read config
+    config_path = PROJECT_PATH + '/config_nasdaq100.ini'
+    config = ConfigParser()
+    config.read(config_path)
+
+    start_date = (sys.argv[1] if len(sys.argv) > 1
+                  else str(datetime.now().date()))
+    end_date = sys.argv[2] if len(sys.argv) > 2 else start_date
+
+    # Get the most recent symbol list from database
+    sql = ('SELECT Symbol FROM '
+           + config['CURRENT']['SymbolTableName']
+           + ' WHERE Date in ('
+           + ' SELECT max(Date) FROM '
+           + config['CURRENT']['SymbolTableName']
+           + ')')
+
+    store = SQLiteStore.open(config['CURRENT']['DatabasePath'])
+    symbols = store.read(sql)
+
+    # Add bin number to the symbols
+    bins = analytics.symbol_bins(symbols['Symbol'],
+                                 int(config['CURRENT']['BatchSize']))
+
+    # Following statistics of each symbol:
+    #   1. Total option volume by timestamp
+    #   2. Total volume by EOD
+    #   3. Number of unique timestamps (# of pulls from Yahoo)
+    #   4. Min and max intervals between nearest positive volumes
+
+    # 1. Total optiona volume by timestamp
+    vol_by_time = analytics.load_volume_by_time(config, start_date, end_date)
+
+    # Make a heat map to visualize the data, 2. Total volume by EOD and
+    # 3. Number of unique timestamps (# of pulls from Yahoo)
+    if config['CURRENT'].getboolean('Rollups', False):
+        rollups = Rollups.from_config(config)
+        vol_by_15 = rollups.volume_by_bucket(start_date, end_date, '15m')
+        vol_by_eod = rollups.eod_volume(start_date, end_date)
+        unique_pulls = rollups.pull_counts(start_date, end_date)
+    else:
+        vol_by_15 = analytics.volume_by_bucket(vol_by_time, '15min')
+        vol_by_eod = analytics.eod_volume(vol_by_time)
+        unique_pulls = analytics.pull_counts(vol_by_time)
+
+    vol_by_15 = analytics.heatmap_scores(vol_by_15, bins)
+    plt.figure(figsize=(10, 20))
+    sns.heatmap(vol_by_15)
+
+    # 4. Min and max intervals between nearest positive volumes
+    intervals = analytics.positive_volume_intervals(vol_by_time)
+
+    plt.show()
@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+"""
+Adaptive refresh scheduling of option chains. Each (symbol, expiration date)
+is refreshed at a rate proportional to its recent volume activity and to how
+close it is to expiration, within a fixed budget of page fetches per minute.
+This is the change to update frequency post_analysis.py was looking into.
+"""
+
+import heapq
+import itertools
+import time
+
+import numpy as np
+
+
+class RefreshScheduler:
+    """Priority Scheduler of Option Chain Refreshes
+
+    The score of a chain is (volume per minute + floor) / sqrt(1 + days to
+    expiration), with volume per minute smoothed over recent pulls. The
+    budget is shared out in proportion to the scores, so a chain with a given
+    share of the total score is refreshed every 1 / (budget * share)
+    minutes, clipped to [min_interval, max_interval]. Scores depend on the
+    time to expiration, so the total is recomputed when it is needed.
+
+    due() never hands out more than the budget allows, and whatever is left
+    waits for the next call. Symbols not scheduled yet are let in by admit()
+    out of the same budget, and a symbol that yields no chains is deferred
+    with an exponential backoff. Pages fetched beyond what was handed out,
+    e.g. the expiration pages of a symbol admitted whole, are taken off the
+    budget by charge().
+
+    Parameters:
+    -----------
+    budget : float, positive
+        Page fetches per minute across all chains.
+
+    min_interval : float, positive, default 60
+        Seconds between refreshes of the most active chain at most.
+
+    max_interval : float, positive, default 1800
+        Seconds between refreshes of the quietest chain at most.
+
+    smoothing : float, (0, 1], default 0.3
+        Weight of the latest pull in the smoothed volume per minute.
+
+    floor : float, positive, default 1
+        Volume per minute added to every chain so quiet chains still get a
+        share of the budget.
+    """
+
+    def __init__(self, budget, min_interval=60, max_interval=1800,
+                 smoothing=0.3, floor=1):
+        self.budget = budget
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.smoothing = smoothing
+        self.floor = floor
+
+        # (symbol, expiry) -> [activity, expiry time, last pull, version]
+        self._chains = {}
+        self._heap = [] # (due time, sequence, version, key)
+        self._counter = itertools.count()
+        self._tokens = budget
+        self._last_refill = None
+        self._deferred = {} # Symbol -> (retry time, backoff in seconds)
+
+    def __len__(self):
+        return len(self._chains)
+
+    def __contains__(self, key):
+        return key in self._chains
+
+    @property
+    def symbols(self):
+        """Symbols with at least one chain scheduled"""
+        return set(key[0] for key in self._chains)
+
+    def _refill(self, now):
+        """Add the fetches earned since the last call to the budget"""
+
+        if self._last_refill is not None:
+            self._tokens = min(self.budget, self._tokens
+                               + (now - self._last_refill) * self.budget / 60)
+        self._last_refill = now
+
+    def _score(self, activity, expiry_time, now):
+        days = max(expiry_time - now, 0) / 86400
+        return (activity + self.floor) / np.sqrt(1 + days)
+
+    def total_score(self, now=None):
+        """Sum of the scores of all chains at now"""
+
+        now = time.time() if now is None else now
+        if not self._chains:
+            return 0.0
+
+        chains = np.array([chain[:2] for chain in self._chains.values()],
+                          dtype=np.float64)
+        days = np.maximum(chains[:, 1] - now, 0) / 86400
+        return float(np.sum((chains[:, 0] + self.floor) / np.sqrt(1 + days)))
+
+    def interval(self, symbol, expiry, now=None, total_score=None):
+        """Seconds until the next refresh of a chain at its current score
+
+        total_score is total_score(now), to be computed once when asking for
+        many chains at the same time.
+        """
+
+        now = time.time() if now is None else now
+        if total_score is None:
+            total_score = self.total_score(now)
+        activity, expiry_time = self._chains[(symbol, expiry)][:2]
+
+        share = (self._score(activity, expiry_time, now)
+                 / max(total_score, 1e-12))
+        interval = 60 / max(self.budget * share, 1e-12)
+
+        return float(np.clip(interval, self.min_interval, self.max_interval))
+
+    def _push(self, key, due_time):
+        chain = self._chains[key]
+        chain[3] += 1
+        heapq.heappush(self._heap,
+                       (due_time, next(self._counter), chain[3], key))
+
+    def add(self, symbol, expiry, now=None):
+        """Start scheduling a chain that was just pulled
+
+        Chains are added once their symbol was scraped whole, see admit(),
+        so a chain is first due after its interval.
+
+        Parameters:
+        -----------
+        symbol : str
+
+        expiry : int
+            Expiration date as epoch seconds, which is also the value of
+            &date= in the Yahoo URL.
+        """
+
+        key = (symbol, int(expiry))
+        if key in self._chains:
+            return
+
+        now = time.time() if now is None else now
+        self._chains[key] = [0.0, int(expiry), None, 0]
+        self._push(key, now + self.interval(*key, now))
+
+    def remove(self, symbol, expiry):
+        """Stop scheduling a chain"""
+
+        self._chains.pop((symbol, int(expiry)), None)
+
+    def sync(self, symbol, expiries, now=None):
+        """Make the chains of a symbol match its current expiration dates"""
+
+        expiries = set(int(x) for x in expiries)
+        if expiries:
+            self._deferred.pop(symbol, None)
+        for key in [k for k in self._chains if k[0] == symbol]:
+            if key[1] not in expiries:
+                self.remove(*key)
+        for expiry in expiries:
+            self.add(symbol, expiry, now)
+
+    def _observe(self, key, volume, now):
+        """Update the activity of a chain. True if it needs rescheduling"""
+
+        chain = self._chains.get(key)
+        if chain is None:
+            return False
+
+        last_fetch = chain[2]
+        chain[2] = now
+        if last_fetch is None: # First pull carries the whole day's volume
+            return False
+
+        minutes = max((now - last_fetch) / 60, 1 / 60)
+        chain[0] = ((1 - self.smoothing) * chain[0]
+                    + self.smoothing * volume / minutes)
+        return True
+
+    def observe(self, symbol, expiry, volume, now=None):
+        """Feed back the incremental volume seen by the latest pull
+
+        Parameters:
+        -----------
+        symbol : str
+
+        expiry : int
+            Expiration date as epoch seconds.
+
+        volume : float
+            Volume traded since the previous pull of the chain.
+        """
+
+        key = (symbol, int(expiry))
+        now = time.time() if now is None else now
+        if self._observe(key, volume, now):
+            self._push(key, now + self.interval(*key, now))
+
+    def due(self, now=None):
+        """Chains to refresh now, within the budget
+
+        Return:
+        -------
+        dates : dict
+            Symbol -> list of expiration dates as epoch seconds, ready to be
+            passed to YahooScraper.scrape_all(dates=...).
+        """
+
+        now = time.time() if now is None else now
+        self._refill(now)
+        total_score = self.total_score(now)
+
+        dates = {}
+        while self._heap and self._heap[0][0] <= now and self._tokens >= 1:
+            _, _, version, key = heapq.heappop(self._heap)
+            chain = self._chains.get(key)
+            if chain is None or chain[3] != version: # Stale entry
+                continue
+
+            if chain[1] < now - 86400: # Expired
+                self.remove(*key)
+                continue
+
+            self._tokens -= 1
+            dates.setdefault(key[0], []).append(key[1])
+
+            # Keep it scheduled even if the pull yields nothing to observe
+            self._push(key, now + self.interval(*key, now, total_score))
+
+        return dates
+
+    def admit(self, symbols, now=None):
+        """Symbols without chains to scrape whole now, within the budget
+
+        Each symbol admitted costs one fetch up front for its base page, the
+        one that lists its expiration dates. Its other pages are only known
+        once it is scraped, so charge() them then. Scheduled symbols and
+        symbols deferred until later are left out.
+
+        Parameters:
+        -----------
+        symbols : list of str
+
+        Return:
+        -------
+        admitted : list of str
+        """
+
+        now = time.time() if now is None else now
+        self._refill(now)
+
+        scheduled = self.symbols
+        admitted = []
+        for symbol in symbols:
+            if self._tokens < 1:
+                break
+            if (symbol in scheduled
+                    or self._deferred.get(symbol, (0, 0))[0] > now):
+                continue
+            self._tokens -= 1
+            admitted.append(symbol)
+
+        return admitted
+
+    def charge(self, pages, now=None):
+        """Take the pages fetched beyond what was let in off the budget
+
+        The budget may go below zero, and nothing is let in until it has
+        been earned back. A negative number of pages gives back fetches that
+        were let in but not made.
+        """
+
+        now = time.time() if now is None else now
+        self._refill(now)
+        self._tokens = min(self.budget, self._tokens - pages)
+
+    def defer(self, symbol, now=None):
+        """Back off from a symbol that yielded no chains, e.g. not found
+
+        It is not admitted again for min_interval seconds, doubling every
+        time it is deferred in a row up to max_interval.
+        """
+
+        now = time.time() if now is None else now
+        backoff = self._deferred.get(symbol, (0, 0))[1]
+        backoff = min(max(2 * backoff, self.min_interval), self.max_interval)
+        self._deferred[symbol] = (now + backoff, backoff)
+
+    def observe_frame(self, df, now=None):
+        """observe() every chain in scraped data with incremental 'Volume'
+
+        df needs 'Symbol', 'Expiration Date' as int64 epoch ns (see
+        option_schema.SCHEMA) and 'Volume'.
+        """
+
+        if not len(df):
+            return
+
+        now = time.time() if now is None else now
+        volume = df.groupby(
+            [df['Symbol'].astype(str),
+             df['Expiration Date'].values // 10**9])['Volume'].sum()
+        keys = [] # Chains to reschedule
+        for (symbol, expiry), value in volume.items():
+            key = (symbol, int(expiry))
+            if self._observe(key, value, now):
+                keys.append(key)
+
+        total_score = self.total_score(now)
+        for key in keys:
+            self._push(key, now + self.interval(*key, now, total_score))
@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+"""
+Offline record and replay of Yahoo option pages, so the scraper can be
+measured and debugged without hitting Yahoo. Responses are recorded as they
+came, base pages, every &date= page, redirects to the lookup page and random
+404 pages included, into a FixtureStore folder. A ReplayServer serves them
+back on localhost with optional latency and injected failures, and any
+backend pointed at its url scrapes them as if they were Yahoo.
+
+    python replay.py record fixtures json AAPL MSFT
+    python replay.py serve fixtures 8000 [latency] [error rate]
+"""
+
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import requests
+
+from fetch_backends import (FetchError, option_url, parse_option_text,
+                            YAHOO_API_URL, YAHOO_WEB_URL)
+
+
+def request_path(url):
+    """Path and query of url, the key of a response in a FixtureStore"""
+
+    parts = urlsplit(url)
+    return parts.path + ('?' + parts.query if parts.query else '')
+
+
+class FixtureStore:
+    """Folder of Recorded Responses
+
+    index.json maps the path and query of each request to its status code,
+    content type, redirect location and body file. Bodies are stored in
+    their own files named by a hash of the path.
+
+    Parameters:
+    -----------
+    root : str, a folder path
+        Created if it does not exist.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+        self.index = {}
+        if os.path.isfile(self._index_path()):
+            with open(self._index_path()) as f:
+                self.index = json.load(f)
+
+    def _index_path(self):
+        return os.path.join(self.root, 'index.json')
+
+    def __len__(self):
+        return len(self.index)
+
+    def put(self, path, status, body=b'', content_type='text/html',
+            location=None, save=True):
+        """Store the response to path
+
+        Parameters:
+        -----------
+        path : str
+            Path and query of the request, see request_path().
+
+        status : int
+            HTTP status code.
+
+        body : bytes or str, default b''
+
+        content_type : str, default 'text/html'
+
+        location : str, default None
+            Path and query a redirect points to.
+
+        save : boolean, default True
+            Rewrite index.json right away. Call save() after a batch of puts
+            with save=False otherwise.
+        """
+
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+
+        name = None
+        if body:
+            name = hashlib.sha1(path.encode('utf-8')).hexdigest() + '.body'
+            with open(os.path.join(self.root, name), 'wb') as f:
+                f.write(body)
+
+        with self._lock:
+            self.index[path] = {'status': status, 'type': content_type,
+                                'location': location, 'file': name}
+        if save:
+            self.save()
+
+    def save(self):
+        """Write index.json"""
+
+        with self._lock:
+            tmp_path = self._index_path() + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self.index, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self._index_path())
+
+    def get(self, path):
+        """Recorded response to path as a dict with its 'body', or None"""
+
+        entry = self.index.get(path)
+        if entry is None:
+            return None
+
+        entry = dict(entry)
+        entry['body'] = b''
+        if entry['file'] is not None:
+            with open(os.path.join(self.root, entry['file']), 'rb') as f:
+                entry['body'] = f.read()
+
+        return entry
+
+
+def record(store, symbols, mode='json', base_url=None, session=None,
+           timeout=10):
+    """Record the option pages of symbols from Yahoo into store
+
+    The base page of each symbol is recorded first and every expiration date
+    it lists after it. Redirects are recorded without following them, then
+    their target is recorded too. Responses are stored whatever their
+    status, so random 404 pages end up in the fixtures as well.
+
+    Parameters:
+    -----------
+    store : FixtureStore
+
+    symbols : list of str
+
+    mode : str, 'json' or 'html', default 'json'
+        See fetch_backends.HttpBackend.
+
+    base_url : str, default None
+        Host to record from. Defaults to Yahoo's host of the mode.
+
+    session : requests.Session, default None
+
+    timeout : float, positive, default 10
+        Seconds to wait for each response.
+
+    Return:
+    -------
+    num_pages : int
+        Number of responses recorded.
+    """
+
+    if base_url is None:
+        base_url = YAHOO_API_URL if mode == 'json' else YAHOO_WEB_URL
+    base_url = base_url.rstrip('/')
+    if session is None:
+        session = requests.Session()
+        session.headers['User-Agent'] = 'Mozilla/5.0'
+
+    recorded = []
+
+    def get(url):
+        """Record url and the redirects it leads to
+
+        Returns the last response and its url.
+        """
+
+        for _ in range(5):
+            response = session.get(url, timeout=timeout,
+                                   allow_redirects=False)
+            location = response.headers.get('Location')
+            if location is not None:
+                location = request_path(location)
+            store.put(request_path(url), response.status_code,
+                      response.content,
+                      response.headers.get('Content-Type', 'text/html'),
+                      location, save=False)
+            recorded.append(url)
+            if location is None or not response.is_redirect:
+                break
+            url = base_url + location
+
+        return response, url
+
+    for symbol in symbols:
+        response, url = get(option_url(base_url, mode, symbol))
+        try:
+            page = parse_option_text(response.text, mode)
+        except FetchError:
+            print('No option page for {}, recorded as is'.format(symbol))
+            continue
+
+        # Date pages are under the ticker a renamed symbol redirected to
+        path = urlsplit(url).path.split('/')
+        symbol = path[-1] if mode == 'json' else path[-2]
+        for date, _ in page.expiration_dates:
+            get(option_url(base_url, mode, symbol, date))
+
+    store.save()
+    return len(recorded)
+
+
+class ReplayServer:
+    """Local HTTP Server of a FixtureStore
+
+    Requests not in the store get a 404 like an unknown symbol would. On
+    top of the recorded responses, every request can be delayed and made to
+    fail at random, like Yahoo on a bad day.
+
+    Parameters:
+    -----------
+    store : FixtureStore
+
+    latency : float, non-negative, default 0
+        Seconds every response is delayed by.
+
+    jitter : float, non-negative, default 0
+        Up to this many more seconds of delay, drawn uniformly.
+
+    error_rate : float, in [0, 1], default 0
+        Chance of answering 503 instead of the recorded response.
+
+    not_found_rate : float, in [0, 1], default 0
+        Chance of answering 404 instead, like Yahoo's random 404 pages.
+
+    seed : int, default None
+        Seed of the failures and jitter.
+
+    port : int, default 0
+        Port to listen on. 0 picks a free one.
+
+    Attributes:
+    -----------
+    stats : dict
+        Number of 'Requests', 'Errors' and 'Not Found' answered.
+    """
+
+    def __init__(self, store, latency=0, jitter=0, error_rate=0,
+                 not_found_rate=0, seed=None, port=0):
+        self.store = store
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.not_found_rate = not_found_rate
+        self.port = port
+
+        self.stats = {'Requests': 0, 'Errors': 0, 'Not Found': 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self):
+        """Base url to point a backend at"""
+
+        return 'http://127.0.0.1:{}'.format(self._server.server_address[1])
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _draw(self):
+        """Delay and injected status of the next response"""
+
+        with self._lock:
+            self.stats['Requests'] += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            draw = self._random.random()
+            status = None
+            if draw < self.error_rate:
+                status = 503
+                self.stats['Errors'] += 1
+            elif draw < self.error_rate + self.not_found_rate:
+                status = 404
+                self.stats['Not Found'] += 1
+
+        return delay, status
+
+    def start(self):
+        """Serve on a daemon thread"""
+
+        replay = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1' # Keep-alive like Yahoo
+            disable_nagle_algorithm = True # Headers and body sent apart
+
+            def do_GET(self):
+                delay, status = replay._draw()
+                if delay:
+                    time.sleep(delay)
+
+                entry = replay.store.get(self.path)
+                if status is not None or entry is None:
+                    self.send_response(status or 404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+
+                self.send_response(entry['status'])
+                self.send_header('Content-Type', entry['type'])
+                if entry['location'] is not None:
+                    self.send_header('Location', entry['location'])
+                self.send_header('Content-Length', str(len(entry['body'])))
+                self.end_headers()
+                self.wfile.write(entry['body'])
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', self.port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever,
+                         daemon=True).start()
+
+    def stop(self):
+        """Stop serving"""
+
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 3 and sys.argv[1] == 'record':
+        store = FixtureStore(sys.argv[2])
+        num_pages = record(store, sys.argv[4:], mode=sys.argv[3])
+        print('Recorded {0} responses into {1}'.format(num_pages,
+                                                       sys.argv[2]))
+    elif len(sys.argv) > 3 and sys.argv[1] == 'serve':
+        server = ReplayServer(
+            FixtureStore(sys.argv[2]), port=int(sys.argv[3]),
+            latency=float(sys.argv[4]) if len(sys.argv) > 4 else 0,
+            error_rate=float(sys.argv[5]) if len(sys.argv) > 5 else 0)
+        server.start()
+        print('Replaying {0} responses at {1}'.format(len(server.store),
+                                                      server.url))
+        while True:
+            time.sleep(60)
+    else:
+        print(__doc__)
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Retry and readiness policy of the crawl path. Retries back off exponentially
+with full jitter and are bounded both overall and per error class, and
+browser waits poll the page itself (document state, URL changes) instead of
+sleeping a fixed number of seconds.
+"""
+
+import random
+import time
+
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.support.ui import WebDriverWait
+
+from instrumentation import REGISTRY
+
+
+class RetryPolicy:
+    """Bounded Retries with Jittered Exponential Backoff
+
+    Parameters:
+    -----------
+    max_attempts : int, positive, default 3
+        Max number of attempts of a call, whatever the errors.
+
+    base_delay : float, non-negative, default 0.5
+        Seconds of backoff before the first retry, doubling afterwards.
+
+    max_delay : float, non-negative, default 8
+        Cap of the backoff in seconds.
+
+    budgets : dict, default None
+        Exception class -> max number of attempts that may fail with it.
+        Classes not in it get max_attempts.
+
+    jitter : boolean, default True
+        If True, each backoff is drawn uniformly from [0, backoff] so that
+        workers retrying at once spread out.
+
+    metrics : Metrics, default None
+        Counts retries in 'retries_total' by error. Defaults to
+        instrumentation.REGISTRY.
+    """
+
+    def __init__(self, max_attempts=3, base_delay=0.5, max_delay=8,
+                 budgets=None, jitter=True, metrics=None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budgets = budgets if budgets is not None else {}
+        self.jitter = jitter
+        self.metrics = metrics if metrics is not None else REGISTRY
+
+    def delay(self, attempt):
+        """Seconds to back off after the given failed attempt (0-based)"""
+
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return random.uniform(0, delay) if self.jitter else delay
+
+    def budget(self, error):
+        """Max number of attempts that may fail with error"""
+
+        for cls in type(error).__mro__:
+            if cls in self.budgets:
+                return min(self.budgets[cls], self.max_attempts)
+        return self.max_attempts
+
+    def sleep(self, attempt):
+        """Back off after the given failed attempt"""
+
+        time.sleep(self.delay(attempt))
+
+    def record(self, error):
+        """Count a retry after error, an exception or a short description"""
+
+        if not isinstance(error, str):
+            error = type(error).__name__
+        self.metrics.inc('retries_total', error=error)
+
+    def call(self, func, retry_on=(Exception,), before_retry=None):
+        """Call func() until it returns or the budget of its error runs out
+
+        Parameters:
+        -----------
+        func : callable
+            Called without arguments.
+
+        retry_on : tuple of exception classes, default (Exception,)
+            Errors worth retrying. Anything else propagates right away.
+
+        before_retry : callable, default None
+            Called with the error after backing off and before the next
+            attempt, e.g. to refresh the page.
+
+        Return:
+        -------
+        The return value of func(). The last error is raised when attempts
+        run out.
+        """
+
+        failures = {}
+        for attempt in range(self.max_attempts):
+            try:
+                return func()
+            except retry_on as inst:
+                cls = type(inst)
+                failures[cls] = failures.get(cls, 0) + 1
+                if (failures[cls] >= self.budget(inst)
+                        or attempt + 1 == self.max_attempts):
+                    raise
+
+                self.record(inst)
+                self.sleep(attempt)
+                if before_retry is not None:
+                    before_retry(inst)
+
+
+def wait_until(browser, condition, timeout, poll=0.1):
+    """WebDriverWait on condition. Returns its value or None on timeout"""
+
+    try:
+        return WebDriverWait(browser, timeout, poll_frequency=poll).until(
+            condition)
+    except TimeoutException:
+        return None
+
+
+def wait_for_url_change(browser, url, timeout):
+    """Wait until the browser navigated away from url. Returns the new url"""
+
+    def changed(b):
+        current = b.current_url
+        if current != url and (b.execute_script('return document.readyState')
+                               == 'complete'):
+            return current
+        return False
+
+    return wait_until(browser, changed, timeout)
@@ -0,0 +1,381 @@
+# -*- coding: utf-8 -*-
+"""
+Pre-aggregated rollups of the data table, kept up to date as data is saved,
+so that volume per bucket, EOD volume and pull counts are read from small
+tables instead of GROUP BYs over every raw row. There is one rollup table
+per bucket size, 1 minute, 15 minutes and 1 day, and per level, contract or
+symbol, next to the data table in the same database:
+
+    data_nasdaq100_15m_symbol (Bucket, Symbol, Volume, Pulls, ...)
+
+Buckets are int64 ns since epoch of their start in local wall time, like
+'Download DateTime'. Intraday buckets hold the pulls after their start up to
+and including their end, as analytics.volume_by_bucket() does. Day buckets
+hold the pulls of their download date instead, from midnight included to
+the next midnight excluded. Rebuild the
+rollups of past days from the data table with
+
+    python rollups.py [start date] [end date]
+"""
+
+import os
+import sys
+from collections import OrderedDict
+from configparser import ConfigParser
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from option_schema import to_epochs
+from sqlite_store import SQLiteStore
+
+PROJECT_PATH = os.path.dirname(os.path.abspath(__file__))
+
+# Rollup name -> bucket size
+FREQS = OrderedDict([('1m', '1min'), ('15m', '15min'), ('1d', '1D')])
+
+# Rollup level -> key columns next to 'Bucket'
+LEVELS = OrderedDict([('contract', ['Symbol', 'Contract Name']),
+                      ('symbol', ['Symbol'])])
+
+# How a rollup row already stored takes in the same bucket of later data.
+# A pull split over two writes, e.g. by StreamWriter, is only counted once.
+_LATEST = ('CASE WHEN excluded."Last Pull" >= "Last Pull" '
+           'THEN excluded.{0} ELSE {0} END')
+MERGE = {
+    'Volume': 'Volume + excluded.Volume',
+    'Pulls': 'Pulls + excluded.Pulls - ("Last Pull" = excluded."First Pull")',
+    'First Pull': 'min("First Pull", excluded."First Pull")',
+    'Last Pull': 'max("Last Pull", excluded."Last Pull")',
+    'Last Price': _LATEST.format('"Last Price"'),
+    'Open Interest': _LATEST.format('"Open Interest"')
+}
+
+DAY = 86400 * 10**9
+
+
+def pull_times(df):
+    """'Download DateTime' of option data as int64 ns since epoch"""
+
+    return to_epochs(df['Download DateTime'])
+
+
+def bucket_starts(times, freq):
+    """Start of the bucket of each time, in ns since epoch
+
+    Intraday buckets hold (start, end], days hold the times of their date.
+    """
+
+    size = pd.Timedelta(FREQS.get(freq, freq)).value
+    if size == DAY:
+        return times // size * size
+    return (times - 1) // size * size
+
+
+def _group_codes(*arrays):
+    """Code of each row such that rows share a code iff they share all the
+    values of arrays"""
+
+    codes = np.zeros(len(arrays[0]), dtype=np.int64)
+    for values in arrays:
+        value_codes, uniques = pd.factorize(values)
+        codes = pd.factorize(codes * len(uniques) + value_codes)[0]
+
+    return codes
+
+
+def _collapse(rows, keys, group):
+    """One rollup row per group of rows sorted by group, then by time
+
+    rows and the result map 'Bucket', the key columns, 'Volume', 'Pulls',
+    'First Pull', 'Last Pull' and, at the contract level, 'Last Price' and
+    'Open Interest' to arrays.
+    """
+
+    starts = np.r_[0, np.flatnonzero(np.diff(group)) + 1]
+    ends = np.r_[starts[1:], len(group)] - 1
+
+    rollup = {'Bucket': rows['Bucket'][starts]}
+    for key in keys:
+        rollup[key] = rows[key][starts]
+    rollup['Volume'] = np.add.reduceat(rows['Volume'], starts).astype(
+        np.int64)
+    rollup['Pulls'] = np.add.reduceat(rows['Pulls'], starts)
+    rollup['First Pull'] = np.minimum.reduceat(rows['First Pull'], starts)
+    rollup['Last Pull'] = rows['Last Pull'][ends]
+    for column in ('Last Price', 'Open Interest'):
+        if column in rows:
+            rollup[column] = rows[column][ends]
+
+    return rollup
+
+
+def minute_rollup(df, level):
+    """1 minute rollup rows of option data, that roll_up() takes further
+
+    Rows are split by download date as well, so that the pulls of a row
+    also share their bucket of any coarser size. Only a minute ending at
+    midnight can have two rows per key. Columns are returned as a dict of
+    arrays, which roll_up() reads faster than a DataFrame.
+    """
+
+    times = pull_times(df)
+    minutes = bucket_starts(times, '1m')
+    keys = [df[key].astype(str).to_numpy(dtype=object)
+            for key in LEVELS[level]]
+    group = _group_codes(minutes, bucket_starts(times, '1d'), *keys)
+
+    # Group codes, then times, in NumPy since a pandas groupby per rollup
+    # costs more than writing it
+    order = np.lexsort((times, group))
+    group, times = group[order], times[order]
+    rows = {'Bucket': minutes[order],
+            'Volume': np.nan_to_num(df['Volume'].values[order]),
+            # Distinct pull times per group
+            'Pulls': np.r_[True, (np.diff(group) != 0)
+                           | (np.diff(times) != 0)].astype(np.int64),
+            'First Pull': times, 'Last Pull': times}
+    for key, values in zip(LEVELS[level], keys):
+        rows[key] = values[order]
+    if level == 'contract':
+        rows['Last Price'] = df['Last Price'].values[order]
+        rows['Open Interest'] = df['Open Interest'].values[order]
+
+    return _collapse(rows, LEVELS[level], group)
+
+
+def roll_up(rollup, freq, level):
+    """Rollup rows of coarser buckets from those of minute_rollup()
+
+    Parameters:
+    -----------
+    rollup : dict of arrays or DataFrame
+        Rows of minute_rollup() of the same level, or of roll_up() of a
+        size that freq is a multiple of.
+
+    freq : str, a key of FREQS
+
+    level : str, a key of LEVELS
+    """
+
+    # All pulls of a row share their bucket, so its first pull tells it
+    rows = {column: np.asarray(rollup[column]) for column in rollup}
+    buckets = bucket_starts(rows['First Pull'], freq)
+    group = _group_codes(buckets, *[rows[key] for key in LEVELS[level]])
+
+    order = np.lexsort((rows['Last Pull'], group))
+    rows = {column: values[order] for column, values in rows.items()}
+    rows['Bucket'] = buckets[order]
+
+    return pd.DataFrame(_collapse(rows, LEVELS[level], group[order]))
+
+
+def aggregate(df, freq, level):
+    """Rollup rows of option data with incremental 'Volume'
+
+    Parameters:
+    -----------
+    df : DataFrame
+        Option data as saved to the data table.
+
+    freq : str, a key of FREQS
+
+    level : str, a key of LEVELS
+
+    Return:
+    -------
+    rollup : DataFrame
+        'Bucket', the key columns of level, 'Volume', 'Pulls', 'First Pull'
+        and 'Last Pull', plus 'Last Price' and 'Open Interest' at the
+        latest pull of each contract.
+    """
+
+    return roll_up(minute_rollup(df, level), freq, level)
+
+
+class Rollups:
+    """Rollup Tables of the Data Table
+
+    Parameters:
+    -----------
+    store : SQLiteStore
+        Database of the data table. Rollups are written through its writer
+        thread, in the same transactions as the data when they are queued
+        together.
+
+    data_table : str
+        Name of the data table, e.g. config['CURRENT']['DataTableName'].
+    """
+
+    def __init__(self, store, data_table):
+        self.store = store
+        self.data_table = data_table
+
+    @classmethod
+    def from_config(cls, config):
+        """Rollups of the data table in config_nasdaq100.ini"""
+
+        return cls(SQLiteStore.open(config['CURRENT']['DatabasePath']),
+                   config['CURRENT']['DataTableName'])
+
+    def table(self, freq, level):
+        """Name of a rollup table"""
+
+        return '{0}_{1}_{2}'.format(self.data_table, freq, level)
+
+    def ingest(self, df):
+        """Queue df, just saved to the data table, into every rollup"""
+
+        if not len(df):
+            return
+
+        # Coarser buckets from the minutes, not from every raw row again
+        for level in LEVELS:
+            minutes = minute_rollup(df, level)
+            for freq in FREQS:
+                self.store.write(self.table(freq, level),
+                                 roll_up(minutes, freq, level),
+                                 keys=['Bucket'] + LEVELS[level],
+                                 merge=MERGE)
+
+    def rebuild(self, start_date, end_date=None):
+        """Recompute the rollups of download dates from the data table
+
+        Parameters:
+        -----------
+        start_date, end_date : str, 'YYYY-MM-DD'
+            Inclusive range of 'Download Date'. end_date defaults to
+            start_date.
+        """
+
+        end_date = start_date if end_date is None else end_date
+        columns = ['Symbol', 'Contract Name', 'Last Price', 'Volume',
+                   'Open Interest', 'Download DateTime']
+        sql = ('SELECT {0} FROM {1} WHERE "Download Date" = ? '
+               'ORDER BY "Download DateTime"').format(
+                   ', '.join('"{}"'.format(c) for c in columns),
+                   self.data_table)
+
+        existing = set(self.store.read(
+            "SELECT name FROM sqlite_master WHERE type = 'table'")['name'])
+        for date in pd.date_range(start_date, end_date):
+            df = self.store.read(sql, [str(date.date())])
+            for freq in FREQS:
+                for level in LEVELS:
+                    if self.table(freq, level) not in existing:
+                        continue
+                    self.store.execute(
+                        'DELETE FROM "{}" WHERE Bucket >= ? AND Bucket < ?'
+                        .format(self.table(freq, level)),
+                        (date.value, date.value + DAY))
+            self.ingest(df)
+            self.store.flush()
+
+    def query(self, start, end=None, freq='15m', level='symbol',
+              symbols=None):
+        """Rollup rows with buckets starting in [start, end)
+
+        Parameters:
+        -----------
+        start, end : anything pd.Timestamp takes
+            end defaults to a day after start.
+
+        freq : str, a key of FREQS, default '15m'
+
+        level : str, a key of LEVELS, default 'symbol'
+
+        symbols : list of str, default None
+            Symbols to read. None means all.
+
+        Return:
+        -------
+        rollup : DataFrame
+            Rows of the rollup table with 'Bucket' as datetime64.
+        """
+
+        start = pd.Timestamp(start)
+        end = start + pd.Timedelta(1, 'D') if end is None else pd.Timestamp(
+            end)
+        params = [start.value, end.value]
+
+        sql = 'SELECT * FROM "{}" WHERE Bucket >= ? AND Bucket < ?'.format(
+            self.table(freq, level))
+        if symbols is not None:
+            sql += ' AND Symbol IN ({})'.format(','.join('?' * len(symbols)))
+            params += list(symbols)
+
+        rollup = self.store.read(sql + ' ORDER BY Bucket', params)
+        rollup['Bucket'] = pd.to_datetime(rollup['Bucket'])
+
+        return rollup
+
+    def _days(self, start_date, end_date, freq='1d', symbols=None):
+        end_date = start_date if end_date is None else end_date
+        return self.query(start_date, pd.Timestamp(end_date)
+                          + pd.Timedelta(1, 'D'), freq, 'symbol', symbols)
+
+    def volume_by_bucket(self, start_date, end_date=None, freq='15m',
+                         symbols=None):
+        """Total volume per symbol (rows) and bucket start (columns)
+
+        Same as analytics.volume_by_bucket() of the download dates.
+        """
+
+        rollup = self._days(start_date, end_date, freq, symbols)
+        return rollup.set_index(['Symbol', 'Bucket'])['Volume'].unstack()
+
+    def eod_volume(self, start_date, end_date=None, symbols=None):
+        """Total volume per symbol (rows) and download date (columns)"""
+
+        rollup = self._days(start_date, end_date, symbols=symbols)
+        return self._by_date(rollup, 'Volume')
+
+    def pull_counts(self, start_date, end_date=None, symbols=None):
+        """Number of pulls per symbol (rows) and download date (columns)"""
+
+        rollup = self._days(start_date, end_date, symbols=symbols)
+        return self._by_date(rollup, 'Pulls')
+
+    def _by_date(self, rollup, column):
+        rollup['Download Date'] = rollup['Bucket'].dt.strftime('%Y-%m-%d')
+        return rollup.set_index(['Symbol', 'Download Date'])[
+            column].unstack()
+
+    def volume(self, start, end, level='symbol', symbols=None):
+        """Total volume of the pulls in (start, end]
+
+        Read from the coarsest rollup whose buckets both ends fall on, so
+        a whole day is a single row per symbol. When both ends fall on
+        midnight, that is the daily rollup, which holds whole download
+        dates: the pulls in [start, end) are counted instead, and a pull
+        at midnight exactly counts towards the day it starts.
+
+        Return:
+        -------
+        volume : Series
+            Indexed by symbol, or by symbol and contract name.
+        """
+
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        for freq in reversed(FREQS):
+            size = pd.Timedelta(FREQS[freq]).value
+            if not start.value % size and not end.value % size:
+                break
+        else:
+            raise ValueError('start and end must fall on whole minutes')
+
+        rollup = self.query(start, end, freq, level, symbols)
+        return rollup.groupby(LEVELS[level])['Volume'].sum()
+
+
+if __name__ == '__main__':
+    config = ConfigParser()
+    config.read(PROJECT_PATH + '/config_nasdaq100.ini')
+
+    start_date = (sys.argv[1] if len(sys.argv) > 1
+                  else str(datetime.now().date()))
+    end_date = sys.argv[2] if len(sys.argv) > 2 else start_date
+
+    Rollups.from_config(config).rebuild(start_date, end_date)
+    print('Rebuilt the rollups from {0} to {1}'.format(start_date, end_date))
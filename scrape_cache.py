@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent caches of what YahooScraper learns about a symbol before it gets to
+the option tables. They live in one small SQLite file so that every batch and
+every worker process shares them across runs.
+"""
+
+import json
+import sqlite3
+import time
+
+
+class SQLiteCache:
+    """Base of the caches: one SQLite file opened per call
+
+    Parameters:
+    -----------
+    path : str, a file path
+        SQLite file of the cache. Created if it does not exist.
+
+    timeout : float, positive, default 30
+        Seconds to wait for another process holding the file.
+    """
+
+    TABLES = []
+
+    def __init__(self, path, timeout=30):
+        self.path = path
+        self.timeout = timeout
+
+        conn = self._connect()
+        with conn:
+            conn.execute('PRAGMA journal_mode=WAL') # Readers don't block
+            for sql in self.TABLES:
+                conn.execute(sql)
+        conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=self.timeout)
+
+    def _fetchone(self, sql, params):
+        conn = self._connect()
+        row = conn.execute(sql, params).fetchone()
+        conn.close()
+        return row
+
+    def _execute(self, sql, params):
+        conn = self._connect()
+        with conn:
+            conn.execute(sql, params)
+        conn.close()
+
+
+class ExpirationDateCache(SQLiteCache):
+    """Expiration Dates per Symbol with a Time to Live
+
+    Expiration date lists change at most once a day, so loading the base
+    options page of a symbol every round only to read them is wasted. Entries
+    older than ttl are ignored, dates that have already expired are dropped
+    on the way out, and a scraper invalidates a symbol as soon as one of its
+    cached dates is rejected by Yahoo.
+
+    Parameters:
+    -----------
+    path : str, a file path
+        SQLite file of the cache. Created if it does not exist.
+
+    ttl : float, positive, default 21600
+        Seconds an entry is trusted for.
+
+    timeout : float, positive, default 30
+        Seconds to wait for another process holding the file.
+    """
+
+    TABLES = ['CREATE TABLE IF NOT EXISTS expiration_dates '
+              '(Symbol TEXT PRIMARY KEY, Dates TEXT, Updated REAL)']
+
+    def __init__(self, path, ttl=6 * 3600, timeout=30):
+        super().__init__(path, timeout)
+        self.ttl = ttl
+
+    def get(self, symbol, now=None):
+        """Cached expiration dates of symbol
+
+        Return:
+        -------
+        dates : list of (value, text) tuples or None
+            Same layout as YahooScraper.expiration_dates[symbol]. None if the
+            symbol is not cached, its entry is stale or all dates expired.
+        """
+
+        now = time.time() if now is None else now
+
+        row = self._fetchone('SELECT Dates, Updated FROM expiration_dates '
+                             'WHERE Symbol = ?', (symbol,))
+
+        if row is None or now - row[1] > self.ttl:
+            return None
+
+        # Date values are midnight UTC of the expiration day in epoch seconds
+        dates = [tuple(x) for x in json.loads(row[0])
+                 if int(x[0]) + 86400 > now]
+
+        return dates or None
+
+    def put(self, symbol, dates, now=None):
+        """Cache freshly scraped expiration dates of symbol"""
+
+        now = time.time() if now is None else now
+        if not dates:
+            return
+
+        self._execute('INSERT OR REPLACE INTO expiration_dates '
+                      'VALUES (?, ?, ?)',
+                      (symbol, json.dumps([list(x) for x in dates]), now))
+
+    def invalidate(self, symbol):
+        """Forget symbol, e.g. after one of its cached dates was rejected"""
+
+        self._execute('DELETE FROM expiration_dates WHERE Symbol = ?',
+                      (symbol,))
+
+
+class SymbolCache(SQLiteCache):
+    """Renamed and Dead Symbols
+
+    Keeps the new ticker of every symbol that Yahoo redirected, so the lookup
+    page is only visited once per rename, and counts the rounds a symbol was
+    not found in, so a dead symbol stops costing a round of 404 retries. A
+    single miss can be one of Yahoo's random 404 pages, so a symbol is only
+    skipped after min_misses misses in a row, and only for dead_ttl.
+
+    Parameters:
+    -----------
+    path : str, a file path
+        SQLite file of the cache. Created if it does not exist. It can be
+        the same file as an ExpirationDateCache.
+
+    min_misses : int, positive, default 2
+        Misses in a row before a symbol counts as dead.
+
+    dead_ttl : float, positive, default 86400
+        Seconds a dead symbol is skipped for before it is tried again.
+
+    timeout : float, positive, default 30
+        Seconds to wait for another process holding the file.
+    """
+
+    TABLES = ['CREATE TABLE IF NOT EXISTS symbol_aliases '
+              '(Symbol TEXT PRIMARY KEY, Alias TEXT, Updated REAL)',
+              'CREATE TABLE IF NOT EXISTS dead_symbols '
+              '(Symbol TEXT PRIMARY KEY, Misses INTEGER, Updated REAL)']
+
+    def __init__(self, path, min_misses=2, dead_ttl=86400, timeout=30):
+        super().__init__(path, timeout)
+        self.min_misses = min_misses
+        self.dead_ttl = dead_ttl
+
+    def resolve(self, symbol):
+        """Current Yahoo ticker of symbol, which is symbol unless renamed"""
+
+        row = self._fetchone('SELECT Alias FROM symbol_aliases '
+                             'WHERE Symbol = ?', (symbol,))
+        return symbol if row is None else row[0]
+
+    def add_alias(self, symbol, alias, now=None):
+        """Remember that Yahoo redirected symbol to alias"""
+
+        now = time.time() if now is None else now
+        if alias == symbol:
+            return
+
+        self._execute('INSERT OR REPLACE INTO symbol_aliases '
+                      'VALUES (?, ?, ?)', (symbol, alias, now))
+
+    def remove_alias(self, symbol):
+        """Forget the alias of symbol, e.g. when the alias stops working"""
+
+        self._execute('DELETE FROM symbol_aliases WHERE Symbol = ?',
+                      (symbol,))
+
+    def is_dead(self, symbol, now=None):
+        """True if symbol should be skipped this round"""
+
+        now = time.time() if now is None else now
+        row = self._fetchone('SELECT Misses, Updated FROM dead_symbols '
+                             'WHERE Symbol = ?', (symbol,))
+
+        return (row is not None and row[0] >= self.min_misses
+                and now - row[1] <= self.dead_ttl)
+
+    def mark_missing(self, symbol, now=None):
+        """Count a round in which symbol was not found"""
+
+        now = time.time() if now is None else now
+        self._execute('INSERT INTO dead_symbols VALUES (?, 1, ?) '
+                      'ON CONFLICT(Symbol) DO UPDATE SET '
+                      'Misses = Misses + 1, Updated = excluded.Updated',
+                      (symbol, now))
+
+    def mark_found(self, symbol):
+        """Reset the misses of symbol after it was scraped
+
+        Called for every symbol of every round, so the write lock is only
+        taken when symbol actually has misses to reset.
+        """
+
+        if self._fetchone('SELECT 1 FROM dead_symbols WHERE Symbol = ?',
+                          (symbol,)) is None:
+            return
+        self._execute('DELETE FROM dead_symbols WHERE Symbol = ?', (symbol,))
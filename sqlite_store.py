@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+"""
+SQLite storage layer shared by live_nasdaq100.py, supervisor.py and the
+analysis scripts. Each process keeps long-lived connections to the database
+in WAL mode instead of connecting on every cycle, and all of its writes go
+through one writer thread that commits them in executemany batches. Readers
+never block the writer and the writer never blocks readers, and indexes on
+the data table keep the daily GROUP BY reads from slowing down as the table
+grows.
+
+The single writer is per process. Separate processes writing to the same
+file, such as the batches of live_nasdaq100.py, still take turns on its
+write lock and wait up to the timeout for it, so "database is locked" errors
+remain possible under heavy load. supervisor.py avoids them by writing the
+data of every worker process from the supervisor alone.
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Index of the option data table, serving the reads by download date and
+# symbol and the volume totals per contract
+DATA_INDEX = ['Download Date', 'Symbol', 'Contract Name']
+
+PRAGMAS = ['PRAGMA journal_mode=WAL',
+           'PRAGMA synchronous=NORMAL', # Durable at checkpoints under WAL
+           'PRAGMA temp_store=MEMORY',
+           'PRAGMA cache_size=-65536'] # 64 MB page cache
+
+_STOP = object() # Tells the writer thread to exit
+
+_stores = {} # (process id, path) -> SQLiteStore, see SQLiteStore.open()
+
+
+def _num_rows(item):
+    """Rows of a queued write, 0 for a statement or _STOP"""
+
+    if item is _STOP or len(item) == 2:
+        return 0
+    return len(item[1])
+
+
+def quote(name):
+    """Quote an SQLite identifier such as a column name with spaces"""
+
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def short_decimals(values):
+    """float32 values as float64 with the fewest decimals, up to 6, that
+    read back as the same float32, e.g. 9.85 rather than 9.850000381469727
+
+    Values that need more decimals are only widened.
+    """
+
+    wide = values.astype(np.float64)
+    todo = np.flatnonzero(np.isfinite(wide))
+    for decimals in range(7):
+        if not len(todo):
+            break
+        rounded = np.round(wide[todo], decimals)
+        exact = rounded.astype(np.float32) == values[todo]
+        wide[todo[exact]] = rounded[exact]
+        todo = todo[~exact]
+
+    return wide
+
+
+def to_rows(df):
+    """Rows of df as tuples of Python values, with None for missing ones
+
+    float32 values are written as their short decimals, see
+    short_decimals().
+    """
+
+    columns = []
+    for column in df.columns:
+        values = df[column]
+        if values.dtype.kind in 'iub':
+            columns.append(values.tolist())
+            continue
+
+        # In NumPy, since pandas costs more per column than the insert
+        if values.dtype.kind == 'f':
+            values = values.to_numpy()
+            if values.dtype == np.float32:
+                values = short_decimals(values)
+        else:
+            if values.dtype.kind == 'M':
+                values = values.astype(str)
+            values = values.to_numpy(dtype=object)
+        missing = pd.isna(values)
+        if missing.any():
+            values = values.astype(object)
+            values[missing] = None
+        columns.append(values.tolist())
+
+    return list(zip(*columns))
+
+
+class SQLiteStore:
+    """Tuned SQLite Database with a Single Writer
+
+    Reads run on a connection of their own. write() only queues a
+    DataFrame; the writer thread takes everything queued so far, up to
+    max_rows rows, and inserts it in one transaction with executemany. A
+    table that does not exist yet is created from the first DataFrame
+    written to it, as DataFrame.to_sql would.
+
+    Use SQLiteStore.open() to share one store per database file within a
+    process.
+
+    Parameters:
+    -----------
+    path : str, a file path
+        SQLite database file. Created if it does not exist.
+
+    timeout : float, positive, default 60
+        Seconds to wait for another process holding the write lock.
+
+    max_rows : int, positive, default 50000
+        Max rows committed in one transaction.
+
+    max_pending : int, positive, default 64
+        DataFrames that may wait in the queue before write() blocks.
+    """
+
+    def __init__(self, path, timeout=60, max_rows=50000, max_pending=64):
+        self.path = path
+        self.timeout = timeout
+        self.max_rows = max_rows
+
+        self.indexes = {} # Table -> list of index columns
+        self._error = None
+        self._queue = queue.Queue(max_pending)
+        self._writer = None
+        self._writer_lock = threading.Lock() # Starts one writer at a time
+        self._reader = None
+        self._read_lock = threading.Lock()
+
+    @classmethod
+    def open(cls, path, **kwargs):
+        """The store of path in this process, made on the first call"""
+
+        # Forked children get a store of their own
+        key = (os.getpid(), os.path.abspath(path))
+        if key not in _stores:
+            _stores[key] = cls(path, **kwargs)
+        return _stores[key]
+
+    def _connect(self, check_same_thread=True):
+        conn = sqlite3.connect(self.path, timeout=self.timeout,
+                               isolation_level=None, # Explicit transactions
+                               check_same_thread=check_same_thread)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def read(self, sql, params=None):
+        """Run a query and return the result as a DataFrame"""
+
+        with self._read_lock:
+            if self._reader is None:
+                self._reader = self._connect(check_same_thread=False)
+            return pd.read_sql_query(sql, self._reader, params=params)
+
+    def add_index(self, table, columns):
+        """Index table on columns, now or as soon as the table is created"""
+
+        self.indexes[table] = list(columns)
+        conn = self._connect()
+        try:
+            if self._has_table(conn, table):
+                self._create_index(conn, table)
+        finally:
+            conn.close()
+
+    def _has_table(self, conn, table):
+        row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' "
+                           'AND name = ?', (table,)).fetchone()
+        return row is not None
+
+    def _create_index(self, conn, table):
+        columns = self.indexes.get(table)
+        if not columns:
+            return
+
+        name = 'ix_{0}_{1}'.format(table, '_'.join(
+            c.replace(' ', '_') for c in columns)).lower()
+        conn.execute('CREATE INDEX IF NOT EXISTS {0} ON {1} ({2})'.format(
+            quote(name), quote(table), ', '.join(quote(c) for c in columns)))
+
+    def _create_table(self, conn, table, df, keys=None):
+        if self._has_table(conn, table):
+            return
+
+        schema = pd.io.sql.get_schema(df, table, keys=keys, con=conn)
+        if keys:
+            schema += ' WITHOUT ROWID' # Rows live in the primary key B-tree
+        conn.execute(schema)
+        self._create_index(conn, table)
+
+    def write(self, table, df, keys=None, merge=None):
+        """Queue df to be appended to table
+
+        Raises StoreWriteError if an earlier write failed.
+
+        Parameters:
+        -----------
+        table : str
+
+        df : DataFrame
+
+        keys : list of str, default None
+            Primary key of table. If given, the table is created with it and
+            a row whose key is already in the table updates that row
+            instead, see merge.
+
+        merge : dict, default None
+            SQL expression of the updated value per column, where the new
+            value is excluded."Column", e.g. {'Volume': 'Volume +
+            excluded.Volume'}. Other columns take the new value.
+        """
+
+        self._raise()
+        if not len(df):
+            return
+
+        self._put((table, df, keys, merge))
+
+    def execute(self, sql, params=()):
+        """Queue a statement, e.g. a DELETE, in order with the writes"""
+
+        self._raise()
+        self._put((sql, params))
+
+    def _put(self, item):
+        with self._writer_lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._run,
+                                                daemon=True)
+                self._writer.start()
+        self._queue.put(item)
+
+    def flush(self):
+        """Wait until everything queued is committed"""
+
+        self._queue.join()
+        self._raise()
+
+    def close(self):
+        """Commit everything queued and close the connections"""
+
+        with self._writer_lock:
+            if self._writer is not None and self._writer.is_alive():
+                self._queue.put(_STOP)
+                self._writer.join()
+            self._writer = None
+
+        with self._read_lock:
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+        self._raise()
+
+    def _raise(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise StoreWriteError('Failed to write to ' + self.path) from error
+
+    def _commit(self, conn, batch):
+        """Run a batch of writes and statements in one transaction
+
+        If the transaction fails, each item is retried in a transaction of
+        its own, so only the items that fail by themselves are lost. The
+        error of the first one is raised by the next write() or flush().
+        """
+
+        try:
+            self._transaction(conn, batch)
+        except Exception as inst:
+            if len(batch) == 1:
+                self._error = self._error or inst
+                return
+            for item in batch:
+                try:
+                    self._transaction(conn, [item])
+                except Exception as error:
+                    self._error = self._error or error
+
+    def _transaction(self, conn, batch):
+        """Commit batch, or roll it back and raise"""
+
+        try:
+            conn.execute('BEGIN IMMEDIATE') # Take the write lock up front
+            for item in batch:
+                if len(item) == 2: # A statement and its parameters
+                    conn.execute(*item)
+                    continue
+
+                table, df, keys, merge = item
+                self._create_table(conn, table, df, keys)
+                sql = 'INSERT INTO {0} ({1}) VALUES ({2})'.format(
+                    quote(table), ', '.join(quote(c) for c in df.columns),
+                    ', '.join('?' * df.shape[1]))
+                if keys:
+                    merge = merge or {}
+                    sql += ' ON CONFLICT ({0}) DO UPDATE SET {1}'.format(
+                        ', '.join(quote(k) for k in keys),
+                        ', '.join('{0} = {1}'.format(
+                            quote(c), merge.get(c, 'excluded.' + quote(c)))
+                            for c in df.columns if c not in keys))
+                conn.executemany(sql, to_rows(df))
+            conn.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+
+    def _run(self):
+        conn = None # Connected by the first batch
+        stop = False
+        while not stop:
+            batch = [self._queue.get()]
+            rows = _num_rows(batch[0])
+            # Take whatever else is waiting
+            while batch[-1] is not _STOP and rows < self.max_rows:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(item)
+                rows += _num_rows(item)
+
+            stop = batch[-1] is _STOP
+            items = [x for x in batch if x is not _STOP]
+            if items:
+                try:
+                    if conn is None:
+                        conn = self._connect()
+                except Exception as inst:
+                    # The batch fails, the thread keeps draining the queue
+                    # so that flush() returns, and the next batch connects
+                    self._error = self._error or inst
+                else:
+                    self._commit(conn, items)
+            for _ in batch:
+                self._queue.task_done()
+
+        if conn is not None:
+            conn.close()
+
+
+class StoreWriteError(Exception):
+    """A queued write failed in the writer thread, raised by the next
+    write(), execute(), flush() or close()"""
+
+    pass
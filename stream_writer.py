@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Background writer for streamed scraping. YahooScraper.scrape_iter() yields
+the option data of each expiration date as soon as it is scraped, and a
+StreamWriter persists it in chunks on its own thread while the next pages
+load, instead of the whole round piling up in memory until the end.
+
+    with StreamWriter(lambda df: save_increments(df, tracker, config)) as w:
+        for batch in ys.scrape_iter():
+            w.put(batch)
+"""
+
+import queue
+import threading
+import time
+
+from option_buffer import concat_frames
+
+_CLOSE = object() # Tells the writer thread to flush and exit
+
+
+class StreamWriter:
+    """Chunked Writes of Streamed DataFrames on a Background Thread
+
+    Batches are collected into a chunk, which is written once it holds
+    max_rows rows or its oldest batch has waited max_delay seconds. The
+    queue in between is bounded, so a scraper running ahead of a slow sink
+    blocks in put() rather than buffering the round in memory.
+
+    Parameters:
+    -----------
+    write : callable
+        Called with each chunk as one DataFrame, on the writer thread only.
+        e.g. live_nasdaq100.save_increments.
+
+    max_rows : int, positive, default 5000
+        Rows per chunk.
+
+    max_delay : float, positive, default 5
+        Seconds a batch may wait for its chunk to fill up.
+
+    max_pending : int, positive, default 64
+        Batches that may wait in the queue before put() blocks.
+    """
+
+    def __init__(self, write, max_rows=5000, max_delay=5, max_pending=64):
+        self.write = write
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+
+        self.rows = 0 # Written so far
+        self.chunks = 0
+        self._error = None
+        self._queue = queue.Queue(max_pending)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def put(self, df):
+        """Queue a batch. Raises the error of a failed write, if any"""
+
+        self._raise()
+        if len(df):
+            self._queue.put(df)
+
+    def close(self):
+        """Write what is left and stop the thread"""
+
+        if self._thread.is_alive():
+            self._queue.put(_CLOSE)
+            self._thread.join()
+        self._raise()
+
+    def _raise(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise StreamWriteError('Failed to write a chunk') from error
+
+    def _flush(self, frames):
+        if not frames or self._error is not None:
+            return # Batches after a failed write are dropped
+
+        try:
+            chunk = concat_frames(frames)
+            self.write(chunk)
+            self.rows += len(chunk)
+            self.chunks += 1
+        except Exception as inst:
+            self._error = inst
+
+    def _run(self):
+        frames, rows, deadline = [], 0, None
+        while True:
+            timeout = (None if deadline is None
+                       else max(deadline - time.time(), 0))
+            try:
+                df = self._queue.get(timeout=timeout)
+            except queue.Empty: # Chunk waited long enough
+                self._flush(frames)
+                frames, rows, deadline = [], 0, None
+                continue
+
+            if df is _CLOSE:
+                self._flush(frames)
+                return
+
+            frames.append(df)
+            rows += len(df)
+            if deadline is None:
+                deadline = time.time() + self.max_delay
+            if rows >= self.max_rows:
+                self._flush(frames)
+                frames, rows, deadline = [], 0, None
+
+
+class StreamWriteError(Exception):
+    """A chunk failed to write in the background, raised by put() or close()"""
+
+    pass
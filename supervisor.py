@@ -0,0 +1,453 @@
+# -*- coding: utf-8 -*-
+"""
+Single entry point that runs a pool of scraper worker processes on Linux, in
+place of batch_cmds.py and the BatchNumber chain of live_nasdaq100.py.
+
+Symbols are handed out through one shared queue, so a worker that is done
+takes the next symbol instead of idling behind a slow bin. Workers only
+scrape; the supervisor computes volume increments and writes to the
+database, so there is one writer and one set of volume totals. Crashed
+workers, and workers stuck on a symbol for too long, are restarted and their
+symbol is retried, and a round gives up on symbols whose result never comes.
+
+    python supervisor.py [number of workers]
+"""
+
+import multiprocessing as mp
+import os
+import queue
+import sys
+import threading
+import time
+from configparser import ConfigParser
+
+import pandas as pd
+
+from browser_pool import BrowserPool
+from browser_profiles import BrowserProfile
+from change_detector import ChangeDetector
+from instrumentation import REGISTRY
+from live_nasdaq100 import (report_time, dynamic_sleep_interval,
+                            is_in_session, is_symbol_list_updated,
+                            download_symbol_list, read_symbol_list,
+                            seed_volume_tracker, save_increments)
+from option_buffer import concat_frames
+from parquet_store import ParquetStore
+from rollups import Rollups
+from scrape_cache import ExpirationDateCache, SymbolCache
+from sqlite_store import SQLiteStore, DATA_INDEX
+from tick_store import TickStore
+from volume_tracker import VolumeTracker
+from vol_surface import SurfaceBuilder
+from yahoo_scraper import YahooScraper, Timer
+
+PROJECT_PATH = os.path.dirname(os.path.abspath(__file__))
+
+EXIT_STUCK = 3 # Exit code of a worker that gave up on a stuck symbol
+HUNG_GRACE = 60 # Seconds a stuck worker gets to exit by itself
+
+
+def worker_main(worker_id, tasks, results, in_flight, profile, max_tries,
+                cache_path=None, symbol_timeout=None):
+    """Scrape symbols from tasks until a None arrives
+
+    Tasks are (round_id, symbol). The task being scraped and when it started
+    are recorded in the shared in_flight dict first, which unlike a queue
+    message survives a crash of the worker. Messages put on results are
+    (kind, worker_id, round_id, symbol, payload) with kind 'done' (payload
+    is data, seconds and page loads) or 'error' (payload is the error).
+    results is a Manager queue, whose put() returns once the message is
+    delivered, so a symbol leaves in_flight only when its result can no
+    longer die with the worker. cache_path is the SQLite file of the
+    ExpirationDateCache and SymbolCache shared by all workers.
+
+    A symbol still scraping after symbol_timeout seconds, e.g. in a browser
+    that never answers, is left in in_flight and the worker kills its
+    browsers and exits with EXIT_STUCK, so that it is restarted without
+    being killed halfway through writing to a queue.
+    """
+
+    pool = BrowserPool(profile=profile.for_process(
+        'worker-{}'.format(worker_id)))
+    date_cache = symbol_cache = None
+    if cache_path is not None:
+        date_cache = ExpirationDateCache(cache_path)
+        symbol_cache = SymbolCache(cache_path)
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+
+        round_id, symbol = task
+        in_flight[worker_id] = (round_id, symbol, time.time())
+        result = [] # (kind, payload) once the scrape is over
+
+        def scrape():
+            timer = Timer()
+            try:
+                ys = YahooScraper(symbol, max_tries=max_tries, pool=pool,
+                                  date_cache=date_cache,
+                                  symbol_cache=symbol_cache)
+                ys.scrape_all()
+                result.append(('done', (ys.data, timer.stop(),
+                                        len(ys.timer['Page Load']))))
+            except Exception as inst:
+                result.append(('error', repr(inst)))
+
+        thread = threading.Thread(target=scrape, daemon=True)
+        thread.start()
+        thread.join(symbol_timeout)
+        if not result: # Stuck, its browser would outlive the worker
+            pool.kill()
+            sys.exit(EXIT_STUCK)
+
+        kind, payload = result[0]
+        results.put((kind, worker_id, round_id, symbol, payload))
+        in_flight.pop(worker_id, None) # Idle, not stuck
+
+    pool.close()
+
+
+class Supervisor:
+    """Scraper Process Pool
+
+    Parameters:
+    -----------
+    num_workers : int, positive
+        Number of worker processes.
+
+    profile : BrowserProfile, default None
+        How each worker launches its browser, see browser_profiles.py.
+        Defaults to plain Chrome.
+
+    max_tries : int, positive, default 3
+        Tries per symbol, counting crashes of the worker scraping it.
+
+    symbol_timeout : float, positive, default 600
+        Seconds a worker may spend on one symbol before it is deemed stuck,
+        e.g. in a browser that never answers, and restarted. A worker exits
+        by itself then; one that does not within HUNG_GRACE more seconds is
+        killed, and all workers are restarted on fresh queues with it.
+
+    round_timeout : float, positive, default 3600
+        Seconds a round may take. Symbols still pending then, e.g. because
+        their result was lost with a worker, are given up on. Results that
+        come in after their round is over are dropped.
+
+    cache_path : str, a file path, default None
+        SQLite file of the scrape caches shared by the workers.
+
+    metrics : Metrics, default None
+        Gets a span per round and per symbol scraped, and counters of
+        worker errors and restarts. Defaults to instrumentation.REGISTRY.
+
+    Attributes:
+    -----------
+    stats : dict
+        Worker id -> dict of 'Symbols', 'Rows', 'Pages', 'Busy Time',
+        'Errors' and 'Restarts'.
+    """
+
+    def __init__(self, num_workers, profile=None, max_tries=3,
+                 cache_path=None, metrics=None, symbol_timeout=600,
+                 round_timeout=3600):
+        self.num_workers = num_workers
+        self.profile = profile if profile is not None else BrowserProfile()
+        self.max_tries = max_tries
+        self.symbol_timeout = symbol_timeout
+        self.round_timeout = round_timeout
+        self.cache_path = cache_path
+        self.metrics = metrics if metrics is not None else REGISTRY
+
+        self._manager = mp.Manager()
+        self.tasks = mp.Queue()
+        self.results = self._manager.Queue()
+        self.workers = {}
+        # Worker id -> (round id, symbol, start time)
+        self.in_flight = self._manager.dict()
+        self.stats = {}
+        self.round_id = 0 # Of the current or last round
+
+    def _start_worker(self, worker_id):
+        process = mp.Process(
+            target=worker_main, name='scraper-{}'.format(worker_id),
+            args=(worker_id, self.tasks, self.results, self.in_flight,
+                  self.profile, self.max_tries, self.cache_path,
+                  self.symbol_timeout),
+            daemon=True)
+        process.start()
+        self.workers[worker_id] = process
+        self.stats.setdefault(worker_id, {
+            'Symbols': 0, 'Rows': 0, 'Pages': 0, 'Busy Time': 0.0,
+            'Errors': 0, 'Restarts': 0
+        })
+
+    def start(self):
+        """Start all workers"""
+
+        for worker_id in range(self.num_workers):
+            if worker_id not in self.workers:
+                self._start_worker(worker_id)
+
+    def stop(self):
+        """Let workers finish their symbol and exit"""
+
+        for _ in self.workers:
+            self.tasks.put(None)
+        for process in self.workers.values():
+            process.join(timeout=60)
+            if process.is_alive():
+                process.terminate()
+
+        self.workers = {}
+        self.in_flight.clear()
+
+    def _retry(self, round_id, symbol, pending, attempts):
+        """Queue a symbol of this round again, unless it is out of tries"""
+
+        if round_id != self.round_id or symbol not in pending:
+            return
+
+        attempts[symbol] += 1
+        if attempts[symbol] < self.max_tries:
+            self.tasks.put((self.round_id, symbol))
+        else:
+            print('Max tries reached. No data is available for '
+                  'symbol ' + symbol)
+            pending.discard(symbol)
+
+    def _restart_all_workers(self, pending):
+        """Kill every worker and start them again on fresh queues
+
+        A killed worker may leave a queue it was using locked or half
+        written, so no queue it touched is used again. Pending symbols,
+        including the ones only queued, are queued again.
+        """
+
+        for process in self.workers.values():
+            process.terminate()
+            process.join()
+        self.workers = {}
+        self.in_flight.clear()
+
+        self.tasks = mp.Queue()
+        self.results = self._manager.Queue()
+        for symbol in pending:
+            self.tasks.put((self.round_id, symbol))
+        self.start()
+
+    def _restart_dead_workers(self, pending, attempts):
+        """Restart crashed or stuck workers and retry the symbol they held"""
+
+        # Liveness first: a worker found dead has its symbol in the
+        # snapshot, even if it took one and crashed in between
+        alive = {worker_id: process.is_alive()
+                 for worker_id, process in self.workers.items()}
+        in_flight = self.in_flight.copy() # One snapshot, not per key
+        for worker_id, process in list(self.workers.items()):
+            round_id, symbol, start = in_flight.get(worker_id,
+                                                    (None, None, None))
+            if alive[worker_id]:
+                if (symbol is None
+                        or time.time() - start
+                        < self.symbol_timeout + HUNG_GRACE):
+                    continue
+
+                # It did not exit by itself, see worker_main()
+                print('[{0}]Worker {1} is hung on {2}, restarting all '
+                      'workers...'.format(report_time(), worker_id, symbol))
+                self.stats[worker_id]['Restarts'] += 1
+                self.metrics.inc('worker_restarts_total')
+                self._retry(round_id, symbol, pending, attempts)
+                self._restart_all_workers(pending)
+                return
+
+            if process.exitcode == EXIT_STUCK:
+                print('[{0}]Worker {1} is stuck on {2}, restarting...'.format(
+                        report_time(), worker_id, symbol))
+            else:
+                print('[{0}]Worker {1} died with exit code {2}, '
+                      'restarting...'.format(report_time(), worker_id,
+                                             process.exitcode))
+            self.stats[worker_id]['Restarts'] += 1
+            self.metrics.inc('worker_restarts_total')
+            self.in_flight.pop(worker_id, None)
+            self._start_worker(worker_id)
+            self._retry(round_id, symbol, pending, attempts)
+
+    def _give_up(self, pending):
+        """Drop the symbols of a round that ran out of time"""
+
+        print('[{0}]Round timed out, no data is available for {1}'.format(
+                report_time(), ', '.join(sorted(pending))))
+        self.metrics.inc('round_timeouts_total')
+        while True: # Not to be scraped in the next round as well
+            try:
+                self.tasks.get_nowait()
+            except queue.Empty:
+                break
+        pending.clear()
+
+    def run_round(self, symbols):
+        """Scrape every symbol once across the workers
+
+        Return:
+        -------
+        data : DataFrame
+            Data of all symbols scraped in this round.
+        """
+
+        self.round_id += 1
+        pending = set(symbols)
+        attempts = dict.fromkeys(symbols, 0)
+        frames = []
+        timer = Timer() # Time the round
+        deadline = time.time() + self.round_timeout
+
+        for symbol in symbols:
+            self.tasks.put((self.round_id, symbol))
+
+        while pending:
+            if time.time() > deadline:
+                self._give_up(pending)
+                break
+
+            # Checked between results too, as other workers keep answering
+            self._restart_dead_workers(pending, attempts)
+            try:
+                kind, worker_id, round_id, symbol, payload = (
+                    self.results.get(timeout=1))
+            except queue.Empty:
+                continue
+            except Exception as inst: # Left to the round timeout
+                print('[{0}]Lost a result: {1}'.format(report_time(),
+                                                      repr(inst)))
+                continue
+
+            stats = self.stats[worker_id]
+            if round_id != self.round_id: # Given up on in its round
+                continue
+            if symbol not in pending: # A retry finished after all
+                continue
+            pending.discard(symbol)
+
+            if kind == 'done':
+                data, seconds, pages = payload
+                if len(data):
+                    frames.append(data)
+                stats['Symbols'] += 1
+                stats['Rows'] += len(data)
+                stats['Pages'] += pages
+                stats['Busy Time'] += seconds
+                self.metrics.record('symbol_seconds', seconds, symbol=symbol,
+                                    worker=worker_id)
+            else:
+                stats['Errors'] += 1
+                self.metrics.inc('worker_errors_total')
+                print('[{0}]{1} failed in worker {2}: {3}'.format(
+                        report_time(), symbol, worker_id, payload))
+
+        self.metrics.record('round_seconds', timer.stop(),
+                            symbols=len(symbols))
+        return concat_frames(frames)
+
+    def report(self):
+        """Throughput per worker as a DataFrame"""
+
+        df = pd.DataFrame.from_dict(self.stats, orient='index')
+        df.index.name = 'Worker'
+        busy = df['Busy Time'].where(df['Busy Time'] > 0)
+        df['Symbols/min'] = 60 * df['Symbols'] / busy
+        df['Pages/s'] = df['Pages'] / busy
+        df['Rows/s'] = df['Rows'] / busy
+
+        return df
+
+
+if __name__ == '__main__':
+    config_path = PROJECT_PATH + '/config_nasdaq100.ini'
+    config = ConfigParser()
+    config.read(config_path)
+
+    num_workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()
+    supervisor = Supervisor(
+        num_workers, profile=BrowserProfile.from_config(config['CURRENT']),
+        cache_path=os.path.join(config['CURRENT']['SavePath'],
+                                'scrape_cache.db'))
+    tracker = VolumeTracker(os.path.join(config['CURRENT']['SavePath'],
+                                         'volume_totals.npz'))
+    SQLiteStore.open(config['CURRENT']['DatabasePath']).add_index(
+        config['CURRENT']['DataTableName'], DATA_INDEX)
+    if config['CURRENT'].getint('MetricsPort', 0):
+        REGISTRY.serve(config['CURRENT'].getint('MetricsPort'))
+
+    parquet_store = None
+    if config['CURRENT'].get('ParquetPath'):
+        parquet_store = ParquetStore(config['CURRENT']['ParquetPath'])
+        parquet_store.start_compaction()
+
+    rollups = None
+    if config['CURRENT'].getboolean('Rollups', False):
+        rollups = Rollups.from_config(config)
+
+    tick_store = None
+    if config['CURRENT'].get('TickPath'):
+        tick_store = TickStore(config['CURRENT']['TickPath'].format(
+            'supervisor'))
+
+    surfaces = None
+    if config['CURRENT'].get('SurfacePath'):
+        surfaces = SurfaceBuilder(
+            path=config['CURRENT']['SurfacePath'].format('supervisor'))
+
+    # Symbols move between workers, so unchanged rows are only dropped here
+    detector = None
+    if config['CURRENT'].getboolean('ChangeDetection', False):
+        detector = ChangeDetector()
+
+    symbols = None
+    num_rounds = 0
+    while True:
+        is_in, start_time = is_in_session(config)
+
+        if is_in:
+            if symbols is None: # Only once per trading session
+                try:
+                    if not is_symbol_list_updated(config):
+                        download_symbol_list(config)
+                except Exception as inst:
+                    print(repr(inst))
+
+                symbols = list(read_symbol_list(config)['Symbol'])
+                seed_volume_tracker(tracker, config, symbols)
+                supervisor.start()
+
+            print('[{}]Start scraping option data...'.format(report_time()))
+            data = supervisor.run_round(symbols)
+            save_increments(data, tracker, config, parquet_store, detector,
+                            rollups, tick_store)
+            if surfaces is not None:
+                surfaces.observe_frame(data)
+                surfaces.snapshot()
+                surfaces.store.save()
+
+            num_rounds += 1
+            if not num_rounds % 10:
+                print(supervisor.report().to_string())
+
+            time.sleep(1) # Prevent too frequent looping
+        else:
+            print('[{}]Out of trading session...Sleeping...'.format(
+                    report_time()))
+            if symbols is not None:
+                print(supervisor.report().to_string())
+                supervisor.stop()
+            if detector is not None:
+                detector.reset()
+            if surfaces is not None:
+                surfaces.reset()
+            if tick_store is not None:
+                tick_store.seal()
+            symbols = None
+            time.sleep(dynamic_sleep_interval(start_time))
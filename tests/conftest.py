@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Modules live at the top of the repository, import them from there. Also
+serves JSON option pages on localhost for the scraper tests.
+"""
+
+import json
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from fetch_backends import option_url
+from replay import FixtureStore, ReplayServer, request_path
+
+SYMBOLS = ['AAPL', 'MSFT']
+DATES = [1489708800, 1490313600] # March 17 and 24, 2017
+
+
+def option_chain(symbol, date=None):
+    """JSON option page of symbol with two calls and two puts"""
+
+    expiry = pd.Timestamp(DATES[0] if date is None else date,
+                          unit='s').strftime('%y%m%d')
+
+    def rows(option_type):
+        return [{'contractSymbol': '{0}{1}{2}{3:08d}'.format(
+                    symbol, expiry, option_type, strike * 1000),
+                 'strike': float(strike), 'lastPrice': 1.5, 'bid': 1.4,
+                 'ask': 1.6, 'change': 0.1, 'percentChange': 7.1,
+                 'volume': 10, 'openInterest': 100,
+                 'impliedVolatility': 0.3} for strike in (130, 135)]
+
+    return {'optionChain': {'result': [{
+        'expirationDates': DATES,
+        'quote': {'regularMarketPrice': 139.5,
+                  'regularMarketTime': 1489700000},
+        'options': [{'calls': rows('C'), 'puts': rows('P')}]}]}}
+
+
+@pytest.fixture
+def option_server(tmp_path):
+    """ReplayServer of the JSON option pages of SYMBOLS"""
+
+    store = FixtureStore(str(tmp_path / 'fixtures'))
+    for symbol in SYMBOLS:
+        for date in [None] + DATES:
+            store.put(request_path(option_url('', 'json', symbol, date)),
+                      200, json.dumps(option_chain(symbol, date)),
+                      'application/json', save=False)
+    store.save()
+
+    with ReplayServer(store) as server:
+        yield server
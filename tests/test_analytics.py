@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Metrics of analytics.py on small volume by time tables worked out by hand.
+"""
+
+import numpy as np
+import pandas as pd
+
+import analytics
+
+
+def vol_by_time(rows):
+    return pd.DataFrame(rows, columns=['Symbol', 'Download Date',
+                                       'Download Time', 'Volume'])
+
+
+def test_volume_by_bucket_bounds():
+    df = vol_by_time([
+        ('A', '2017-03-02', '09:45:00.000000', 1),   # (09:30, 09:45]
+        ('A', '2017-03-02', '09:45:00.000001', 2),   # (09:45, 10:00]
+        ('A', '2017-03-02', '10:00:00.000000', 4),   # (09:45, 10:00]
+        ('A', '2017-03-02', '10:07:30.000000', 8),   # (10:00, 10:15]
+        ('B', '2017-03-02', '10:15:00.000000', 16)]) # (10:00, 10:15]
+
+    vol_by_bucket = analytics.volume_by_bucket(df)
+
+    assert vol_by_bucket.columns.tolist() == list(pd.to_datetime([
+        '2017-03-02 09:30', '2017-03-02 09:45', '2017-03-02 10:00']))
+    assert vol_by_bucket.loc['A'].tolist() == [1, 6, 8]
+    assert np.isnan(vol_by_bucket.loc['B']).tolist() == [True, True, False]
+    assert vol_by_bucket.loc['B'].iloc[2] == 16
+
+    hourly = analytics.volume_by_bucket(df, freq='1h')
+    assert hourly.loc['A'].tolist() == [7, 8]
+
+
+def test_tag_positive_volume():
+    df = vol_by_time([
+        ('A', '2017-03-02', '09:45:00.000000', 0),
+        ('A', '2017-03-02', '09:46:00.000000', 3),
+        ('A', '2017-03-02', '09:47:00.000000', 0),
+        ('A', '2017-03-02', '09:48:00.000000', 1),
+        ('B', '2017-03-02', '09:45:00.000000', 2),
+        ('B', '2017-03-02', '09:46:00.000000', 0)])
+
+    assert analytics.tag_positive_volume(df).tolist() == [0, 1, 1, 2, 1, 1]
+
+
+def test_positive_volume_intervals():
+    df = vol_by_time([
+        ('A', '2017-03-01', '15:59:00.000000', 5),
+        ('A', '2017-03-02', '09:45:00.000000', 1),
+        ('A', '2017-03-02', '09:46:00.000000', 0),
+        ('A', '2017-03-02', '09:47:00.000000', 2),
+        ('A', '2017-03-02', '09:52:00.000000', 3),
+        ('B', '2017-03-02', '09:45:00.000000', 0)])
+
+    intervals = analytics.positive_volume_intervals(df)
+
+    # The overnight gap is never an interval and B never had volume
+    assert intervals.index.tolist() == [('A', '2017-03-01'),
+                                        ('A', '2017-03-02')]
+    first, second = intervals.loc[('A', '2017-03-01')], intervals.loc[
+        ('A', '2017-03-02')]
+    assert first['Positive Pulls'] == 1
+    assert np.isnan(first['Mean Interval'])
+    assert second['Positive Pulls'] == 3
+    assert second['Min Interval'] == 120
+    assert second['Mean Interval'] == 210
+    assert second['Max Interval'] == 300
+
+
+def test_heatmap_scores():
+    vol_by_bucket = pd.DataFrame({'09:45': [4.0, 0.0, np.nan],
+                                  '10:00': [16.0, 9.0, 1.0]},
+                                 index=['A', 'B', 'C'])
+
+    scores = analytics.heatmap_scores(vol_by_bucket)
+
+    assert scores.loc['A'].tolist() == [0.5, 1.0]
+    assert scores.loc['B'].tolist() == [0.0, 1.0]
+    assert scores.loc['C'].tolist() == [-1.0, 1.0]
+
+    bins = pd.Series([1, 0, 0], index=['A', 'B', 'C'])
+    assert analytics.heatmap_scores(vol_by_bucket, bins).index.tolist() == [
+        'B', 'C', 'A']
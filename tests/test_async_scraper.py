@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Concurrent crawl of the option pages served by a local ReplayServer.
+"""
+
+import asyncio
+import threading
+import time
+
+from async_scraper import AsyncYahooScraper, RateLimiter
+from conftest import DATES, SYMBOLS
+from fetch_backends import option_url
+from instrumentation import Metrics
+from replay import ReplayServer, request_path
+from scrape_cache import SymbolCache
+
+
+def scraper(server, symbols=SYMBOLS, **kwargs):
+    return AsyncYahooScraper(symbols, base_url=server.url, rate=1000,
+                             metrics=Metrics(), **kwargs)
+
+
+def test_scrape_all(option_server):
+    ys = scraper(option_server, SYMBOLS + ['NOPE'])
+    ys.scrape_all()
+    df = ys.data
+
+    assert len(df) == len(SYMBOLS) * len(DATES) * 4
+    assert sorted(df['Symbol'].unique()) == SYMBOLS
+    assert df['Expiration Date'].nunique() == len(DATES)
+    assert df['Contract Name'].is_unique
+    assert [x[0] for x in ys.symbol_dates('AAPL')] == [str(x) for x in DATES]
+    assert ys.symbol_dates('NOPE') == []
+    # The base page is the nearest expiry, so it is not fetched again
+    assert option_server.stats['Requests'] == len(SYMBOLS) * len(DATES) + 3
+
+
+def test_scrape_all_selected_dates(option_server):
+    ys = scraper(option_server)
+    ys.scrape_all(dates={'AAPL': [DATES[1]]})
+    df = ys.data
+
+    assert len(df[df['Symbol'] == 'AAPL']) == 4
+    assert len(df[df['Symbol'] == 'MSFT']) == len(DATES) * 4
+
+
+def test_date_page_404_does_not_make_the_symbol_missing(option_server,
+                                                       tmp_path):
+    store = option_server.store
+    store.put(request_path(option_url('', 'json', 'AAPL', DATES[1])), 404,
+              'Not Found', save=False)
+    cache = SymbolCache(str(tmp_path / 'cache.db'), min_misses=2)
+    cache.add_alias('APPLE', 'AAPL')
+
+    with ReplayServer(store) as server:
+        for _ in range(2):
+            ys = scraper(server, ['APPLE'], max_tries=2,
+                         symbol_cache=cache)
+            ys.scrape_all()
+            assert ys.data['Expiration Date'].nunique() == 1
+
+    assert not cache.is_dead('APPLE')
+    assert cache.resolve('APPLE') == 'AAPL'
+
+
+def test_scrape_iter(option_server):
+    batches = list(scraper(option_server).scrape_iter())
+
+    assert len(batches) == len(SYMBOLS) * len(DATES)
+    assert all(len(batch) == 4 for batch in batches)
+
+
+def test_scrape_iter_stops_early(option_server):
+    threads = threading.active_count()
+    stream = scraper(option_server).scrape_iter(max_pending=1)
+    next(stream)
+    stream.close()
+
+    time.sleep(0.2) # Let the executor threads see the consumer is gone
+    assert threading.active_count() <= threads + 1
+
+
+def test_rate_limiter():
+    limiter = RateLimiter(rate=20, burst=2)
+
+    async def acquire(num):
+        for _ in range(num):
+            await limiter.acquire('host')
+
+    start = time.monotonic()
+    asyncio.run(acquire(4)) # 2 at once, then 2 at 20 per second
+    assert 0.08 < time.monotonic() - start < 0.5
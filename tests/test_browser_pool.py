@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Leasing, health checks and recycling of pooled sessions, on fake browsers
+instead of Chrome.
+"""
+
+import os
+import queue
+import subprocess
+import sys
+import time
+
+import pytest
+
+from browser_pool import BrowserPool
+
+
+class FakeBrowser:
+    def __init__(self, slot):
+        self.slot = slot
+        self.alive = True
+        self.memory = 1000
+        self.quit_calls = 0
+
+    def execute_script(self, script):
+        if not self.alive:
+            raise RuntimeError('Session is gone')
+        return self.memory if 'memory' in script else 1
+
+    def quit(self):
+        self.quit_calls += 1
+        self.alive = False
+
+
+class FakeProfile:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.launched = []
+
+    def launch(self, slot=None):
+        if self.fail:
+            raise RuntimeError('No browser')
+        browser = FakeBrowser(slot)
+        self.launched.append(browser)
+        return browser
+
+
+def test_sessions_are_launched_lazily_and_reused():
+    pool = BrowserPool(size=2, profile=FakeProfile())
+
+    first = pool.acquire()
+    second = pool.acquire()
+    assert [first.slot, second.slot] == [0, 1]
+    with pytest.raises(queue.Empty): # All leased
+        pool.acquire(timeout=0.01)
+
+    pool.release(first)
+    pool.release(second)
+    assert pool.acquire() is second # Warmest first
+    assert pool.stats['Launched'] == 2
+
+
+def test_worn_out_sessions_are_recycled():
+    pool = BrowserPool(size=1, profile=FakeProfile(), max_page_loads=2,
+                       max_memory_growth=500)
+
+    browser = pool.acquire()
+    pool.record_page_load(browser)
+    pool.release(browser)
+    assert pool.acquire() is browser
+
+    pool.record_page_load(browser)
+    pool.release(browser)
+    assert browser.quit_calls == 1
+    assert pool.stats['Recycled'] == 1
+
+    browser = pool.acquire()
+    browser.memory += 501
+    pool.release(browser)
+    assert pool.stats['Recycled'] == 2
+    assert pool.acquire().slot == 0 # The slot was freed
+
+
+def test_unhealthy_sessions_are_replaced():
+    pool = BrowserPool(size=1, profile=FakeProfile())
+
+    browser = pool.acquire()
+    pool.release(browser)
+    browser.alive = False # Crashed while idle
+
+    fresh = pool.acquire()
+    assert fresh is not browser and fresh.alive
+    assert pool.stats['Unhealthy'] == 1
+    assert pool.stats['Launched'] == 2
+
+
+def test_failed_launch_frees_its_slot():
+    profile = FakeProfile(fail=True)
+    pool = BrowserPool(size=1, profile=profile)
+
+    with pytest.raises(RuntimeError):
+        pool.acquire()
+
+    profile.fail = False
+    with pool.lease() as browser:
+        assert browser.slot == 0
+
+    pool.close()
+    assert browser.quit_calls == 1
+
+
+class HungBrowser(FakeBrowser):
+    """Never quits, runs as a driver process with a browser process under it"""
+
+    def __init__(self, slot):
+        super().__init__(slot)
+        self.service = type('Service', (), {})()
+        self.service.process = subprocess.Popen(
+            [sys.executable, '-c',
+             'import subprocess, sys, time; '
+             'p = subprocess.Popen([sys.executable, "-c", '
+             '"import time; time.sleep(60)"]); '
+             'print(p.pid, flush=True); time.sleep(60)'],
+            stdout=subprocess.PIPE, text=True)
+        self.child_pid = int(self.service.process.stdout.readline())
+
+    def quit(self):
+        time.sleep(60)
+
+
+def test_kill_quits_leased_sessions():
+    pool = BrowserPool(size=2, profile=FakeProfile())
+    leased = pool.acquire()
+    with pool.lease():
+        pass
+
+    pool.kill()
+    assert [b.quit_calls for b in pool.profile.launched] == [1, 1]
+    assert leased.quit_calls == 1
+    assert pool.acquire().slot == 0 # Slots were freed
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc'), reason='Needs /proc')
+def test_kill_kills_the_processes_of_hung_sessions():
+    profile = FakeProfile()
+    profile.launch = HungBrowser
+    pool = BrowserPool(size=1, profile=profile)
+    browser = pool.acquire()
+
+    start = time.time()
+    pool.kill(timeout=0.5)
+    assert time.time() - start < 5
+    assert browser.service.process.wait(timeout=5) != 0
+    for _ in range(50):
+        if not os.path.exists('/proc/{}'.format(browser.child_pid)):
+            break
+        with open('/proc/{}/stat'.format(browser.child_pid)) as f:
+            if f.read().rsplit(')', 1)[1].split()[0] == 'Z':
+                break # Killed, waiting for init to reap it
+        time.sleep(0.1)
+    else:
+        pytest.fail('The browser process outlived its driver')
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Options of the browser profiles, and how launch() hands them to Selenium.
+"""
+
+from configparser import ConfigParser
+
+import pytest
+
+import browser_profiles
+from browser_profiles import BrowserProfile
+
+
+def test_from_config():
+    config = ConfigParser()
+    config['CURRENT'] = {'BrowserProfile': 'lean', 'BlockFonts': 'no',
+                         'DiskCacheSize': '64'}
+    profile = BrowserProfile.from_config(config['CURRENT'])
+
+    assert profile.headless and profile.block_images
+    assert not profile.block_fonts
+    assert profile.cache_size == 64
+
+    with pytest.raises(ValueError):
+        BrowserProfile.from_name('fast')
+
+
+def test_chrome_options(tmp_path):
+    profile = BrowserProfile.from_name('lean', cache_dir=str(tmp_path))
+    args = profile.for_process('worker-1').chrome_options(slot=2).arguments
+
+    assert '--headless' in args
+    assert '--js-flags=--max-old-space-size=512' in args
+    assert '--disk-cache-dir=' + str(
+        tmp_path / 'worker-1' / 'slot-2') in args
+    assert '*.woff' in profile.blocked_urls()
+    assert '*doubleclick.net*' in profile.blocked_urls()
+
+
+def test_firefox_options(tmp_path):
+    profile = BrowserProfile('firefox', headless=True, block_images=True,
+                             cache_dir=str(tmp_path), cache_size=64)
+    options = profile.firefox_options(slot=1)
+    firefox = options.to_capabilities()['moz:firefoxOptions']
+
+    assert firefox['args'] == ['-headless']
+    assert firefox['prefs']['permissions.default.image'] == 2
+    assert firefox['prefs']['browser.cache.disk.capacity'] == 64 * 1024
+    assert firefox['prefs']['browser.cache.disk.parent_directory'] == str(
+        tmp_path / 'slot-1')
+
+
+class FakeDriver:
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.commands = []
+
+    def execute_cdp_cmd(self, cmd, params):
+        self.commands.append((cmd, params))
+
+
+def test_launch_passes_options(monkeypatch):
+    monkeypatch.setattr(browser_profiles.webdriver, 'Chrome', FakeDriver)
+    monkeypatch.setattr(browser_profiles.webdriver, 'Firefox', FakeDriver)
+
+    browser = BrowserProfile.from_name('lean').launch()
+    assert list(browser.kwargs) == ['options']
+    assert browser.commands[-1][0] == 'Network.setBlockedURLs'
+
+    browser = BrowserProfile('firefox', headless=True).launch()
+    assert list(browser.kwargs) == ['options']
+    assert browser.kwargs['options'].arguments == ['-headless']
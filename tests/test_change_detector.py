@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Skipping of unchanged pages and rows.
+"""
+
+import sqlite3
+from configparser import ConfigParser
+
+import pandas as pd
+import pytest
+
+from async_scraper import AsyncYahooScraper
+from change_detector import ChangeDetector
+from conftest import DATES, SYMBOLS
+from instrumentation import Metrics
+from live_nasdaq100 import scrape_and_save
+from sqlite_store import StoreWriteError
+from volume_tracker import VolumeTracker
+
+
+def table(last_price=1.5):
+    return pd.DataFrame({'Contract Name': ['A170317C00001000',
+                                           'A170317P00001000'],
+                         'Last Price': [last_price, 2.5],
+                         'Volume': [10, 20]})
+
+
+def test_page_changed():
+    detector = ChangeDetector(trust_yahoo_time=False)
+
+    assert detector.page_changed('A', '1489708800', 'As of 10:00AM',
+                                 [table()])
+    detector.commit_pages()
+    assert not detector.page_changed('A', 1489708800, 'As of 10:01AM',
+                                     [table()])
+    assert detector.page_changed('A', 1489708800, 'As of 10:02AM',
+                                 [table(1.6)])
+    assert detector.page_changed('B', 1489708800, None, [table(1.6)])
+    assert detector.pop_skipped() == [('A', 1489708800)]
+    assert detector.pop_skipped() == []
+
+
+def test_page_changed_trusts_yahoo_time():
+    detector = ChangeDetector()
+
+    assert detector.page_changed('A', 1, 'As of 10:00AM', [table()])
+    detector.commit_pages()
+    assert not detector.page_changed('A', 1, 'As of 10:00AM', [table(1.6)])
+    assert detector.page_changed('A', 1, 'As of 10:01AM', [table(1.6)])
+    detector.commit_pages()
+    # Pages without a market notice are compared by their tables
+    assert not detector.page_changed('A', 1, None, [table(1.6)])
+
+
+def test_skips_keep_the_last_page_let_through():
+    detector = ChangeDetector(trust_yahoo_time=False)
+
+    assert detector.page_changed('A', 1, None, [[['1', '2']]])
+    detector.commit_pages()
+    assert not detector.page_changed('A', 1, None, [[['1', '2']]])
+    assert not detector.page_changed('A', 1, None, [[['1', '2']]])
+    assert detector.page_changed('A', 1, None, [[['1', '3']]])
+
+
+def test_pages_count_once_committed():
+    detector = ChangeDetector()
+
+    assert detector.page_changed('A', 1, 'As of 10:00AM', [table()])
+    # Not stored yet, e.g. the save failed
+    assert detector.page_changed('A', 1, 'As of 10:00AM', [table()])
+    detector.discard_pages()
+    detector.commit_pages()
+    assert detector.page_changed('A', 1, 'As of 10:00AM', [table()])
+
+    detector.commit_pages()
+    assert not detector.page_changed('A', 1, 'As of 10:00AM', [table()])
+
+
+def test_changed_rows():
+    detector = ChangeDetector()
+    df = table()
+
+    mask, hashes = detector.changed_rows(df, '2017-03-01')
+    assert mask.tolist() == [True, True]
+    detector.remember(df['Contract Name'], hashes)
+
+    mask, _ = detector.changed_rows(df, '2017-03-01')
+    assert mask.tolist() == [False, False]
+
+    changed = table(1.6)
+    new = pd.DataFrame({'Contract Name': ['A170317C00002000'],
+                        'Last Price': [0.5], 'Volume': [1]})
+    mask, hashes = detector.changed_rows(pd.concat([changed, new]),
+                                         '2017-03-01')
+    assert mask.tolist() == [True, False, True]
+
+
+def test_changed_rows_forgets_rows_not_remembered_and_old_dates():
+    detector = ChangeDetector()
+    df = table()
+
+    mask, hashes = detector.changed_rows(df, '2017-03-01')
+    detector.remember(df['Contract Name'][:1], hashes[:1])
+    mask, _ = detector.changed_rows(df, '2017-03-01')
+    assert mask.tolist() == [False, True] # Never written
+
+    detector.remember(df['Contract Name'], hashes)
+    mask, _ = detector.changed_rows(df, '2017-03-02')
+    assert mask.tolist() == [True, True] # Written again every day
+
+    detector.reset()
+    assert detector.changed_rows(df, '2017-03-02')[0].all()
+
+
+def test_pages_of_a_failed_save_are_scraped_again(option_server, tmp_path):
+    path = str(tmp_path / 'data.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE data (Other TEXT)') # Rejects every row
+    conn.commit()
+    config = ConfigParser()
+    config['CURRENT'] = {'DatabasePath': path, 'DataTableName': 'data'}
+    detector = ChangeDetector()
+    tracker = VolumeTracker()
+
+    def scrape_round():
+        ys = AsyncYahooScraper(SYMBOLS, base_url=option_server.url,
+                               rate=1000, metrics=Metrics(),
+                               change_detector=detector)
+        scrape_and_save(ys, tracker, config)
+        return ys
+
+    with pytest.raises(StoreWriteError):
+        scrape_round()
+    conn.execute('DROP TABLE data')
+    conn.commit()
+
+    assert len(scrape_round().data) == len(SYMBOLS) * len(DATES) * 4
+    rows = conn.execute('SELECT count(*) FROM data').fetchone()[0]
+    conn.close()
+    assert rows == len(SYMBOLS) * len(DATES) * 4
+
+    assert len(scrape_round().data) == 0 # Now they are unchanged
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Browserless fetching and parsing of option chains, served by a local
+ReplayServer instead of Yahoo.
+"""
+
+import json
+
+import pytest
+
+from fetch_backends import (FetchError, HttpBackend, option_url,
+                            parse_option_extract, parse_option_json,
+                            parse_option_text)
+from instrumentation import Metrics
+from option_parser import OPTION_COLUMNS
+from replay import FixtureStore, ReplayServer
+from retry_policy import RetryPolicy
+
+ROW = {'contractSymbol': 'AAPL170317P00130000', 'strike': 130.0,
+       'lastPrice': 1.2, 'bid': 1.1, 'ask': 1.3, 'change': 0.1,
+       'percentChange': 9.0, 'volume': 10, 'openInterest': 100,
+       'impliedVolatility': 0.25}
+
+
+def chain(options):
+    return {'optionChain': {'result': [{
+        'expirationDates': [1489708800, 1490313600],
+        'quote': {'regularMarketPrice': 139.5,
+                  'regularMarketTime': 1489700000},
+        'options': options}]}}
+
+
+def test_parse_option_json():
+    result = parse_option_json(chain([{'calls': [], 'puts': [ROW]}]))
+
+    assert result.expiration_dates == [('1489708800', 'March 17, 2017'),
+                                       ('1490313600', 'March 24, 2017')]
+    assert result.price == 139.5
+    assert result.yahoo_time.startswith('As of ')
+    assert len(result.tables) == 1 # No calls table
+    df = result.tables[0]
+    assert list(df.columns) == OPTION_COLUMNS
+    assert df['Contract Name'][0] == 'AAPL170317P00130000'
+    assert df['Implied Volatility'][0] == pytest.approx(25.0) # Percent
+
+
+def test_parse_option_json_missing_fields_are_nan():
+    sparse = {'contractSymbol': 'AAPL170317C00135000', 'strike': 135.0}
+    df = parse_option_json(chain([{'calls': [ROW, sparse]}])).tables[0]
+
+    for column in OPTION_COLUMNS:
+        if column != 'Contract Name':
+            assert df[column].dtype.kind in 'if', column
+    assert df['Volume'].isna().tolist() == [False, True]
+    assert df['Volume'].sum() == 10
+    assert df['Implied Volatility'][0] == pytest.approx(25.0)
+
+
+@pytest.mark.parametrize('payload', [{}, None, {'optionChain': {}},
+                                     {'optionChain': {'result': []}}])
+def test_parse_option_json_rejects_bad_payloads(payload):
+    with pytest.raises(FetchError):
+        parse_option_json(payload)
+
+
+def test_parse_option_text():
+    text = json.dumps(chain([{'calls': [ROW], 'puts': []}]))
+    assert len(parse_option_text(text, 'json').tables) == 1
+
+    with pytest.raises(FetchError):
+        parse_option_text('<html></html>', 'json')
+    with pytest.raises(FetchError):
+        parse_option_text('<html></html>', 'html')
+
+
+CELLS = ['130.00', 'AAPL170317C00130000', '1.50', '1.40', '1.60', '+0.10',
+         '+7.14%', '1,024', '-', '30.00%']
+
+
+def test_parse_option_extract():
+    page = parse_option_extract({
+        'ready': True, 'price': '139.50', 'time': 'As of 10:00AM EST.',
+        'dates': [['1489708800', 'March 17, 2017']],
+        'tables': [[CELLS, CELLS[:4], CELLS + ['x']],
+                   [['Show: List', 'Straddle']], []]})
+
+    assert page.expiration_dates == [('1489708800', 'March 17, 2017')]
+    assert page.price == '139.50'
+    assert page.yahoo_time == 'As of 10:00AM EST.'
+    # Short and ragged rows are dropped, tables left without rows too
+    assert len(page.tables) == 1
+    df = page.tables[0]
+    assert list(df.columns) == OPTION_COLUMNS
+    assert df.shape[0] == 1
+    assert df['Contract Name'][0] == 'AAPL170317C00130000'
+    assert df['Volume'][0] == 1024
+    assert df['Open Interest'][0] == 0 # '-'
+    assert df['Implied Volatility'][0] == 30.0
+
+
+def test_parse_option_extract_without_price():
+    page = parse_option_extract({'ready': True, 'price': None, 'time': None,
+                                 'dates': [], 'tables': [[CELLS]]})
+
+    assert page.price is None and page.yahoo_time is None
+    assert len(page.tables) == 1
+
+
+def test_option_url():
+    assert (option_url('http://x', 'json', 'AAPL', 1489708800)
+            == 'http://x/v7/finance/options/AAPL?date=1489708800')
+    assert (option_url('http://x', 'html', 'AAPL')
+            == 'http://x/quote/AAPL/options?p=AAPL')
+    assert (option_url('http://x', 'html', 'AAPL', 1489708800)
+            == 'http://x/quote/AAPL/options?p=AAPL&date=1489708800')
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = FixtureStore(str(tmp_path))
+    store.put('/v7/finance/options/AAPL', 200,
+              json.dumps(chain([{'calls': [ROW], 'puts': [ROW]}])),
+              'application/json')
+    return store
+
+
+def backend(server, metrics):
+    return HttpBackend(base_url=server.url, max_tries=3, retry=RetryPolicy(
+        3, base_delay=0, metrics=metrics))
+
+
+def test_http_backend(store):
+    metrics = Metrics()
+    with ReplayServer(store) as server:
+        page = backend(server, metrics).get_option_page('AAPL')
+
+    assert page.price == 139.5
+    assert len(page.tables) == 2
+    assert server.stats['Requests'] == 1
+
+
+def test_http_backend_does_not_retry_404(store):
+    metrics = Metrics()
+    with ReplayServer(store) as server:
+        with pytest.raises(FetchError):
+            backend(server, metrics).get_option_page('MSFT')
+
+    assert server.stats['Requests'] == 1
+    assert metrics.counter('page_404_total', source='http') == 1
+
+
+def test_http_backend_retries_errors(store):
+    metrics = Metrics()
+    with ReplayServer(store, error_rate=1) as server:
+        with pytest.raises(FetchError):
+            backend(server, metrics).get_option_page('AAPL')
+
+    assert server.stats['Requests'] == 3
+    assert metrics.counter('retries_total', error='HTTP 503') == 2
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Counters, histograms and spans of the Metrics registry, and the ways they
+are exported: Prometheus text, JSON dumps and the HTTP endpoint.
+"""
+
+import json
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+
+from instrumentation import Histogram, Metrics
+
+
+def test_histogram_quantiles():
+    histogram = Histogram(max_samples=100)
+    assert np.isnan(histogram.quantiles()).all()
+
+    for value in range(1, 101):
+        histogram.observe(value)
+    assert histogram.count == 100
+    assert histogram.sum == 5050
+    assert histogram.quantiles() == pytest.approx([50.5, 95.05, 99.01])
+
+    # Only the latest samples make the quantiles, count and sum keep all
+    for value in range(1000, 1100):
+        histogram.observe(value)
+    assert histogram.count == 200
+    assert histogram.quantiles([0, 1]) == [1000, 1099]
+
+
+def test_counters_and_spans():
+    metrics = Metrics()
+    metrics.inc('retries_total', error='Page404Error')
+    metrics.inc('retries_total', 2, error='Page404Error')
+    metrics.inc('retries_total', error='TimeoutException')
+    with metrics.span('page_load_seconds', symbol='AAPL'):
+        pass
+
+    assert metrics.counter('retries_total', error='Page404Error') == 3
+    assert metrics.counter('retries_total') == 0 # Other labels
+    span = metrics.spans[-1]
+    assert span['name'] == 'page_load_seconds'
+    assert span['symbol'] == 'AAPL'
+    report = metrics.report()
+    assert report['Metric'].tolist() == ['page_load_seconds']
+    assert report['Count'].tolist() == [1]
+
+    metrics.reset()
+    assert metrics.counter('retries_total', error='Page404Error') == 0
+    assert not len(metrics.report())
+
+
+def test_to_prometheus():
+    metrics = Metrics()
+    metrics.inc('retries_total', error='Page404Error')
+    metrics.inc('retries_total', error='HTTP 503')
+    for value in (1.0, 2.0, 3.0):
+        metrics.observe('page_load_seconds', value)
+
+    lines = metrics.to_prometheus().splitlines()
+    assert lines == [
+        '# TYPE retries_total counter',
+        'retries_total{error="HTTP 503"} 1',
+        'retries_total{error="Page404Error"} 1',
+        '# TYPE page_load_seconds summary',
+        'page_load_seconds{quantile="0.5"} 2.0',
+        'page_load_seconds{quantile="0.95"} 2.9',
+        'page_load_seconds{quantile="0.99"} 2.98',
+        'page_load_seconds_sum 6.0',
+        'page_load_seconds_count 3']
+
+
+def test_to_prometheus_escapes_labels():
+    metrics = Metrics()
+    metrics.inc('errors_total', error='say "hi"\\now\nthen')
+
+    assert metrics.to_prometheus().splitlines()[-1] == (
+        'errors_total{error="say \\"hi\\"\\\\now\\nthen"} 1')
+
+
+def test_dump_json(tmp_path):
+    metrics = Metrics()
+    metrics.inc('retries_total', error='Page404Error')
+    metrics.record('symbol_seconds', 2.5, symbol='AAPL', expiry='1489708800')
+    path = str(tmp_path / 'metrics.json')
+
+    metrics.dump_json(path)
+    with open(path) as f:
+        data = json.load(f)
+
+    assert data['counters'] == [{'name': 'retries_total',
+                                 'labels': {'error': 'Page404Error'},
+                                 'value': 1}]
+    histogram, = data['histograms']
+    assert histogram['name'] == 'symbol_seconds'
+    assert histogram['count'] == 1
+    assert histogram['p50'] == histogram['p99'] == 2.5
+    assert data['spans'][0]['symbol'] == 'AAPL'
+    assert data['spans'][0]['seconds'] == 2.5
+    assert not (tmp_path / 'metrics.json.tmp').exists()
+
+    metrics.dump_json(path, spans=False)
+    with open(path) as f:
+        assert 'spans' not in json.load(f)
+
+
+def test_serve():
+    metrics = Metrics()
+    metrics.inc('retries_total', error='Page404Error')
+    server = metrics.serve(0, host='127.0.0.1')
+    url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+
+    try:
+        with urllib.request.urlopen(url + '/metrics') as response:
+            assert response.headers['Content-Type'].startswith('text/plain')
+            assert response.read().decode() == metrics.to_prometheus()
+
+        with urllib.request.urlopen(url + '/metrics.json') as response:
+            data = json.loads(response.read())
+        assert data['counters'][0]['value'] == 1
+
+        with pytest.raises(urllib.error.HTTPError) as info:
+            urllib.request.urlopen(url + '/nothing')
+        assert info.value.code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar buffering of option tables and their constant columns.
+"""
+
+import numpy as np
+import pandas as pd
+
+from option_buffer import OptionBuffer, concat_frames
+
+
+def table(num_rows, start=0):
+    return pd.DataFrame({'Strike': np.arange(start, start + num_rows,
+                                             dtype=np.float64),
+                         'Volume': np.arange(num_rows)})
+
+
+def test_constants_are_expanded_per_table():
+    buffer = OptionBuffer()
+    buffer.append(table(2), {'Symbol': 'AAPL', 'Price @ DL Time': 139.5})
+    buffer.append(table(3, 10), {'Symbol': 'MSFT', 'Yahoo Time': 'Close'})
+    df = buffer.to_frame()
+
+    assert len(buffer) == len(df) == 5
+    assert list(df.columns) == ['Strike', 'Volume', 'Symbol',
+                                'Price @ DL Time', 'Yahoo Time']
+    assert df['Strike'].tolist() == [0, 1, 10, 11, 12]
+    assert df['Symbol'].tolist() == ['AAPL'] * 2 + ['MSFT'] * 3
+    assert df['Price @ DL Time'].dtype == np.float64
+    assert df['Price @ DL Time'].isna().tolist() == [False] * 2 + [True] * 3
+    assert pd.isna(df['Yahoo Time'][0]) and df['Yahoo Time'][2] == 'Close'
+
+
+def test_to_frame_is_cached_until_the_next_append():
+    buffer = OptionBuffer()
+    buffer.append(table(2), {'Symbol': 'AAPL'})
+    df = buffer.to_frame()
+    assert buffer.to_frame() is df
+
+    buffer.append(table(1), {'Symbol': 'AAPL'})
+    assert len(buffer.to_frame()) == 3
+    assert len(df) == 2
+
+
+def test_categorical_and_column_order():
+    buffer = OptionBuffer(categorical=True,
+                          columns=['Symbol', 'Volume', 'Missing'])
+    buffer.append(table(2), {'Symbol': 'AAPL'})
+    buffer.append(table(2), {'Symbol': 'MSFT'})
+    df = buffer.to_frame()
+
+    assert list(df.columns) == ['Symbol', 'Volume']
+    assert df['Symbol'].dtype.name == 'category'
+    assert df['Symbol'].tolist() == ['AAPL', 'AAPL', 'MSFT', 'MSFT']
+
+
+def test_from_frame_and_clear():
+    df = table(3).assign(Symbol='AAPL')
+    buffer = OptionBuffer.from_frame(df)
+    assert buffer.to_frame() is df
+
+    buffer.append(table(1), {'Symbol': 'MSFT'})
+    assert buffer.to_frame()['Symbol'].tolist() == ['AAPL'] * 3 + ['MSFT']
+
+    buffer.clear()
+    assert len(buffer) == 0
+    assert buffer.to_frame().empty
+
+
+def test_from_frame_keeps_categoricals():
+    df = table(2).assign(Symbol=pd.Categorical(['AAPL', 'AAPL']))
+    buffer = OptionBuffer.from_frame(df, categorical=True)
+    buffer.append(table(1), {'Symbol': 'MSFT', 'Volume': 7})
+    df = buffer.to_frame()
+
+    assert df['Symbol'].dtype.name == 'category'
+    assert df['Symbol'].tolist() == ['AAPL', 'AAPL', 'MSFT']
+    assert df['Volume'].tolist() == [0, 1, 7]
+
+
+def test_concat_frames_keeps_categoricals():
+    frames = [pd.DataFrame({'Symbol': pd.Categorical([s]), 'Volume': [1]})
+              for s in ['AAPL', 'MSFT']]
+    df = concat_frames(frames)
+
+    assert df['Symbol'].dtype.name == 'category'
+    assert df['Symbol'].tolist() == ['AAPL', 'MSFT']
+    assert concat_frames(frames[:1]) is frames[0]
+    assert concat_frames([]).empty
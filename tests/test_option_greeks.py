@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Black-Scholes prices, greeks and implied volatility of whole chains.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from option_greeks import (ANALYTICS_COLUMNS, black_scholes, chain_analytics,
+                           greeks, implied_volatility, norm_cdf)
+
+# Calls then puts, at and around the money
+IS_CALL = np.array([True] * 3 + [False] * 3)
+STRIKE = np.array([90.0, 100.0, 110.0] * 2)
+
+
+def test_norm_cdf():
+    x = np.array([-1.959964, 0.0, 1.0, 1.959964])
+    assert norm_cdf(x) == pytest.approx([0.025, 0.5, 0.8413447, 0.975],
+                                        rel=1e-6)
+    assert norm_cdf(-x) == pytest.approx(1 - norm_cdf(x), abs=1e-7)
+
+
+def test_black_scholes():
+    # Hull's example, 10.45 and 5.57
+    prices = black_scholes([True, False], 100.0, 100.0, 1.0, 0.2, rate=0.05)
+    assert prices == pytest.approx([10.4506, 5.5735], abs=1e-4)
+
+    # Put-call parity with a dividend yield
+    call, put = black_scholes([True, False], 100.0, 95.0, 0.5, 0.3,
+                              rate=0.02, dividend=0.01)
+    assert call - put == pytest.approx(
+        100 * np.exp(-0.01 * 0.5) - 95 * np.exp(-0.02 * 0.5))
+
+
+def test_greeks_match_finite_differences():
+    args = dict(rate=0.01, dividend=0.02)
+    spot, years, vol, h = 100.0, 0.25, 0.3, 1e-3
+
+    def price(spot=spot, years=years, vol=vol):
+        return black_scholes(IS_CALL, spot, STRIKE, years, vol, **args)
+
+    values = greeks(IS_CALL, spot, STRIKE, years, vol, **args)
+    assert values['Delta'] == pytest.approx(
+        (price(spot + h) - price(spot - h)) / (2 * h), abs=1e-5)
+    assert values['Gamma'] == pytest.approx(
+        (price(spot + h) - 2 * price() + price(spot - h)) / h**2, abs=1e-4)
+    assert values['Vega'] == pytest.approx(
+        (price(vol=vol + 0.01) - price(vol=vol - 0.01)) / 2, abs=1e-4)
+    day = 1 / 365.0
+    assert values['Theta'] == pytest.approx(
+        (price(years=years - day) - price(years=years + day)) / 2, abs=1e-4)
+
+
+def test_implied_volatility_round_trip():
+    vols = np.array([0.3, 0.05, 0.8, 1.5, 0.2, 0.45])
+    prices = black_scholes(IS_CALL, 100.0, STRIKE, 0.1, vols, rate=0.03)
+
+    solved = implied_volatility(prices, IS_CALL, 100.0, STRIKE, 0.1,
+                                rate=0.03)
+    assert solved == pytest.approx(vols, abs=1e-5)
+
+
+def test_implied_volatility_of_bad_prices_is_nan():
+    # Below intrinsic value, above the spot, expired, and one good call
+    vol = implied_volatility([5.0, 120.0, 3.0, 3.0], True, 100.0,
+                             [90.0, 100.0, 100.0, 100.0],
+                             [0.1, 0.1, 0.0, 0.1])
+
+    assert np.isnan(vol[:3]).all()
+    assert vol[3] > 0
+
+
+def test_chain_analytics_of_raw_rows():
+    df = pd.DataFrame({
+        'Contract Name': ['AAPL170317C00130000', 'AAPL170317P00130000',
+                          'AAPL170317C00135000'],
+        'Last Price': ['9.85', '0.20', '5.10'],
+        'Bid': ['9.70', '0.19', '-'],
+        'Ask': ['9.90', '0.21', '-'],
+        'Price @ DL Time': ['139.50'] * 3,
+        'Expiration Date': ['March 17, 2017'] * 3,
+        'Download DateTime': ['2017-03-01 10:00:00'] * 3
+    }, index=[5, 6, 7])
+    analytics = chain_analytics(df)
+
+    assert list(analytics.columns) == ANALYTICS_COLUMNS
+    assert analytics.index.tolist() == [5, 6, 7]
+    assert analytics['Days to Expiry'].tolist() == [16.25] * 3
+    # Mid where there is a two-sided quote, last price otherwise
+    assert analytics['Option Price'].tolist() == pytest.approx(
+        [9.8, 0.2, 5.1])
+    assert analytics['Moneyness'][5] == pytest.approx(130 / 139.5)
+    assert (analytics['Model IV'] > 0).all()
+    assert analytics['Delta'][5] > 0 > analytics['Delta'][6]
+
+    last = chain_analytics(df, price='last')
+    assert last['Option Price'].tolist() == pytest.approx([9.85, 0.2, 5.1])
+    with pytest.raises(ValueError):
+        chain_analytics(df, price='bid')
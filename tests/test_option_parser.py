@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Parsing of Yahoo option tables from page source.
+"""
+
+import numpy as np
+
+from option_parser import OPTION_COLUMNS, parse_option_tables, to_number
+
+ROWS = [['130.00', 'AAPL170317C00130000', '9.85', '9.70', '9.95', '+0.35',
+         '+3.68%', '1,024', '12,345', '25.00%'],
+        ['135.00', 'AAPL170317C00135000', '5.10', '-', '5.20', '0.00',
+         '0.00%', '-', '87', '22.56%']]
+
+
+def page(rows):
+    """Options page with one table, found by FALLBACK_XPATH"""
+
+    head = ''.join('<th>{}</th>'.format(c) for c in OPTION_COLUMNS)
+    body = ''.join('<tr>{}</tr>'.format(
+        ''.join('<td>{}</td>'.format(cell) for cell in row)) for row in rows)
+    table = '<table><thead><tr>{0}</tr></thead><tbody>{1}</tbody></table>'
+    return '<html><body><div>{}</div></body></html>'.format(
+        table.format(head, body))
+
+
+def test_to_number():
+    values = to_number(['1,024', '+1.5%', '-', '', None, 3])
+    assert values[:2].tolist() == [1024.0, 1.5]
+    assert np.isnan(values[2:5]).all()
+    assert values[5] == 3.0
+
+
+def test_parse_option_tables():
+    tables = parse_option_tables(page(ROWS))
+
+    assert len(tables) == 1
+    df = tables[0]
+    assert list(df.columns) == OPTION_COLUMNS
+    assert df['Contract Name'].tolist() == [r[1] for r in ROWS]
+    assert df['Strike'].tolist() == [130.0, 135.0]
+    assert df['Volume'].dtype == np.int64
+    assert df['Volume'].tolist() == [1024, 0] # '-' is nothing traded
+    assert df['Open Interest'].tolist() == [12345, 87]
+    assert np.isnan(df['Bid'][1])
+    assert df['Implied Volatility'].tolist() == [25.0, 22.56]
+
+
+def test_parse_option_tables_skips_empty_and_short_rows():
+    assert parse_option_tables(page([])) == []
+    assert len(parse_option_tables(page(ROWS + [['1', '2']]))[0]) == 2
+
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+OCC contract name decoding, typing of scraped rows and the text format of
+the data table.
+"""
+
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from option_schema import (SCHEMA, decode_contract_names, normalize,
+                           to_epochs, to_text_format)
+
+
+def test_decode_contract_names():
+    decoded = decode_contract_names(['AAPL170317C00130000',
+                                     'BRKB170421P00172500', 'not a contract'])
+
+    assert decoded['Option Type'].tolist()[:2] == ['Call', 'Put']
+    assert decoded['Strike'].tolist()[:2] == [130.0, 172.5]
+    assert decoded['Strike'].dtype == np.float32
+    assert decoded['Expiration Date'].tolist()[:2] == [
+        pd.Timestamp('2017-03-17').value, pd.Timestamp('2017-04-21').value]
+    assert np.isnan(decoded['Strike'][2])
+    assert pd.isna(decoded['Option Type'][2])
+    assert decoded['Expiration Date'][2] == pd.NaT.value
+
+
+def scraped():
+    """Rows as stored in the data table before SCHEMA"""
+
+    return pd.DataFrame({
+        'Symbol': ['AAPL', 'AAPL'],
+        'Contract Name': ['AAPL170317C00130000', 'AAPL170317P00130000'],
+        'Last Price': ['9.85', '-'],
+        'Volume': ['1,024', '-'],
+        'Open Interest': [12345, 87],
+        'Expiration Date': ['March 17, 2017', 'March 17, 2017'],
+        'Download DateTime': [str(datetime(2017, 3, 1, 9, 46, 10, 5000)),
+                              str(datetime(2017, 3, 1, 9, 46, 10))],
+        'Download Date': ['2017-03-01', '2017-03-01']
+    })
+
+
+def test_normalize():
+    df = normalize(scraped())
+
+    assert list(df.columns) == [c for c in SCHEMA if c in df.columns]
+    for column in df.columns:
+        assert str(df[column].dtype) == SCHEMA[column], column
+    assert df['Volume'].tolist() == [1024, 0]
+    assert np.isnan(df['Last Price'][1])
+    assert df['Option Type'].tolist() == ['Call', 'Put']
+    assert df['Download DateTime'][0] == pd.Timestamp(
+        '2017-03-01 09:46:10.005').value
+
+
+def test_normalize_is_idempotent():
+    df = normalize(scraped())
+    pd.testing.assert_frame_equal(normalize(df), df)
+
+
+def test_text_format_round_trip():
+    raw = scraped()
+    text = to_text_format(normalize(raw))
+
+    assert text['Expiration Date'].tolist() == raw['Expiration Date'].tolist()
+    assert (text['Download DateTime'].tolist()
+            == raw['Download DateTime'].tolist())
+
+
+def test_text_format_keeps_text_and_nat():
+    raw = scraped()
+    assert to_text_format(raw) is raw
+
+    df = normalize(raw.assign(**{'Contract Name': ['bad', 'bad']}))
+    assert to_text_format(df)['Expiration Date'].tolist() == [None, None]
+
+
+def test_to_epochs():
+    expected = [pd.Timestamp('2017-03-01 09:46:10.005').value,
+                pd.Timestamp('2017-03-01 09:46:10').value, pd.NaT.value]
+    text = pd.Series(scraped()['Download DateTime'].tolist() + [None])
+
+    assert to_epochs(text).tolist() == expected
+    assert to_epochs(pd.to_datetime(expected)).tolist() == expected
+    assert to_epochs(np.array(expected)).tolist() == expected
+
+    # datetime64 of another unit than ns, as pandas 3 may give
+    seconds = np.array(['2017-03-17'], dtype='datetime64[s]')
+    assert to_epochs(seconds)[0] == pd.Timestamp('2017-03-17').value
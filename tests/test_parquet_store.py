@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Partitioned Parquet writes, compaction and filtered reads.
+"""
+
+import glob
+import os
+
+import pandas as pd
+import pyarrow.dataset as ds
+import pytest
+
+from parquet_store import ParquetStore, to_arrow
+
+
+def pull(date, symbol, volume=1):
+    return pd.DataFrame({
+        'Symbol': symbol,
+        'Contract Name': [symbol + '170317C00130000',
+                          symbol + '170317P00130000'],
+        'Last Price': ['9.85', '-'],
+        'Volume': [volume, '1,024'],
+        'Download Date': date
+    })
+
+
+def files(root, pattern='*.parquet'):
+    return sorted(glob.glob(os.path.join(root, '*', '*', pattern)))
+
+
+def test_to_arrow_types():
+    table = to_arrow(pull('2017-03-01', 'AAPL'))
+
+    assert str(table.schema.field('Last Price').type) == 'double'
+    assert str(table.schema.field('Volume').type) == 'int64'
+    assert table.column('Volume').to_pylist() == [1, 1024]
+    assert table.column('Last Price').to_pylist()[0] == pytest.approx(9.85)
+
+
+def test_write_and_read_with_filters(tmp_path):
+    store = ParquetStore(str(tmp_path))
+    for date in ['2017-03-01', '2017-03-02']:
+        for symbol in ['AAPL', 'MSFT']:
+            store.write(pull(date, symbol))
+
+    assert len(files(store.root)) == 4
+    assert not glob.glob(os.path.join(store.root, '*', '*', '.*'))
+
+    df = store.read('2017-03-02', symbols=['MSFT'],
+                    columns=['Contract Name', 'Volume'])
+    assert list(df.columns) == ['Contract Name', 'Volume']
+    assert df['Contract Name'].str.startswith('MSFT').all()
+    assert len(df) == 2
+
+    df = store.read(filter=ds.field('Volume') > 1)
+    assert len(df) == 4
+
+
+def test_compact(tmp_path):
+    store = ParquetStore(str(tmp_path), min_files=3)
+    for volume in range(3):
+        store.write(pull('2017-03-01', 'AAPL', volume))
+    store.write(pull('2017-03-01', 'MSFT'))
+
+    # Left behind by a writer of another process, still writing
+    partition = os.path.dirname(files(store.root)[0])
+    with open(os.path.join(partition, '.part-unfinished.parquet'), 'wb'):
+        pass
+
+    assert store.compact() == 1
+    names = [os.path.basename(f).split('-')[0] for f in files(store.root)]
+    assert names == ['compact', 'part']
+    assert len(store.read()) == 8
+    assert sorted(store.read(symbols=['AAPL'])['Volume']) == [
+        0, 1, 2, 1024, 1024, 1024]
+    assert os.path.isfile(os.path.join(partition, '.part-unfinished.parquet'))
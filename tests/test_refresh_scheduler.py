@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Budgeted, activity driven refresh scheduling of option chains.
+"""
+
+import pandas as pd
+import pytest
+
+from refresh_scheduler import RefreshScheduler
+
+NOW = 1489500000.0
+EXPIRIES = [1489708800, 1490313600]
+
+
+def scheduler(budget=60, **kwargs):
+    scheduler = RefreshScheduler(budget, **kwargs)
+    scheduler._refill(NOW)
+    return scheduler
+
+
+def test_new_chains_are_due_after_their_interval():
+    sched = scheduler(min_interval=1, max_interval=100)
+    sched.sync('AAPL', EXPIRIES, NOW)
+
+    assert sched.symbols == {'AAPL'}
+    assert sched.due(NOW) == {}
+    interval = max(sched.interval('AAPL', x, NOW) for x in EXPIRIES)
+    assert sched.due(NOW + interval) == {'AAPL': EXPIRIES}
+
+
+def test_due_is_bounded_by_the_budget():
+    sched = scheduler(budget=2, min_interval=1, max_interval=1)
+    sched.sync('AAPL', EXPIRIES, NOW)
+    sched.sync('MSFT', EXPIRIES, NOW)
+
+    assert sum(len(x) for x in sched.due(NOW + 1).values()) == 2
+    assert sched.due(NOW + 1) == {}
+    # 2 per minute, earned back over time
+    assert sum(len(x) for x in sched.due(NOW + 31).values()) == 1
+
+
+def test_admit_defer_and_charge():
+    sched = scheduler(budget=3, min_interval=10, max_interval=40)
+    sched.sync('AAPL', EXPIRIES, NOW)
+
+    assert sched.admit(['AAPL', 'MSFT', 'GOOG'], NOW) == ['MSFT', 'GOOG']
+    sched.defer('GOOG', NOW)
+    # The expiration pages of the two symbols admitted whole
+    sched.charge(4, NOW)
+    assert sched.admit(['MSFT'], NOW + 60) == [] # Still in debt
+    assert sched.admit(['MSFT', 'GOOG'], NOW + 80) == ['MSFT']
+
+    now = NOW + 100
+    for backoff in [20, 40, 40]: # Doubling, up to max_interval
+        sched.defer('GOOG', now)
+        assert sched.admit(['GOOG'], now + backoff - 1) == []
+        now += backoff
+        assert sched.admit(['GOOG'], now) == ['GOOG']
+    sched.sync('GOOG', EXPIRIES, now)
+    assert 'GOOG' in sched.symbols
+
+    sched.charge(-100, now + 60) # Never beyond the budget
+    assert len(sched.admit(['A', 'B', 'C', 'D'], now + 60)) == 3
+
+
+def test_active_chains_are_refreshed_more_often():
+    sched = scheduler(min_interval=1, max_interval=10000)
+    sched.sync('AAPL', EXPIRIES, NOW)
+    quiet = sched.interval('AAPL', EXPIRIES[0], NOW)
+
+    # The first pull only tells when it was pulled
+    sched.observe('AAPL', EXPIRIES[0], 1000000, NOW)
+    assert sched.interval('AAPL', EXPIRIES[0], NOW) == quiet
+
+    sched.observe('AAPL', EXPIRIES[0], 600, NOW + 60)
+    sched.observe('AAPL', EXPIRIES[1], 0, NOW + 60)
+    assert (sched.interval('AAPL', EXPIRIES[0], NOW + 60)
+            < quiet < sched.interval('AAPL', EXPIRIES[1], NOW + 60))
+
+
+def test_total_score_follows_time_and_chains():
+    sched = scheduler()
+    sched.sync('AAPL', EXPIRIES, NOW)
+    later = NOW + 86400
+
+    expected = sum(sched._score(0, x, later) for x in EXPIRIES)
+    assert sched.total_score(later) == pytest.approx(expected)
+
+    sched.sync('AAPL', EXPIRIES[1:], later)
+    assert sched.total_score(later) == pytest.approx(
+        sched._score(0, EXPIRIES[1], later))
+
+
+def test_observe_frame():
+    sched = scheduler()
+    sched.sync('AAPL', EXPIRIES, NOW)
+    df = pd.DataFrame({'Symbol': 'AAPL',
+                       'Expiration Date': [x * 10**9 for x in EXPIRIES * 2],
+                       'Volume': [10, 0, 20, 0]})
+
+    sched.observe_frame(df, NOW)
+    sched.observe_frame(df, NOW + 60)
+    activity = {key[1]: chain[0] for key, chain in sched._chains.items()}
+    assert activity == {EXPIRIES[0]: pytest.approx(0.3 * 30),
+                        EXPIRIES[1]: 0}
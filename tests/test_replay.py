@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Recording option pages into a FixtureStore and serving them back, with the
+latency and failures a ReplayServer injects. A ReplayServer of made up
+pages stands in for Yahoo while recording.
+"""
+
+import json
+import time
+
+import pytest
+import requests
+
+from conftest import DATES, option_chain
+from fetch_backends import option_url
+from replay import FixtureStore, ReplayServer, record, request_path
+
+
+@pytest.fixture
+def yahoo(tmp_path):
+    """Pages of AAPL, a renamed APPLE that redirects to it and a 404"""
+
+    store = FixtureStore(str(tmp_path / 'yahoo'))
+    for date in [None] + DATES:
+        store.put(request_path(option_url('', 'json', 'AAPL', date)), 200,
+                  json.dumps(option_chain('AAPL', date)), 'application/json',
+                  save=False)
+    store.put('/v7/finance/options/APPLE', 301,
+              location='/v7/finance/options/AAPL', save=False)
+    store.put('/v7/finance/options/GONE', 404, 'Not Found', save=False)
+    store.save()
+
+    with ReplayServer(store) as server:
+        yield server
+
+
+def get(server, path):
+    return requests.get(server.url + path, allow_redirects=False)
+
+
+def test_record_and_replay(yahoo, tmp_path):
+    store = FixtureStore(str(tmp_path / 'fixtures'))
+    num_pages = record(store, ['AAPL', 'APPLE', 'GONE'], base_url=yahoo.url)
+
+    # AAPL and its dates, then the redirect and its dates again, and GONE
+    assert num_pages == 3 + 4 + 1
+    assert len(store) == 5
+
+    # Read back from disk and served as recorded
+    with ReplayServer(FixtureStore(store.root)) as replay:
+        for path in sorted(yahoo.store.index):
+            expected, actual = get(yahoo, path), get(replay, path)
+            assert actual.status_code == expected.status_code
+            assert actual.content == expected.content
+            assert (actual.headers.get('Content-Type')
+                    == expected.headers.get('Content-Type'))
+            assert (actual.headers.get('Location')
+                    == expected.headers.get('Location'))
+
+        assert get(replay, '/v7/finance/options/MSFT').status_code == 404
+
+
+def test_latency(yahoo):
+    path = request_path(option_url('', 'json', 'AAPL'))
+    with ReplayServer(yahoo.store, latency=0.2, jitter=0.1) as replay:
+        for _ in range(3):
+            start = time.time()
+            assert get(replay, path).status_code == 200
+            assert 0.2 <= time.time() - start < 1
+
+
+def test_injected_failures(yahoo):
+    path = request_path(option_url('', 'json', 'AAPL'))
+
+    with ReplayServer(yahoo.store, error_rate=1) as replay:
+        assert get(replay, path).status_code == 503
+    assert replay.stats == {'Requests': 1, 'Errors': 1, 'Not Found': 0}
+
+    with ReplayServer(yahoo.store, not_found_rate=1) as replay:
+        assert get(replay, path).status_code == 404
+    assert replay.stats == {'Requests': 1, 'Errors': 0, 'Not Found': 1}
+
+    def statuses(seed):
+        with ReplayServer(yahoo.store, error_rate=0.2, not_found_rate=0.3,
+                          seed=seed) as replay:
+            codes = [get(replay, path).status_code for _ in range(200)]
+        assert replay.stats['Errors'] == codes.count(503)
+        assert replay.stats['Not Found'] == codes.count(404)
+        return codes
+
+    codes = statuses(seed=1)
+    assert 20 <= codes.count(503) <= 60
+    assert 40 <= codes.count(404) <= 80
+    assert codes.count(200) == 200 - codes.count(503) - codes.count(404)
+    assert statuses(seed=1) == codes # Same seed, same failures
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Bounded, jittered retries and browser waits that poll the page.
+"""
+
+import pytest
+
+from instrumentation import Metrics
+from retry_policy import RetryPolicy, wait_for_url_change, wait_until
+
+
+class Flaky:
+    """Raises the given errors in turn, then returns 'ok'"""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'ok'
+
+
+def policy(**kwargs):
+    return RetryPolicy(base_delay=0, metrics=Metrics(), **kwargs)
+
+
+def test_delay():
+    retry = RetryPolicy(base_delay=0.5, max_delay=3, jitter=False)
+    assert [retry.delay(x) for x in range(4)] == [0.5, 1, 2, 3]
+
+    retry = RetryPolicy(base_delay=0.5, max_delay=3)
+    assert all(0 <= retry.delay(3) <= 3 for _ in range(100))
+
+
+def test_call_retries_until_it_returns():
+    retry = policy(max_attempts=3)
+    func = Flaky(ValueError(), KeyError())
+
+    assert retry.call(func) == 'ok'
+    assert func.calls == 3
+    assert retry.metrics.counter('retries_total', error='ValueError') == 1
+    assert retry.metrics.counter('retries_total', error='KeyError') == 1
+
+
+def test_call_gives_up():
+    retry = policy(max_attempts=2)
+    func = Flaky(ValueError('first'), ValueError('last'), ValueError())
+    with pytest.raises(ValueError, match='last'):
+        retry.call(func)
+    assert func.calls == 2
+
+    func = Flaky(KeyError(), ValueError())
+    with pytest.raises(KeyError): # Not worth retrying
+        retry.call(func, retry_on=(ValueError,))
+    assert func.calls == 1
+
+
+def test_budgets_per_error_class():
+    # LookupError covers KeyError, and never more than max_attempts
+    retry = policy(max_attempts=5, budgets={LookupError: 2, ValueError: 9})
+    assert retry.budget(KeyError()) == 2
+    assert retry.budget(ValueError()) == 5
+    assert retry.budget(OSError()) == 5
+
+    func = Flaky(KeyError(), ValueError(), KeyError(), ValueError())
+    with pytest.raises(KeyError):
+        retry.call(func)
+    assert func.calls == 3
+
+
+def test_before_retry():
+    retry = policy()
+    seen = []
+    error = ValueError()
+
+    assert retry.call(Flaky(error), before_retry=seen.append) == 'ok'
+    assert seen == [error]
+
+
+class FakeBrowser:
+    """Navigates to new_url and finishes loading after some polls"""
+
+    def __init__(self, url, new_url=None, polls=2):
+        self.urls = [url] * polls + [new_url or url]
+
+    @property
+    def current_url(self):
+        return self.urls.pop(0) if len(self.urls) > 1 else self.urls[0]
+
+    def execute_script(self, script):
+        if 'readyState' in script:
+            return 'complete'
+
+
+def test_wait_until():
+    browser = FakeBrowser('a')
+    assert wait_until(browser, lambda b: 'value', 1, poll=0.01) == 'value'
+    assert wait_until(browser, lambda b: False, 0.05, poll=0.01) is None
+
+
+def test_wait_for_url_change():
+    browser = FakeBrowser('old', 'new')
+    assert wait_for_url_change(browser, 'old', 1) == 'new'
+
+    browser = FakeBrowser('old')
+    assert wait_for_url_change(browser, 'old', 0.2) is None
+
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Rollup aggregation and the upserts that merge it into the rollup tables,
+against the same metrics computed from raw rows by analytics.py.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import analytics
+from rollups import Rollups, aggregate, minute_rollup, roll_up
+from sqlite_store import SQLiteStore
+
+SYMBOLS = ['AAA', 'BBB', 'CCC']
+
+
+def pulls(num_pulls=30, seed=0):
+    """Pulls of 2 days, with pulls exactly on a bucket boundary"""
+
+    rng = np.random.RandomState(seed)
+    contracts = ['{0}170317C{1:08d}'.format(s, k * 1000) for s in SYMBOLS
+                 for k in range(4)]
+    frames = []
+    for day in ['2017-03-01', '2017-03-02']:
+        for t in pd.date_range(day + ' 09:45:00', periods=num_pulls,
+                               freq='150s'):
+            frames.append(pd.DataFrame({
+                'Symbol': [c[:3] for c in contracts],
+                'Contract Name': contracts,
+                'Last Price': rng.uniform(1, 5, len(contracts)),
+                'Volume': rng.randint(0, 5, len(contracts)),
+                'Open Interest': rng.randint(0, 100, len(contracts)),
+                'Download DateTime': t.value,
+                'Download Date': str(t.date()),
+                'Download Time': t.strftime('%H:%M:%S.%f')
+            }))
+    return frames
+
+
+@pytest.fixture
+def rollups(tmp_path):
+    store = SQLiteStore(str(tmp_path / 'data.db'))
+    yield Rollups(store, 'data')
+    store.close()
+
+
+def fill(rollups, frames):
+    """Write each pull in two halves, as StreamWriter may"""
+
+    for df in frames:
+        half = len(df) // 2
+        for part in (df.iloc[:half], df.iloc[half:]):
+            rollups.store.write('data', part)
+            rollups.ingest(part)
+            rollups.store.flush()
+
+
+def test_aggregate():
+    df = pd.concat(pulls(num_pulls=7)[:7], ignore_index=True)
+    rollup = aggregate(df, '15m', 'symbol')
+
+    expected = analytics.volume_by_bucket(analytics.volume_by_time(df))
+    expected = expected.stack().sort_index()
+    actual = rollup.set_index(['Symbol', 'Bucket'])['Volume'].sort_index()
+    assert actual.values.tolist() == expected.values.tolist()
+    assert (pd.to_datetime(actual.index.levels[1]).tolist()
+            == expected.index.levels[1].tolist())
+
+    # 09:45:00 is the end of the 09:30 bucket
+    assert rollup['Bucket'].min() == pd.Timestamp('2017-03-01 09:30').value
+    assert (rollup['Pulls'].sum()
+            == len(SYMBOLS) * df['Download DateTime'].nunique())
+
+
+def test_aggregate_contract_keeps_latest_values():
+    frames = pulls(num_pulls=3)[:3]
+    rollup = aggregate(pd.concat(frames[::-1], ignore_index=True), '1d',
+                       'contract')
+
+    last = frames[-1].set_index('Contract Name')
+    rollup = rollup.set_index('Contract Name').loc[last.index]
+    assert (rollup['Last Price'].values == last['Last Price'].values).all()
+    assert (rollup['Open Interest'].values
+            == last['Open Interest'].values).all()
+    assert (rollup['Pulls'] == 3).all()
+    assert (rollup['Last Pull'] == last['Download DateTime']).all()
+
+
+def test_pull_at_midnight_rolls_up_to_its_own_day():
+    times = pd.to_datetime(['2017-03-01 23:59:30', '2017-03-02 00:00:00'])
+    df = pd.DataFrame({'Symbol': 'AAA', 'Contract Name': 'AAA170317C1',
+                       'Last Price': [1.0, 2.0], 'Volume': [3, 4],
+                       'Open Interest': [10, 20],
+                       'Download DateTime': [t.value for t in times]})
+
+    minutes = minute_rollup(df, 'contract')
+    assert len(minutes['Bucket']) == 2 # Same minute, two days
+
+    minute = roll_up(minutes, '1m', 'contract')
+    assert minute[['Volume', 'Pulls', 'Last Price']].values.tolist() == [
+        [7, 2, 2.0]]
+    day = roll_up(minutes, '1d', 'contract')
+    assert day['Bucket'].tolist() == [pd.Timestamp('2017-03-01').value,
+                                      pd.Timestamp('2017-03-02').value]
+    assert day['Volume'].tolist() == [3, 4]
+    assert day['Pulls'].tolist() == [1, 1]
+    pd.testing.assert_frame_equal(aggregate(df, '1d', 'contract'), day)
+
+
+def test_merged_rollups_match_analytics(rollups):
+    frames = pulls()
+    fill(rollups, frames)
+    vol_by_time = analytics.volume_by_time(pd.concat(frames))
+
+    expected = analytics.volume_by_bucket(vol_by_time)
+    actual = rollups.volume_by_bucket('2017-03-01', '2017-03-02')
+    assert actual.columns.tolist() == expected.columns.tolist()
+    np.testing.assert_array_equal(actual.values, expected.values)
+
+    pd.testing.assert_frame_equal(
+        rollups.eod_volume('2017-03-01', '2017-03-02'),
+        analytics.eod_volume(vol_by_time), check_names=False)
+    pd.testing.assert_frame_equal(
+        rollups.pull_counts('2017-03-01', '2017-03-02'),
+        analytics.pull_counts(vol_by_time), check_names=False)
+
+
+def test_volume(rollups):
+    frames = pulls()
+    fill(rollups, frames)
+    df = pd.concat(frames)
+    times = pd.to_datetime(df['Download DateTime'])
+
+    def expected(start, end):
+        inside = (times > start) & (times <= end)
+        return df[inside.values].groupby('Symbol')['Volume'].sum()
+
+    for start, end in [('2017-03-01 10:00', '2017-03-01 10:30'),
+                       ('2017-03-01 09:46', '2017-03-02 09:47')]:
+        actual = rollups.volume(start, end)
+        assert actual.tolist() == expected(
+            pd.Timestamp(start), pd.Timestamp(end)).tolist()
+
+    # Whole download dates
+    assert (rollups.volume('2017-03-01', '2017-03-03').tolist()
+            == df.groupby('Symbol')['Volume'].sum().tolist())
+
+
+def test_rebuild_reproduces_rollups(rollups):
+    fill(rollups, pulls())
+    sql = ('SELECT * FROM "data_1m_contract" '
+           'ORDER BY Bucket, "Contract Name"')
+    before = rollups.store.read(sql)
+
+    rollups.rebuild('2017-03-01', '2017-03-02')
+    pd.testing.assert_frame_equal(rollups.store.read(sql), before)
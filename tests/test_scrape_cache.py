@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Expiration dates and symbols cached across runs, and the pages they save.
+"""
+
+from async_scraper import AsyncYahooScraper
+from conftest import DATES, SYMBOLS
+from instrumentation import Metrics
+from scrape_cache import ExpirationDateCache, SymbolCache
+
+NOW = 1489500000.0
+CACHED = [(str(x), 'March {}, 2017'.format(day))
+          for x, day in zip(DATES, [17, 24])]
+
+
+def test_expiration_dates(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    cache = ExpirationDateCache(path, ttl=3600)
+    assert cache.get('AAPL', NOW) is None
+
+    cache.put('AAPL', CACHED, NOW)
+    cache.put('MSFT', [], NOW) # Nothing to cache
+    # Another process, or the next run
+    cache = ExpirationDateCache(path, ttl=3600)
+    assert cache.get('AAPL', NOW + 3600) == CACHED
+    assert cache.get('AAPL', NOW + 3601) is None # Stale
+    assert cache.get('MSFT', NOW) is None
+
+    cache.invalidate('AAPL')
+    assert cache.get('AAPL', NOW) is None
+
+
+def test_expired_dates_are_dropped(tmp_path):
+    cache = ExpirationDateCache(str(tmp_path / 'cache.db'), ttl=86400 * 30)
+    cache.put('AAPL', CACHED, NOW)
+
+    assert cache.get('AAPL', DATES[0] + 86399) == CACHED
+    assert cache.get('AAPL', DATES[0] + 86400) == CACHED[1:]
+    assert cache.get('AAPL', DATES[1] + 86400) is None
+
+
+def test_scraper_skips_base_pages_of_cached_symbols(option_server, tmp_path):
+    cache = ExpirationDateCache(str(tmp_path / 'cache.db'), ttl=10**10)
+
+    def scrape():
+        ys = AsyncYahooScraper(SYMBOLS, base_url=option_server.url,
+                               rate=1000, date_cache=cache,
+                               metrics=Metrics())
+        ys.scrape_all()
+        return ys
+
+    first = scrape()
+    requests = option_server.stats['Requests']
+    assert [x[0] for x in cache.get('AAPL', NOW)] == [str(x) for x in DATES]
+
+    second = scrape()
+    assert (option_server.stats['Requests'] - requests
+            == len(SYMBOLS) * len(DATES))
+    assert len(second.data) == len(first.data)
+
+
+def test_symbol_aliases(tmp_path):
+    cache = SymbolCache(str(tmp_path / 'cache.db'))
+    assert cache.resolve('FB') == 'FB'
+
+    cache.add_alias('FB', 'META', NOW)
+    cache.add_alias('AAPL', 'AAPL', NOW) # Not renamed
+    assert cache.resolve('FB') == 'META'
+    assert cache.resolve('AAPL') == 'AAPL'
+
+    cache.remove_alias('FB')
+    assert cache.resolve('FB') == 'FB'
+
+
+def test_dead_symbols(tmp_path, monkeypatch):
+    cache = SymbolCache(str(tmp_path / 'cache.db'), min_misses=2,
+                        dead_ttl=3600)
+    cache.mark_missing('NOPE', NOW)
+    assert not cache.is_dead('NOPE', NOW) # Maybe a random 404 page
+
+    cache.mark_missing('NOPE', NOW + 60)
+    assert cache.is_dead('NOPE', NOW + 60)
+    assert not cache.is_dead('NOPE', NOW + 3661) # Tried again
+
+    cache.mark_found('NOPE')
+    cache.mark_missing('NOPE', NOW + 120)
+    assert not cache.is_dead('NOPE', NOW + 120)
+
+    writes = []
+    monkeypatch.setattr(cache, '_execute', lambda *args: writes.append(args))
+    cache.mark_found('AAPL')
+    assert writes == []
+
+
+def test_scraper_resolves_aliases_and_skips_dead_symbols(option_server,
+                                                         tmp_path):
+    cache = SymbolCache(str(tmp_path / 'cache.db'), min_misses=2)
+    cache.add_alias('APPLE', 'AAPL')
+
+    def scrape():
+        ys = AsyncYahooScraper(['APPLE', 'NOPE'], base_url=option_server.url,
+                               rate=1000, symbol_cache=cache,
+                               metrics=Metrics())
+        ys.scrape_all()
+        return ys
+
+    ys = scrape()
+    assert ys.yahoo_symbols['APPLE'] == 'AAPL'
+    assert len(ys.data) == len(DATES) * 4
+    scrape()
+    assert cache.is_dead('NOPE')
+
+    requests = option_server.stats['Requests']
+    scrape()
+    assert option_server.stats['Requests'] - requests == len(DATES)
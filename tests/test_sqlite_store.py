@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Batched writes, upserts and error handling of the SQLite store.
+"""
+
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sqlite_store import (SQLiteStore, StoreWriteError, short_decimals,
+                          to_rows)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SQLiteStore(str(tmp_path / 'data.db'))
+    yield store
+    store.close()
+
+
+def test_write_and_read(store):
+    df = pd.DataFrame({'Symbol': ['AAA', 'BBB'], 'Volume': [1, None],
+                       'Note': ['x', None]})
+    store.write('data', df)
+    store.flush()
+
+    read = store.read('SELECT * FROM data')
+    assert read['Symbol'].tolist() == ['AAA', 'BBB']
+    assert read['Volume'].isna().tolist() == [False, True]
+    assert read['Note'].isna().tolist() == [False, True]
+
+
+def test_float32_is_written_as_its_shortest_decimal(store):
+    df = pd.DataFrame({'Price': np.array([9.85, np.nan], dtype=np.float32),
+                       'Strike': [130.5, np.nan]})
+    assert to_rows(df) == [(9.85, 130.5), (None, None)]
+
+    store.write('data', df)
+    store.flush()
+    assert store.read('SELECT Price FROM data')['Price'][0] == 9.85
+
+
+def test_short_decimals():
+    values = np.array([139.5, 9.85, 0.01, 123456.79, 1 / 3, np.nan],
+                      dtype=np.float32)
+    decimals = short_decimals(values)
+
+    assert decimals[:4].tolist() == [139.5, 9.85, 0.01, 123456.79]
+    # More than 6 decimals are only widened, and still read back the same
+    assert decimals[4] == np.float64(values[4])
+    assert np.isnan(decimals[5])
+    assert (decimals[:5].astype(np.float32) == values[:5]).all()
+
+
+def test_to_rows_missing_values():
+    df = pd.DataFrame({'Symbol': pd.Categorical(['AAA', None]),
+                       'Note': ['x', None], 'Volume': [1, 2],
+                       'Price': [np.nan, 1.5]})
+    assert to_rows(df) == [('AAA', 'x', 1, None), (None, None, 2, 1.5)]
+
+
+def test_merge_upsert(store):
+    merge = {'Volume': 'Volume + excluded.Volume'}
+    for volume, price in [(1, 2.0), (3, 2.5)]:
+        store.write('totals', pd.DataFrame({
+            'Symbol': ['AAA'], 'Volume': [volume], 'Price': [price]}),
+            keys=['Symbol'], merge=merge)
+    store.flush()
+
+    read = store.read('SELECT * FROM totals')
+    assert read.to_dict('records') == [
+        {'Symbol': 'AAA', 'Volume': 4, 'Price': 2.5}]
+
+
+def test_failed_write_keeps_other_rows(store):
+    store.write('data', pd.DataFrame({'Symbol': ['AAA']}))
+    store.flush()
+
+    # One batch as the writer thread takes it
+    conn = store._connect()
+    store._commit(conn, [
+        ('INSERT INTO missing VALUES (1)', ()),
+        ('data', pd.DataFrame({'Symbol': ['BBB']}), None, None)])
+    conn.close()
+    with pytest.raises(StoreWriteError):
+        store.flush()
+
+    store.flush() # The error is raised once
+    assert store.read('SELECT * FROM data')['Symbol'].tolist() == [
+        'AAA', 'BBB']
+
+
+def test_failed_connect_fails_the_batch_only(store, monkeypatch):
+    connect = store._connect
+    calls = []
+
+    def flaky_connect(**kwargs):
+        calls.append(kwargs)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError('unable to open database file')
+        return connect(**kwargs)
+
+    monkeypatch.setattr(store, '_connect', flaky_connect)
+    store.write('data', pd.DataFrame({'Symbol': ['AAA']}))
+    with pytest.raises(StoreWriteError): # Instead of waiting forever
+        store.flush()
+
+    store.write('data', pd.DataFrame({'Symbol': ['BBB']}))
+    store.flush()
+    assert store.read('SELECT * FROM data')['Symbol'].tolist() == ['BBB']
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Chunked background writes of streamed batches.
+"""
+
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from stream_writer import StreamWriter, StreamWriteError
+
+
+def batch(num_rows):
+    return pd.DataFrame({'Volume': range(num_rows)})
+
+
+def test_batches_are_written_in_chunks():
+    chunks = []
+    with StreamWriter(chunks.append, max_rows=5, max_delay=60) as writer:
+        for num_rows in [2, 2, 2, 3, 0, 1]:
+            writer.put(batch(num_rows))
+
+    assert [len(x) for x in chunks] == [6, 4]
+    assert writer.rows == 10 and writer.chunks == 2
+
+
+def test_chunk_is_written_after_max_delay():
+    chunks = []
+    writer = StreamWriter(chunks.append, max_rows=100, max_delay=0.1)
+    writer.put(batch(2))
+    time.sleep(0.5)
+
+    assert [len(x) for x in chunks] == [2]
+    writer.close()
+    assert writer.chunks == 1
+
+
+def test_failed_write_is_raised():
+    def write(df):
+        raise OSError('Disk full')
+
+    writer = StreamWriter(write, max_rows=1)
+    writer.put(batch(1))
+    time.sleep(0.2)
+
+    with pytest.raises(StreamWriteError) as info:
+        writer.put(batch(1))
+    assert isinstance(info.value.__cause__, OSError)
+    writer.close() # Raised once
+    assert writer.rows == 0
+
+
+def test_put_blocks_behind_a_slow_sink():
+    release = threading.Event()
+    writer = StreamWriter(lambda df: release.wait(), max_rows=1,
+                          max_pending=1)
+    writer.put(batch(1)) # Taken by the writer, which blocks in write()
+    time.sleep(0.1)
+    writer.put(batch(1)) # Fills the queue
+
+    done = threading.Event()
+    thread = threading.Thread(target=lambda: (writer.put(batch(1)),
+                                              done.set()))
+    thread.start()
+    assert not done.wait(0.2)
+
+    release.set()
+    assert done.wait(1)
+    writer.close()
+    assert writer.rows == 3
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Rounds of the worker pool, with a fake scraper in place of the browser
+that crashes, hangs or answers as told by its symbol.
+"""
+
+import multiprocessing as mp
+import os
+import time
+
+import pandas as pd
+import pytest
+
+import supervisor
+from instrumentation import Metrics
+
+pytestmark = pytest.mark.skipif(mp.get_start_method() != 'fork',
+                                reason='Workers inherit the fake scraper')
+
+
+class FakeScraper:
+    """Scrapes 'HANG' forever and crashes once on 'CRASH'"""
+
+    crash_marker = None
+
+    def __init__(self, symbol, **kwargs):
+        self.symbol = symbol
+        self.timer = {'Page Load': [0.1, 0.1]}
+        self.data = pd.DataFrame()
+
+    def scrape_all(self):
+        start = time.time()
+        if self.symbol == 'HANG':
+            time.sleep(60)
+        if self.symbol == 'SLOW':
+            time.sleep(3)
+        if self.symbol == 'CRASH' and not os.path.exists(self.crash_marker):
+            open(self.crash_marker, 'w').close()
+            os._exit(1)
+        if self.symbol == 'FAIL':
+            raise ValueError('No data')
+
+        self.data = pd.DataFrame({'Symbol': [self.symbol] * 2,
+                                  'Volume': [1, 2], 'Start': start})
+
+
+@pytest.fixture
+def pool(tmp_path, monkeypatch):
+    monkeypatch.setattr(supervisor, 'YahooScraper', FakeScraper)
+    monkeypatch.setattr(FakeScraper, 'crash_marker',
+                        str(tmp_path / 'crashed'))
+    pools = []
+
+    def make(num_workers=2, **kwargs):
+        pool = supervisor.Supervisor(num_workers, metrics=Metrics(),
+                                     **kwargs)
+        pool.start()
+        pools.append(pool)
+        return pool
+
+    yield make
+    for pool in pools:
+        pool.stop()
+        pool._manager.shutdown()
+
+
+def test_run_round(pool):
+    workers = pool()
+    data = workers.run_round(['A', 'B', 'C', 'FAIL'])
+
+    assert sorted(data['Symbol'].unique()) == ['A', 'B', 'C']
+    report = workers.report()
+    assert report['Symbols'].sum() == 3
+    assert report['Rows'].sum() == 6
+    assert report['Pages'].sum() == 6
+    assert report['Errors'].sum() == 1
+
+
+def test_crashed_worker_is_restarted(pool):
+    workers = pool()
+    data = workers.run_round(['A', 'CRASH', 'B'])
+
+    assert sorted(data['Symbol'].unique()) == ['A', 'B', 'CRASH']
+    assert workers.report()['Restarts'].sum() == 1
+    assert all(p.is_alive() for p in workers.workers.values())
+
+
+def test_stuck_worker_exits_and_symbol_gives_up(pool):
+    workers = pool(symbol_timeout=0.5, max_tries=2)
+    data = workers.run_round(['A', 'HANG', 'B'])
+
+    assert sorted(data['Symbol'].unique()) == ['A', 'B']
+    assert workers.report()['Restarts'].sum() == 2
+    assert workers.metrics.counter('worker_restarts_total') == 2
+    # The next round still works
+    assert len(workers.run_round(['C'])) == 2
+
+
+def test_round_timeout(pool):
+    workers = pool(num_workers=1, round_timeout=1)
+    start = time.time()
+    data = workers.run_round(['A', 'SLOW', 'B'])
+
+    assert time.time() - start < 2.5
+    assert data['Symbol'].unique().tolist() == ['A']
+    assert workers.metrics.counter('round_timeouts_total') == 1
+
+
+def test_late_result_is_not_taken_by_the_next_round(pool):
+    workers = pool(round_timeout=1)
+    assert len(workers.run_round(['SLOW'])) == 0
+
+    # The result of the first round comes in halfway through this one
+    workers.round_timeout = 10
+    start = time.time()
+    data = workers.run_round(['SLOW'])
+
+    assert len(data) == 2
+    assert (data['Start'] >= start).all()
+
+
+def test_hung_worker_restarts_all_workers(pool, monkeypatch):
+    worker_main = supervisor.worker_main
+
+    def hung_main(*args):
+        worker_main(*args[:-1], None) # Never gives up by itself
+
+    monkeypatch.setattr(supervisor, 'worker_main', hung_main)
+    monkeypatch.setattr(supervisor, 'HUNG_GRACE', 0.5)
+    workers = pool(symbol_timeout=0.5, max_tries=1)
+    queues = workers.tasks, workers.results
+    data = workers.run_round(['A', 'HANG', 'B'])
+
+    assert sorted(data['Symbol'].unique()) == ['A', 'B']
+    assert workers.tasks is not queues[0]
+    assert workers.results is not queues[1]
+    assert len(workers.run_round(['C'])) == 2
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Appending, sealing and reading back the tick history.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from option_schema import to_epochs
+from tick_store import TickStore
+
+CONTRACTS = ['A170317C00001000', 'A170317P00001000', 'A170324C00001000',
+             'B170317C00002000']
+
+
+def pull(time, volume=1):
+    return pd.DataFrame({
+        'Symbol': [c[0] for c in CONTRACTS],
+        'Contract Name': CONTRACTS,
+        'Last Price': ['1.5', '-', '2', '3'],
+        'Volume': np.arange(len(CONTRACTS)) + volume,
+        'Download DateTime': str(pd.Timestamp(time))
+    })
+
+
+def fill(root):
+    ticks = TickStore(root)
+    pulls = [pull(t, i) for i, t in enumerate(
+        ['2017-03-01 10:00', '2017-03-01 10:05', '2017-03-02 10:00',
+         '2017-03-03 10:00'])]
+    for df in pulls:
+        ticks.append(df)
+    return ticks, pd.concat(pulls, ignore_index=True)
+
+
+def test_days_are_sealed_and_read_back(tmp_path):
+    ticks, data = fill(str(tmp_path))
+
+    assert ticks.segments == ['segment-000000', 'segment-000001']
+    for contract in CONTRACTS:
+        history = TickStore(str(tmp_path)).history(contract)
+        expected = data[data['Contract Name'] == contract]
+        assert (history['Download DateTime'].tolist()
+                == to_epochs(expected['Download DateTime']).tolist())
+        assert history['Volume'].tolist() == expected['Volume'].tolist()
+        assert (history['Contract Name'] == contract).all()
+        assert history['Ask'].isna().all() # Not in the data
+
+
+def test_views_of_sealed_days_are_memory_maps(tmp_path):
+    ticks, _ = fill(str(tmp_path))
+    ticks.seal()
+
+    views = ticks.views(CONTRACTS[0], fields=['Volume'])
+    assert len(views) == 3
+    for view in views:
+        assert isinstance(view['Volume'], np.memmap)
+        assert not view['Volume'].flags.writeable
+
+
+def test_date_range(tmp_path):
+    ticks, _ = fill(str(tmp_path))
+
+    history = ticks.history(CONTRACTS[0], '2017-03-02', '2017-03-03')
+    assert history['Volume'].tolist() == [2, 3]
+    assert len(ticks.history(CONTRACTS[0], end_date='2017-03-01')) == 2
+    assert len(ticks.history('not a contract')) == 0
+
+
+def test_expiry_history(tmp_path):
+    ticks, _ = fill(str(tmp_path))
+    ticks.seal()
+
+    history = ticks.expiry_history('A', '2017-03-17')
+    assert sorted(set(history['Contract Name'])) == CONTRACTS[:2]
+    assert len(history) == 8
+
+
+def test_partial_records_are_trimmed(tmp_path):
+    ticks, _ = fill(str(tmp_path))
+    with open(os.path.join(str(tmp_path), 'open', 'volume.bin'), 'ab') as f:
+        f.write(b'\0\0\0') # A write cut short
+
+    ticks = TickStore(str(tmp_path))
+    ticks.append(pull('2017-03-03 10:05', 9))
+    assert ticks.history(CONTRACTS[0], '2017-03-03')['Volume'].tolist() == [
+        3, 9]
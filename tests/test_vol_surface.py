@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Smiles per expiry, surfaces interpolated in total variance and their
+history.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from option_greeks import black_scholes
+from vol_surface import SurfaceBuilder, SurfaceStore
+
+MONEYNESS = [0.9, 1.0, 1.1]
+TENORS = [30, 45, 60]
+NOW = pd.Timestamp('2017-03-01 16:00')
+
+
+def chain(days, vol, symbol='AAPL', now=NOW):
+    """Calls and puts of one expiry priced at a flat vol, as typed rows"""
+
+    strikes = np.arange(80.0, 125.0, 5.0)
+    is_call = np.repeat([True, False], len(strikes))
+    strikes = np.tile(strikes, 2)
+    expiry = now.normalize() + pd.Timedelta(days=days)
+    price = black_scholes(is_call, 100.0, strikes, days / 365.0, vol)
+
+    return pd.DataFrame({
+        'Symbol': symbol,
+        'Option Type': np.where(is_call, 'Call', 'Put'),
+        'Strike': strikes,
+        'Expiration Date': expiry.value,
+        'Last Price': price,
+        'Bid': price,
+        'Ask': price,
+        'Price @ DL Time': 100.0,
+        'Download DateTime': now.value
+    })
+
+
+def builder(**kwargs):
+    return SurfaceBuilder(moneyness=MONEYNESS, tenors=TENORS, **kwargs)
+
+
+def test_surface_interpolates_in_total_variance():
+    surfaces = builder()
+    surfaces.observe_frame(pd.concat([chain(30, 0.2), chain(60, 0.3)]))
+    surface = surfaces.surface('AAPL')
+
+    assert surface.index.tolist() == TENORS
+    assert surface.loc[30].tolist() == pytest.approx([20] * 3, abs=0.01)
+    assert surface.loc[60].tolist() == pytest.approx([30] * 3, abs=0.01)
+    # Half way in variance, not in vol
+    expected = 100 * np.sqrt((0.2**2 * 30 + 0.3**2 * 60) / 2 / 45)
+    assert surface.loc[45, 1.0] == pytest.approx(expected, abs=0.01)
+
+    ts = surfaces.term_structure('AAPL')
+    assert ts.index.tolist() == [30, 60]
+    assert ts.tolist() == pytest.approx([20, 30], abs=0.01)
+    assert surfaces.surface('MSFT') is None
+
+
+def test_expiry_replaces_its_own_smile_only():
+    surfaces = builder()
+    surfaces.observe_frame(pd.concat([chain(30, 0.2), chain(60, 0.3)]))
+    later = NOW + pd.Timedelta(minutes=5)
+    surfaces.observe_frame(chain(30, 0.25, now=later))
+
+    ts = surfaces.term_structure('AAPL')
+    assert ts.tolist() == pytest.approx([25, 30], abs=0.01)
+
+    # Only the latest pull of an expiry counts
+    surfaces.observe_frame(pd.concat([chain(30, 0.4), chain(30, 0.35,
+                                                            now=later)]))
+    assert surfaces.term_structure('AAPL').iloc[0] == pytest.approx(35,
+                                                                     abs=0.01)
+
+
+def test_no_extrapolation_past_the_strikes_or_expiries():
+    surfaces = SurfaceBuilder(moneyness=[0.5, 1.0], tenors=[7, 30])
+    surfaces.observe_frame(chain(30, 0.2))
+    surface = surfaces.surface('AAPL')
+
+    assert np.isnan(surface.loc[7]).all()
+    assert np.isnan(surface.loc[30, 0.5])
+    assert surface.loc[30, 1.0] == pytest.approx(20, abs=0.01)
+
+
+def test_frame_without_any_iv_keeps_the_smiles():
+    surfaces = builder()
+    surfaces.observe_frame(chain(30, 0.2))
+
+    # Expiring today and pulled after the close, so every IV is NaN
+    expired = chain(30, 0.2, now=NOW + pd.Timedelta(minutes=5))
+    expired['Expiration Date'] = NOW.normalize().value
+    surfaces.observe_frame(expired)
+
+    assert surfaces.symbols == ['AAPL']
+    assert surfaces.term_structure('AAPL').index.tolist() == [30]
+
+
+def test_snapshot_history_and_reload(tmp_path):
+    path = str(tmp_path / 'surfaces.npz')
+    surfaces = builder(path=path)
+    for minutes in range(20): # Past the first capacity of the store
+        now = NOW + pd.Timedelta(minutes=minutes)
+        surfaces.observe_frame(pd.concat([chain(30, 0.2, now=now),
+                                          chain(30, 0.2, 'MSFT', now)]))
+        assert surfaces.snapshot() == 2
+    assert surfaces.snapshot() == 0 # Nothing observed since
+    surfaces.store.save()
+
+    store = SurfaceStore(MONEYNESS, TENORS, path)
+    assert store.symbols == ['AAPL', 'MSFT'] and len(store) == 40
+    times, grids = store.history('AAPL', NOW + pd.Timedelta(minutes=5),
+                                 NOW + pd.Timedelta(minutes=9))
+    assert len(times) == len(grids) == 5
+    assert store.at('AAPL', NOW - pd.Timedelta(minutes=1)) is None
+    assert store.at('AAPL', NOW).loc[30, 1.0] == pytest.approx(20, abs=0.01)
+    assert len(store.history('GOOG')[1]) == 0
+
+    with pytest.raises(ValueError): # Another grid
+        SurfaceStore(MONEYNESS, [30], path)
+
+    surfaces.reset()
+    assert surfaces.symbols == []
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental volume from running totals, and how save_increments() only
+counts the volume it stored.
+"""
+
+import sqlite3
+from configparser import ConfigParser
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from live_nasdaq100 import save_increments
+from sqlite_store import StoreWriteError
+from volume_tracker import VolumeTracker
+
+DAY = '2017-03-01'
+
+
+def test_update():
+    tracker = VolumeTracker()
+
+    assert tracker.update(DAY, ['A', 'B'], [10, '-']).tolist() == [10, 0]
+    assert tracker.update(DAY, ['A', 'B', 'C'], [15, 3, 2]).tolist() == [
+        5, 3, 2]
+    # Yahoo going back on its numbers never gives negative volume
+    assert tracker.update(DAY, ['A'], [12]).tolist() == [0]
+    assert tracker.update(DAY, ['A'], [16]).tolist() == [1]
+    assert len(tracker) == 3
+
+
+def test_new_day_starts_from_nothing():
+    tracker = VolumeTracker()
+    tracker.update(DAY, ['A'], [10])
+
+    assert tracker.increments('2017-03-02', ['A'], [4]).tolist() == [4]
+    tracker.add('2017-03-02', ['A'], [4])
+    assert tracker.date == '2017-03-02'
+    assert tracker.increments('2017-03-02', ['A'], [6]).tolist() == [2]
+
+
+def test_increments_leave_totals_alone():
+    tracker = VolumeTracker()
+    tracker.seed(DAY, ['A', 'B'], [10, None])
+
+    assert tracker.increments(DAY, ['A', 'B', 'C'], [12, 1, 5]).tolist() == [
+        2, 1, 5]
+    assert tracker.increments(DAY, ['A', 'B', 'C'], [12, 1, 5]).tolist() == [
+        2, 1, 5]
+    assert len(tracker) == 2
+
+    tracker.add(DAY, ['A', 'B', 'C'], [12, 1, 5])
+    assert tracker.increments(DAY, ['A', 'B', 'C'], [12, 1, 5]).tolist() == [
+        0, 0, 0]
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / 'totals.npz')
+    tracker = VolumeTracker(path)
+    tracker.update(DAY, ['A', 'B'], [10, 3])
+    tracker.save()
+
+    loaded = VolumeTracker(path)
+    assert loaded.date == DAY
+    assert loaded.increments(DAY, ['A', 'B'], [11, 3]).tolist() == [1, 0]
+
+
+def config(path):
+    config = ConfigParser()
+    config['CURRENT'] = {'DatabasePath': path, 'DataTableName': 'data'}
+    return config
+
+
+def pull(volumes):
+    return pd.DataFrame({'Symbol': 'AAPL', 'Contract Name': ['A', 'B'],
+                         'Volume': volumes})
+
+
+def test_save_increments_counts_stored_volume_only(tmp_path):
+    path = str(tmp_path / 'data.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE data (Other TEXT)') # Rejects every row
+    conn.commit()
+    tracker = VolumeTracker()
+
+    with pytest.raises(StoreWriteError):
+        save_increments(pull([10, 3]), tracker, config(path))
+    assert len(tracker) == 0
+
+    conn.execute('DROP TABLE data')
+    conn.commit()
+    conn.close()
+    save_increments(pull([12, 3]), tracker, config(path))
+    save_increments(pull([15, 4]), tracker, config(path))
+
+    conn = sqlite3.connect(path)
+    volume = conn.execute('SELECT sum(Volume) FROM data').fetchone()[0]
+    conn.close()
+    assert volume == 19
+    today = str(datetime.now().date())
+    assert tracker.increments(today, ['A', 'B'], [15, 4]).tolist() == [0, 0]
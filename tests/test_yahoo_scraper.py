@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+Reading option pages through the single EXTRACT_JS call, on a fake browser
+that answers with canned payloads.
+"""
+
+import json
+
+import pytest
+
+from fetch_backends import EXTRACT_JS, EXTRACT_ARGS, parse_option_extract
+from instrumentation import Metrics
+from retry_policy import RetryPolicy
+from scrape_cache import SymbolCache
+from yahoo_scraper import YahooScraper, ElementEmptyError, Page404Error
+
+CELLS = ['130.00', 'AAPL170317C00130000', '1.50', '1.40', '1.60', '+0.10',
+         '+7.14%', '10', '100', '30.00%']
+
+
+def payload(ready=True, price='139.50', rows=(CELLS,)):
+    return {'ready': ready, 'price': price, 'time': 'As of 10:00AM EST.',
+            'dates': [['1489708800', 'March 17, 2017']],
+            'tables': [list(rows), []]}
+
+
+class FakeBrowser:
+    """Answers EXTRACT_JS with the given payloads, the last one forever"""
+
+    def __init__(self, *payloads):
+        self.payloads = list(payloads)
+        self.calls = []
+        self.refreshes = 0
+
+    def execute_script(self, script, *args):
+        self.calls.append((script, args))
+        data = (self.payloads.pop(0) if len(self.payloads) > 1
+                else self.payloads[0])
+        return json.dumps(data)
+
+    def refresh(self):
+        self.refreshes += 1
+
+
+def scraper(browser):
+    metrics = Metrics()
+    ys = YahooScraper('AAPL', explicit_wait=0.3, metrics=metrics,
+                      retry=RetryPolicy(3, base_delay=0, metrics=metrics))
+    ys.browser = browser
+    return ys
+
+
+def test_extract_page():
+    browser = FakeBrowser(payload())
+    result = scraper(browser)._extract_page()
+
+    assert result == payload()
+    assert browser.calls == [(EXTRACT_JS, tuple(EXTRACT_ARGS))]
+    assert browser.refreshes == 0
+
+
+def test_extract_page_polls_until_rows_render():
+    browser = FakeBrowser(payload(ready=False), payload(rows=()),
+                          payload(price=None), payload())
+    result = scraper(browser)._extract_page()
+
+    assert result == payload()
+    assert len(browser.calls) == 4
+    assert browser.refreshes == 0
+
+
+def test_extract_page_refreshes_an_empty_table():
+    browser = FakeBrowser(payload(rows=()))
+    ys = scraper(browser)
+    result = ys._extract_page()
+
+    # Rendered without option rows, e.g. puts only, after every refresh
+    assert browser.refreshes == 2
+    assert ys.metrics.counter('page_refreshes_total') == 2
+    assert parse_option_extract(result).tables == []
+
+
+def test_extract_page_without_price_raises():
+    browser = FakeBrowser(payload(price=None))
+
+    with pytest.raises(ElementEmptyError):
+        scraper(browser)._extract_page()
+    assert browser.refreshes == 2
+
+
+def test_extract_page_drops_ragged_rows():
+    browser = FakeBrowser(payload(rows=(CELLS, CELLS[:3], CELLS + ['x'])))
+    page = parse_option_extract(scraper(browser)._extract_page())
+
+    assert len(page.tables) == 1
+    assert page.tables[0]['Contract Name'].tolist() == [CELLS[1]]
+
+
+def test_date_page_404_does_not_make_the_symbol_missing(tmp_path):
+    cache = SymbolCache(str(tmp_path / 'cache.db'), min_misses=2)
+    cache.add_alias('APPLE', 'AAPL')
+
+    def iter_one_stock(symbol, dates=None):
+        yield ('1489708800', 'March 17, 2017'), None, 'AAPL'
+        raise Page404Error # The next date page ran out of retries
+
+    for _ in range(2):
+        ys = scraper(FakeBrowser(payload()))
+        ys.symbols = ['APPLE']
+        ys.symbol_cache = cache
+        ys._iter_one_stock = iter_one_stock
+        assert len(list(ys._iter_all())) == 1
+
+    assert not cache.is_dead('APPLE')
+    assert cache.resolve('APPLE') == 'AAPL'
+
+    # Missing from the first page on is a miss
+    def not_found(symbol, dates=None):
+        raise Page404Error
+        yield
+
+    for _ in range(2):
+        ys._iter_one_stock = not_found
+        assert list(ys._iter_all()) == []
+    assert cache.is_dead('APPLE')
@@ -0,0 +1,483 @@
+# -*- coding: utf-8 -*-
+"""
+Append-only tick history of every contract in fixed-width column files, one
+file per field, memory-mapped for reading. The history of one contract or
+one expiry over weeks comes back as NumPy views into the files, one per day,
+without reading any other contract or scanning the data table. Layout under
+the root folder:
+
+    contracts.txt               Symbol and contract name of each contract
+                                id, one per line
+    open/<field>.bin            Records of the current day in arrival order
+    segment-000000/<field>.bin  Sealed days, sorted by symbol, expiry,
+    segment-000000/index.npz    contract and time, with where each contract
+                                starts
+
+The open day is sealed once records of a later day arrive, or by seal().
+Each writer process needs a root of its own. Readers can open any root at
+any time.
+
+    ticks = TickStore(root)
+    ticks.append(df)
+    ticks.history('AAPL170317C00130000', '2017-03-01', '2017-03-17')
+"""
+
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from option_schema import (decode_contract_names, to_epochs, to_float32,
+                           to_int64)
+
+# Fields of a record and their widths
+FIELDS = OrderedDict([
+    ('Download DateTime', 'int64'),
+    ('Contract ID', 'int32'),
+    ('Last Price', 'float32'),
+    ('Bid', 'float32'),
+    ('Ask', 'float32'),
+    ('Volume', 'int64'),
+    ('Open Interest', 'int64'),
+    ('Implied Volatility', 'float32'),
+    ('Price @ DL Time', 'float32')
+])
+
+OPEN_DIR = 'open'
+CONTRACTS_FILE = 'contracts.txt'
+
+DAY = 86400 * 10**9
+
+
+def field_file(field):
+    """Name of the column file of a field, e.g. 'price_dl_time.bin'"""
+
+    return re.sub('[^0-9a-z]+', '_', field.lower()).strip('_') + '.bin'
+
+
+def _map(path, dtype, count=None):
+    """Read-only memory map of the first count records of a column file
+
+    count defaults to every whole record in the file.
+    """
+
+    dtype = np.dtype(dtype)
+    if count is None:
+        count = (os.path.getsize(path) // dtype.itemsize
+                 if os.path.isfile(path) else 0)
+    if not count:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=(count,))
+
+
+def _date_range(start_date, end_date):
+    """[start, end) in ns of inclusive download dates, None if unbounded"""
+
+    start = None if start_date is None else pd.Timestamp(start_date).value
+    end = (None if end_date is None
+           else pd.Timestamp(end_date).value + DAY)
+    return start, end
+
+
+class _Segment:
+    """A Sealed Segment, mapped field by field as they are read"""
+
+    def __init__(self, path):
+        self.path = path
+        with np.load(os.path.join(path, 'index.npz')) as f:
+            self.ids = f['ids']
+            self.starts = f['starts'] # Records of ids[i] are at
+            self.first = int(f['first']) # starts[i]:starts[i + 1]
+            self.last = int(f['last'])
+        # Contract ID -> position in ids, -1 if not in the segment
+        self._positions = np.full(self.ids.max() + 1 if len(self.ids) else 0,
+                                  -1, dtype=np.int64)
+        self._positions[self.ids] = np.arange(len(self.ids))
+        self._columns = {}
+
+    def overlaps(self, start, end):
+        return ((start is None or self.last >= start)
+                and (end is None or self.first < end))
+
+    def column(self, field):
+        if field not in self._columns:
+            self._columns[field] = _map(
+                os.path.join(self.path, field_file(field)), FIELDS[field],
+                int(self.starts[-1]))
+        return self._columns[field]
+
+    def bounds(self, ids):
+        """First and last record, plus one, of contracts stored together"""
+
+        ids = np.asarray(ids)
+        ids = ids[(ids >= 0) & (ids < len(self._positions))]
+        positions = self._positions[ids]
+        positions = positions[positions >= 0]
+        if not len(positions):
+            return 0, 0
+        return (int(self.starts[positions.min()]),
+                int(self.starts[positions.max() + 1]))
+
+
+class TickStore:
+    """Memory-Mapped Tick History of Option Contracts
+
+    Records hold FIELDS, with 'Download DateTime' in ns since epoch of the
+    local wall time and 'Contract ID' pointing into self.contracts. The
+    values are those written to the data table, i.e. 'Volume' is the volume
+    traded since the previous pull.
+
+    Parameters:
+    -----------
+    root : str, a folder path
+        Created if it does not exist.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        self._symbols = [] # Contract ID -> Symbol
+        self._names = [] # Contract ID -> Contract Name
+        self._ids = pd.Index([]) # Contract Name -> Contract ID
+        self._contracts = None # Cached self.contracts
+        self._contracts_size = 0 # Bytes of contracts.txt read so far
+        self._segments = {} # Name -> _Segment
+        self._open_day = None # Day of the open records, in ns since epoch
+        self._checked = False # Open files trimmed to whole records
+
+        os.makedirs(root, exist_ok=True)
+        self._read_contracts()
+
+    @property
+    def contracts(self):
+        """Contracts by 'Contract ID'
+
+        'Symbol', 'Contract Name' and the 'Option Type', 'Strike' and
+        'Expiration Date' decoded from it as by option_schema.
+        """
+
+        if self._contracts is None or len(self._contracts) < len(self._names):
+            decoded = decode_contract_names(self._names)
+            decoded.insert(0, 'Symbol', self._symbols)
+            decoded.insert(1, 'Contract Name', self._names)
+            decoded.index.name = 'Contract ID'
+            self._contracts = decoded
+        return self._contracts
+
+    @property
+    def segments(self):
+        """Names of the sealed segments in the order they were sealed"""
+
+        return sorted(name for name in os.listdir(self.root)
+                      if name.startswith('segment-'))
+
+    def _path(self, *names):
+        return os.path.join(self.root, *names)
+
+    def _read_contracts(self):
+        """Take in the contracts added to contracts.txt since the last call"""
+
+        path = self._path(CONTRACTS_FILE)
+        if (not os.path.isfile(path)
+                or os.path.getsize(path) == self._contracts_size):
+            return
+
+        with open(path, 'rb') as f:
+            f.seek(self._contracts_size)
+            data = f.read()
+        # A line cut short by a crash is not a contract
+        data = data[:data.rfind(b'\n') + 1]
+        self._contracts_size += len(data)
+        for line in data.decode('utf-8').splitlines():
+            symbol, name = line.split('\t')
+            self._symbols.append(symbol)
+            self._names.append(name)
+        self._ids = pd.Index(self._names)
+
+    def _contract_ids(self, df):
+        """Contract IDs of the rows of df, adding the contracts not seen"""
+
+        names = df['Contract Name'].astype(str).values
+        ids = self._ids.get_indexer(names)
+        if (ids < 0).any():
+            new = ids < 0
+            new_names, first = np.unique(names[new], return_index=True)
+            new_symbols = df['Symbol'].astype(str).values[new][first]
+            lines = ''.join('{0}\t{1}\n'.format(s, n) for s, n
+                            in zip(new_symbols, new_names)).encode('utf-8')
+
+            path = self._path(CONTRACTS_FILE)
+            with open(path, 'ab') as f:
+                f.truncate(self._contracts_size) # Drop any line cut short
+                f.write(lines)
+            self._contracts_size += len(lines)
+            self._symbols.extend(new_symbols)
+            self._names.extend(new_names)
+            self._ids = pd.Index(self._names)
+            ids = self._ids.get_indexer(names)
+
+        return ids.astype(np.int32)
+
+    def _records(self, df):
+        """Columns of FIELDS of option data, typed as stored"""
+
+        records = {'Download DateTime': to_epochs(df['Download DateTime']),
+                   'Contract ID': self._contract_ids(df)}
+        for field, dtype in FIELDS.items():
+            if field in records:
+                continue
+            if field not in df.columns:
+                records[field] = np.full(
+                    len(df), np.nan if dtype == 'float32' else 0, dtype)
+            elif dtype == 'float32':
+                records[field] = to_float32(df[field].values)
+            else:
+                records[field] = to_int64(df[field].values)
+
+        return records
+
+    def _open_count(self):
+        """Number of whole records in the open files"""
+
+        sizes = [os.path.getsize(self._path(OPEN_DIR, field_file(field)))
+                 // np.dtype(dtype).itemsize
+                 if os.path.isfile(self._path(OPEN_DIR, field_file(field)))
+                 else 0 for field, dtype in FIELDS.items()]
+        return min(sizes)
+
+    def _check_open(self):
+        """Trim the open files to the records written in full"""
+
+        count = self._open_count()
+        for field, dtype in FIELDS.items():
+            path = self._path(OPEN_DIR, field_file(field))
+            if os.path.isfile(path):
+                with open(path, 'r+b') as f:
+                    f.truncate(count * np.dtype(dtype).itemsize)
+
+        self._open_day = None
+        if count:
+            times = _map(self._path(OPEN_DIR, field_file('Download DateTime')),
+                         FIELDS['Download DateTime'], 1)
+            self._open_day = int(times[0]) // DAY * DAY
+            del times
+        self._checked = True
+
+    def append(self, df):
+        """Append option data, e.g. the rows just saved to the data table
+
+        Parameters:
+        -----------
+        df : DataFrame
+            Needs 'Symbol', 'Contract Name' and 'Download DateTime'. Other
+            FIELDS missing from df are stored as NaN or 0.
+
+        Return:
+        -------
+        num_records : int
+        """
+
+        if not len(df):
+            return 0
+
+        with self._lock:
+            if not self._checked:
+                self._check_open()
+            records = self._records(df)
+            day = int(records['Download DateTime'].min()) // DAY * DAY
+            if self._open_day is not None and day > self._open_day:
+                self._seal()
+
+            os.makedirs(self._path(OPEN_DIR), exist_ok=True)
+            for field, dtype in FIELDS.items():
+                with open(self._path(OPEN_DIR, field_file(field)), 'ab') as f:
+                    f.write(np.ascontiguousarray(records[field], dtype)
+                            .tobytes())
+            if self._open_day is None:
+                self._open_day = day
+
+        return len(df)
+
+    def seal(self):
+        """Sort the open records into a new segment, e.g. after the close
+
+        A crash between writing the segment and removing the open files may
+        leave those records twice, but never loses any.
+
+        Return:
+        -------
+        num_records : int
+            Number of records sealed.
+        """
+
+        with self._lock:
+            if not self._checked:
+                self._check_open()
+            return self._seal()
+
+    def _seal(self):
+        count = self._open_count()
+        if not count:
+            return 0
+
+        columns = {field: _map(self._path(OPEN_DIR, field_file(field)),
+                               dtype, count)
+                   for field, dtype in FIELDS.items()}
+
+        # Contracts of a symbol and expiry end up next to each other
+        contracts = self.contracts
+        symbols = pd.factorize(contracts['Symbol'].values, sort=True)[0]
+        rank = np.empty(len(contracts), dtype=np.int64)
+        rank[np.lexsort((contracts['Strike'].values,
+                         contracts['Option Type'].cat.codes.values,
+                         contracts['Expiration Date'].values,
+                         symbols))] = np.arange(len(contracts))
+
+        times = columns['Download DateTime']
+        order = np.lexsort((times, rank[columns['Contract ID']]))
+        ids = columns['Contract ID'][order]
+        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+
+        segments = self.segments
+        name = 'segment-{:06d}'.format(
+            int(segments[-1].split('-')[1]) + 1 if segments else 0)
+        tmp_path = self._path('.' + name)
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        for field, dtype in FIELDS.items():
+            np.asarray(columns[field])[order].tofile(
+                os.path.join(tmp_path, field_file(field)))
+        np.savez(os.path.join(tmp_path, 'index.npz'), ids=ids[starts],
+                 starts=np.r_[starts, count], first=times.min(),
+                 last=times.max())
+
+        del columns, times # Unmap before the open files are removed
+        os.replace(tmp_path, self._path(name))
+        shutil.rmtree(self._path(OPEN_DIR))
+        self._open_day = None
+
+        return count
+
+    def _segment(self, name):
+        if name not in self._segments:
+            self._segments[name] = _Segment(self._path(name))
+        return self._segments[name]
+
+    def _views(self, ids, fields, start_date, end_date):
+        """Records of contracts ids per segment, open records last"""
+
+        fields = list(FIELDS) if fields is None else list(fields)
+        start, end = _date_range(start_date, end_date)
+        views = []
+        with self._lock:
+            for name in self.segments:
+                segment = self._segment(name)
+                if not segment.overlaps(start, end):
+                    continue
+                first, last = segment.bounds(ids)
+                if last > first:
+                    views.append({field: segment.column(field)[first:last]
+                                  for field in fields})
+
+            # Open records are in arrival order, so they are copied
+            count = self._open_count()
+            if count:
+                path = self._path(OPEN_DIR, field_file('Contract ID'))
+                index = np.flatnonzero(np.isin(
+                    _map(path, FIELDS['Contract ID'], count), ids))
+                times = _map(self._path(
+                    OPEN_DIR, field_file('Download DateTime')),
+                    FIELDS['Download DateTime'], count)[index]
+                if start is not None:
+                    index = index[times >= start]
+                    times = times[times >= start]
+                if end is not None:
+                    index = index[times < end]
+                if len(index):
+                    views.append({field: _map(
+                        self._path(OPEN_DIR, field_file(field)),
+                        FIELDS[field], count)[index] for field in fields})
+
+        return views
+
+    def _to_frame(self, views, fields):
+        fields = list(FIELDS) if fields is None else list(fields)
+        df = pd.DataFrame({field: np.concatenate(
+            [v[field] for v in views]) if views
+            else np.zeros(0, FIELDS[field]) for field in fields})
+        if 'Contract ID' in df.columns:
+            df.insert(0, 'Contract Name', np.asarray(
+                self._names, dtype=object)[df['Contract ID'].values])
+        return df
+
+    def contract_id(self, contract):
+        """Contract ID of a contract name, -1 if it was never stored"""
+
+        self._read_contracts()
+        return int(self._ids.get_indexer([contract])[0])
+
+    def expiry_ids(self, symbol, expiry):
+        """Contract IDs of an expiry of symbol
+
+        expiry : anything pd.Timestamp takes, e.g. '2017-03-17'
+        """
+
+        self._read_contracts()
+        contracts = self.contracts
+        return contracts.index.values[
+            (contracts['Symbol'] == symbol).values
+            & (contracts['Expiration Date'] == pd.Timestamp(expiry).value)
+            .values]
+
+    def views(self, contract, start_date=None, end_date=None, fields=None):
+        """Records of one contract as NumPy views, one dict per segment
+
+        Parameters:
+        -----------
+        contract : str
+            Contract name.
+
+        start_date, end_date : str, 'YYYY-MM-DD', default None
+            Inclusive range of download dates. None means unbounded.
+
+        fields : list of str, default None
+            FIELDS to return. None means all.
+
+        Return:
+        -------
+        views : list of dict
+            Field -> ndarray of the records of each sealed segment, in time
+            order, as read-only views into the column files. The records of
+            the open day, if any, are a copy in the last dict.
+        """
+
+        return self._views([self.contract_id(contract)], fields,
+                           start_date, end_date)
+
+    def expiry_views(self, symbol, expiry, start_date=None, end_date=None,
+                     fields=None):
+        """Records of every contract of an expiry, like views()
+
+        Records are in contract then time order within each sealed segment.
+        """
+
+        return self._views(self.expiry_ids(symbol, expiry), fields,
+                           start_date, end_date)
+
+    def history(self, contract, start_date=None, end_date=None,
+                fields=None):
+        """Records of one contract as a DataFrame, see views()"""
+
+        return self._to_frame(self.views(contract, start_date, end_date,
+                                         fields), fields)
+
+    def expiry_history(self, symbol, expiry, start_date=None, end_date=None,
+                       fields=None):
+        """Records of every contract of an expiry as a DataFrame"""
+
+        return self._to_frame(self.expiry_views(
+            symbol, expiry, start_date, end_date, fields), fields)
@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+"""
+Implied volatility surfaces of each symbol on a fixed grid of moneyness and
+days to expiry, kept up to date as pages are scraped. A SurfaceBuilder keeps
+the latest smile of every expiration date; a scraped expiry only replaces
+its own smile, and the surface is interpolated from the smiles in total
+variance. Snapshots of the surfaces go to a SurfaceStore, growing arrays
+per symbol saved to one .npz file, to be read back as of any time.
+
+    surfaces = SurfaceBuilder()
+    for df in ys.scrape_iter():
+        surfaces.observe_frame(df)
+    surfaces.snapshot()
+    surfaces.surface('AAPL')
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from option_greeks import (as_typed, chain_analytics, DAYS_PER_YEAR,
+                           EXPIRY_TIME)
+
+# Strike over spot
+MONEYNESS_GRID = np.round(np.arange(0.7, 1.301, 0.05), 2)
+
+TENOR_GRID = np.array([7, 14, 30, 60, 91, 182, 365, 730])
+
+
+def _years(expiry, time):
+    """Years from time to the close of expiry, both in ns since epoch"""
+
+    return (expiry + EXPIRY_TIME - time) / 1e9 / (DAYS_PER_YEAR * 86400)
+
+
+class SurfaceStore:
+    """History of Volatility Surfaces per Symbol
+
+    Surfaces of a symbol are stacked in one float32 array of shape (number
+    of snapshots, tenors, moneyness) next to an int64 array of their times,
+    both grown by doubling as snapshots are appended.
+
+    Parameters:
+    -----------
+    moneyness : array-like of float
+        Columns of every surface.
+
+    tenors : array-like of int
+        Rows of every surface in days to expiry.
+
+    path : str, a file path, default None
+        .npz file the history is persisted to by save() and reloaded from on
+        construction. None means in memory only.
+    """
+
+    def __init__(self, moneyness, tenors, path=None):
+        self.moneyness = np.asarray(moneyness, dtype=np.float64)
+        self.tenors = np.asarray(tenors, dtype=np.int64)
+        self.path = path
+        self._times = {} # Symbol -> int64 array
+        self._grids = {} # Symbol -> float32 array
+        self._sizes = {} # Symbol -> number of snapshots
+
+        if path is not None and os.path.isfile(path):
+            self.load()
+
+    @property
+    def symbols(self):
+        return sorted(self._sizes)
+
+    def __len__(self):
+        return sum(self._sizes.values())
+
+    def append(self, symbol, time, grid):
+        """Add the surface of symbol at time, in ns since epoch"""
+
+        size = self._sizes.get(symbol, 0)
+        if symbol not in self._times or size == len(self._times[symbol]):
+            capacity = max(2 * size, 16)
+            times = np.zeros(capacity, dtype=np.int64)
+            grids = np.full((capacity, len(self.tenors), len(self.moneyness)),
+                            np.nan, dtype=np.float32)
+            if size:
+                times[:size] = self._times[symbol][:size]
+                grids[:size] = self._grids[symbol][:size]
+            self._times[symbol], self._grids[symbol] = times, grids
+
+        self._times[symbol][size] = time
+        self._grids[symbol][size] = grid
+        self._sizes[symbol] = size + 1
+
+    def history(self, symbol, start=None, end=None):
+        """Surfaces of symbol between two times, both ends included
+
+        Parameters:
+        -----------
+        symbol : str
+
+        start, end : anything pd.Timestamp takes, default None
+            None means no bound.
+
+        Return:
+        -------
+        (times, grids) : int64 ndarray, float32 ndarray
+            Times in ns since epoch and surfaces of shape (len(times),
+            tenors, moneyness), as views into the store.
+        """
+
+        size = self._sizes.get(symbol, 0)
+        times = self._times.get(symbol, np.zeros(0, dtype=np.int64))[:size]
+        first, last = 0, size
+        if start is not None:
+            first = np.searchsorted(times, pd.Timestamp(start).value, 'left')
+        if end is not None:
+            last = np.searchsorted(times, pd.Timestamp(end).value, 'right')
+
+        if not size:
+            return times, np.zeros((0, len(self.tenors),
+                                    len(self.moneyness)), dtype=np.float32)
+        return times[first:last], self._grids[symbol][first:last]
+
+    def at(self, symbol, time=None):
+        """Latest surface of symbol as of time, or None if there is none
+
+        Return:
+        -------
+        surface : DataFrame
+            IV in percent, days to expiry by moneyness.
+        """
+
+        times, grids = self.history(symbol, end=time)
+        if not len(times):
+            return None
+        return self.to_frame(grids[-1])
+
+    def to_frame(self, grid):
+        """A surface array as a DataFrame of days to expiry by moneyness"""
+
+        return pd.DataFrame(grid, index=pd.Index(self.tenors, name='Days'),
+                            columns=pd.Index(self.moneyness,
+                                             name='Moneyness'))
+
+    def load(self):
+        """Reload the history from self.path"""
+
+        with np.load(self.path, allow_pickle=True) as f:
+            if (not np.array_equal(f['moneyness'], self.moneyness)
+                    or not np.array_equal(f['tenors'], self.tenors)):
+                raise ValueError(self.path + ' holds surfaces on another '
+                                 'grid')
+
+            bounds = np.cumsum(np.r_[0, f['sizes']])
+            times, grids = f['times'], f['grids']
+            self._times, self._grids, self._sizes = {}, {}, {}
+            for i, symbol in enumerate(f['symbols']):
+                self._times[symbol] = times[bounds[i]:bounds[i + 1]].copy()
+                self._grids[symbol] = grids[bounds[i]:bounds[i + 1]].copy()
+                self._sizes[symbol] = int(f['sizes'][i])
+
+    def save(self):
+        """Persist the history to self.path atomically"""
+
+        if self.path is None:
+            return
+
+        symbols = self.symbols
+        sizes = [self._sizes[s] for s in symbols]
+        shape = (0, len(self.tenors), len(self.moneyness))
+        tmp_path = self.path + '.tmp.npz'
+        np.savez(
+            tmp_path, moneyness=self.moneyness, tenors=self.tenors,
+            symbols=np.array(symbols, dtype=object),
+            sizes=np.array(sizes, dtype=np.int64),
+            times=np.concatenate([self._times[s][:n] for s, n
+                                  in zip(symbols, sizes)]
+                                 or [np.zeros(0, dtype=np.int64)]),
+            grids=np.concatenate([self._grids[s][:n] for s, n
+                                  in zip(symbols, sizes)]
+                                 or [np.zeros(shape, dtype=np.float32)]))
+        os.replace(tmp_path, self.path)
+
+
+class SurfaceBuilder:
+    """Incremental Implied Volatility Surfaces
+
+    Feed it scraped option data, e.g. the frames of YahooScraper.scrape_iter()
+    one expiry at a time, or a whole round of YahooScraper.data. Implied
+    volatilities of the out-of-the-money calls and puts of each expiry are
+    solved with option_greeks and interpolated onto the moneyness grid,
+    replacing the previous smile of that expiry only. Surfaces interpolate
+    the smiles linearly in total variance over days to expiry, without
+    extrapolating past the strikes or expiries listed.
+
+    Parameters:
+    -----------
+    moneyness : array-like of float, default MONEYNESS_GRID
+        Strike over spot of the surface columns.
+
+    tenors : array-like of int, default TENOR_GRID
+        Days to expiry of the surface rows.
+
+    rate, dividend : float, default 0
+        See option_greeks.black_scholes().
+
+    path : str, a file path, default None
+        .npz file of the SurfaceStore that snapshot() appends to.
+
+    Attributes:
+    -----------
+    store : SurfaceStore
+        Surfaces of every snapshot() so far.
+    """
+
+    def __init__(self, moneyness=MONEYNESS_GRID, tenors=TENOR_GRID, rate=0.0,
+                 dividend=0.0, path=None):
+        self.moneyness = np.asarray(moneyness, dtype=np.float64)
+        self.tenors = np.asarray(tenors, dtype=np.int64)
+        self.rate = rate
+        self.dividend = dividend
+        self.store = SurfaceStore(self.moneyness, self.tenors, path)
+
+        self._smiles = {} # Symbol -> {expiry: (download time, smile)}
+        self._changed = set() # Symbols observed since the last snapshot
+
+    @property
+    def symbols(self):
+        return sorted(self._smiles)
+
+    def observe_frame(self, df):
+        """Update the smiles of every symbol and expiry in df
+
+        Only the latest pull of each symbol and expiry in df is used, and an
+        expiry without any implied volatility keeps its previous smile.
+        """
+
+        if not len(df):
+            return
+
+        df = as_typed(df)
+        analytics = chain_analytics(df, self.rate, self.dividend)
+        is_call = (df['Option Type'] == 'Call').values
+        moneyness = analytics['Moneyness'].values
+        iv = analytics['Model IV'].values
+        otm = np.where(is_call, moneyness >= 1, moneyness < 1)
+
+        chains = pd.DataFrame({
+            'Symbol': df['Symbol'].astype(str).values,
+            'Expiry': df['Expiration Date'].values,
+            'Time': df['Download DateTime'].values,
+            'Moneyness': moneyness,
+            'IV': iv
+        })[otm & np.isfinite(iv)]
+        latest = chains.groupby(['Symbol', 'Expiry'])['Time'].transform('max')
+        chains = chains[chains['Time'] == latest].sort_values(
+            ['Symbol', 'Expiry', 'Moneyness'])
+        if not len(chains):
+            return # No smile, e.g. expiry day chains after the close
+
+        # Slice the sorted arrays per chain rather than group in pandas
+        symbols = chains['Symbol'].values
+        expiries = chains['Expiry'].values
+        times = chains['Time'].values
+        moneyness = chains['Moneyness'].values
+        iv = chains['IV'].values
+        starts = np.flatnonzero(np.r_[True, (symbols[1:] != symbols[:-1])
+                                      | (expiries[1:] != expiries[:-1])])
+        for start, end in zip(starts, np.r_[starts[1:], len(chains)]):
+            smile = np.interp(self.moneyness, moneyness[start:end],
+                              iv[start:end], left=np.nan, right=np.nan)
+            self._smiles.setdefault(symbols[start], {})[expiries[start]] = (
+                times[start], smile)
+            self._changed.add(symbols[start])
+
+    def _grid(self, symbol):
+        """Surface array of symbol and the time of its latest pull"""
+
+        smiles = self._smiles[symbol]
+        time = max(t for t, _ in smiles.values())
+        expiries = np.array(sorted(smiles))
+        years = _years(expiries, time)
+        live = years > 0
+        years = years[live]
+        variance = np.square(np.array(
+            [smiles[e][1] for e in expiries[live]]).reshape(
+                len(years), len(self.moneyness)) / 100) * years[:, None]
+
+        tenors = self.tenors / DAYS_PER_YEAR
+        grid = np.full((len(self.tenors), len(self.moneyness)), np.nan)
+        for j in range(len(self.moneyness)):
+            known = np.isfinite(variance[:, j])
+            if known.any():
+                grid[:, j] = 100 * np.sqrt(np.interp(
+                    tenors, years[known], variance[known, j], left=np.nan,
+                    right=np.nan) / tenors)
+
+        return grid, time
+
+    def surface(self, symbol):
+        """Current surface of symbol, or None if it was never observed
+
+        Return:
+        -------
+        surface : DataFrame
+            IV in percent, days to expiry by moneyness.
+        """
+
+        if symbol not in self._smiles:
+            return None
+        return self.store.to_frame(self._grid(symbol)[0])
+
+    def term_structure(self, symbol):
+        """At-the-money IV in percent of each live expiry of symbol
+
+        Return:
+        -------
+        term_structure : Series
+            Indexed by 'Days to Expiry' as of the latest pull.
+        """
+
+        smiles = self._smiles.get(symbol, {})
+        if not smiles:
+            return pd.Series(dtype=np.float64, name='ATM IV')
+
+        time = max(t for t, _ in smiles.values())
+        expiries = np.array(sorted(smiles))
+        atm = []
+        for expiry in expiries:
+            smile = smiles[expiry][1]
+            known = np.isfinite(smile)
+            atm.append(np.interp(1.0, self.moneyness[known], smile[known],
+                                 left=np.nan, right=np.nan)
+                       if known.any() else np.nan)
+
+        days = _years(expiries, time) * DAYS_PER_YEAR
+        return pd.Series(atm, index=pd.Index(days, name='Days to Expiry'),
+                         name='ATM IV')[days > 0]
+
+    def snapshot(self):
+        """Append the surfaces of symbols observed since the last snapshot
+
+        Return:
+        -------
+        num_symbols : int
+            Number of surfaces appended to self.store.
+        """
+
+        changed, self._changed = sorted(self._changed), set()
+        for symbol in changed:
+            grid, time = self._grid(symbol)
+            self.store.append(symbol, time, grid)
+
+        return len(changed)
+
+    def reset(self):
+        """Forget every smile, e.g. at the end of a trading day"""
+
+        self._smiles = {}
+        self._changed = set()
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+Per-contract running totals of the option volume already stored today, used
+to turn Yahoo's cumulative daily volume into incremental volume without
+summing the day's rows in SQL after every pull.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+
+def _to_volumes(volumes):
+    """Cumulative volumes as float, with anything not a number as 0"""
+
+    return np.nan_to_num(
+        pd.to_numeric(pd.Series(volumes), errors='coerce').values
+        .astype(np.float64))
+
+
+class VolumeTracker:
+    """Incremental Volume Calculator
+
+    Keeps, for each contract, the total volume stored so far today. Given a
+    new pull of cumulative volumes, the increment of each contract is the
+    cumulative volume minus that total, floored at 0, which is what the
+    GROUP BY in live_nasdaq100.py used to compute. All of it is vectorized
+    and costs O(rows pulled).
+
+    To only count volume that was stored, take the increments of a pull
+    with increments() and add() the pull once it is written. update() does
+    both at once.
+
+    Parameters:
+    -----------
+    path : str, a file path, default None
+        .npz file the totals are persisted to by save() and reloaded from on
+        construction. None means in memory only.
+
+    Attributes:
+    -----------
+    date : str or None
+        Trading day the totals belong to. Totals reset when it changes.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.date = None
+        self._contracts = pd.Index([], dtype=object)
+        self._totals = np.zeros(0)
+
+        if path is not None and os.path.isfile(path):
+            self.load()
+
+    def __len__(self):
+        return len(self._contracts)
+
+    def load(self):
+        """Reload totals from self.path"""
+
+        with np.load(self.path, allow_pickle=True) as f:
+            self.date = str(f['date'])
+            self._contracts = pd.Index(f['contracts'], dtype=object)
+            self._totals = f['totals'].astype(np.float64)
+
+    def save(self):
+        """Persist totals to self.path atomically"""
+
+        if self.path is None:
+            return
+
+        tmp_path = self.path + '.tmp.npz'
+        np.savez(tmp_path, date=np.array(self.date),
+                 contracts=np.asarray(self._contracts, dtype=object),
+                 totals=self._totals)
+        os.replace(tmp_path, self.path)
+
+    def reset(self, date):
+        """Drop all totals and start a new trading day"""
+
+        self.date = date
+        self._contracts = pd.Index([], dtype=object)
+        self._totals = np.zeros(0)
+
+    def seed(self, date, contracts, totals):
+        """Start the day from totals summed elsewhere, e.g. in the database
+
+        Parameters:
+        -----------
+        date : str
+            Trading day of the totals.
+
+        contracts : array-like of str
+            Contract names.
+
+        totals : array-like of float
+            Volume already stored for each contract.
+        """
+
+        self.reset(date)
+        self._contracts = pd.Index(contracts, dtype=object)
+        self._totals = np.nan_to_num(np.asarray(totals, dtype=np.float64))
+
+    def increments(self, date, contracts, volumes):
+        """Incremental volume of a pull, leaving the totals as they are
+
+        Parameters:
+        -----------
+        date : str
+            Trading day of the pull.
+
+        contracts : array-like of str
+            Contract names of the pulled rows.
+
+        volumes : array-like
+            Cumulative volume of each row. Anything that is not a number
+            counts as no volume.
+
+        Return:
+        -------
+        increments : numpy array of float
+            Incremental volume of each row, never negative.
+        """
+
+        volumes = _to_volumes(volumes)
+        totals = np.zeros(len(volumes))
+        if date == self.date: # Otherwise the day starts from nothing
+            idx = self._contracts.get_indexer(
+                pd.Index(contracts, dtype=object))
+            known = idx >= 0
+            totals[known] = self._totals[idx[known]]
+
+        return np.maximum(volumes - totals, 0)
+
+    def add(self, date, contracts, volumes):
+        """Raise the totals to the cumulative volumes of a stored pull
+
+        Parameters are the same as increments().
+        """
+
+        if date != self.date:
+            self.reset(date)
+
+        contracts = pd.Index(contracts, dtype=object)
+        volumes = _to_volumes(volumes)
+
+        # Register contracts seen for the first time
+        new = contracts[self._contracts.get_indexer(contracts) < 0].unique()
+        if len(new):
+            self._contracts = self._contracts.append(new)
+            self._totals = np.concatenate([self._totals, np.zeros(len(new))])
+
+        np.maximum.at(self._totals, self._contracts.get_indexer(contracts),
+                      volumes)
+
+    def update(self, date, contracts, volumes):
+        """Turn cumulative volumes into increments and add them to the totals
+
+        Parameters and return are the same as increments().
+        """
+
+        increments = self.increments(date, contracts, volumes)
+        self.add(date, contracts, volumes)
+
+        return increments
@@ -6,16 +6,29 @@ Created on Sun Feb  5 18:19:31 2017
 
 """
 
-import pandas as pd
-import os
 import time
+import json
 from datetime import datetime
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.keys import Keys
-from selenium.common.exceptions import StaleElementReferenceException
+from fetch_backends import (FetchError, EXTRACT_JS, EXTRACT_ARGS, 
+                            parse_option_extract)
+from browser_profiles import BrowserProfile
+from option_buffer import OptionBuffer
+from option_schema import (SCHEMA, normalize_table, normalize_constants,
+                           to_text_format)
+from retry_policy import RetryPolicy, wait_until, wait_for_url_change
+from instrumentation import REGISTRY
+
+# Histogram in the Metrics registry of each entry of YahooScraper.timer
+TIMER_METRICS = {
+    'Browser Open': 'browser_open_seconds',
+    'Page Load': 'page_load_seconds',
+    'DF Parse': 'df_parse_seconds',
+    'Total Time': 'symbol_seconds'
+}
 
 class YahooScraper:
     """Yahoo Finance Option Scraper
@@ -39,22 +52,76 @@ class YahooScraper:
         
     ext_path : str, a file path, default None
         Extention path to a .crx file for Chrome. uBlock Origin is recommended
-        to speed up page loading.
+        to speed up page loading. Ignored if profile is given.
+        
+    backend : HttpBackend or None, default None
+        A browserless fetch backend, see fetch_backends.py. If given, each
+        symbol is first fetched with it and the browser is only used when the
+        backend fails for that symbol.
+        
+    pool : BrowserPool or None, default None
+        A pool of warm browser sessions, see browser_pool.py. If given, the
+        browser is leased from the pool instead of launched, and returned to
+        the pool instead of closed. ext_path and profile are then ignored.
+        
+    normalize : boolean, default True
+        If True, data follows the typed schema of option_schema.SCHEMA:
+        categorical text, float32 prices, int64 counts, int64 epoch
+        timestamps and strike, expiry and type decoded from 'Contract Name'.
+        If False, data is kept as scraped.
+        
+    date_cache : ExpirationDateCache or None, default None
+        A persistent cache of expiration dates, see scrape_cache.py. If
+        given, a symbol with cached dates goes straight to its option pages
+        without loading the base page first.
+        
+    symbol_cache : SymbolCache or None, default None
+        A persistent cache of renamed and dead symbols, see scrape_cache.py.
+        If given, renamed symbols are scraped under their new ticker without
+        a redirect, and dead symbols are skipped by scrape_all().
+        
+    retry : RetryPolicy or None, default None
+        Backoff and budgets of every retry in the crawl path, see
+        retry_policy.py. Defaults to max_tries attempts with jittered
+        exponential backoff.
+        
+    profile : BrowserProfile or None, default None
+        How to launch the browser, e.g. headless with images and ads
+        blocked, see browser_profiles.py. Defaults to plain Chrome with
+        ext_path loaded.
+        
+    metrics : Metrics or None, default None
+        Where timings go as spans and histograms (see TIMER_METRICS), along
+        with counters of retries, 404 pages, page refreshes and browser
+        restarts, see instrumentation.py. Defaults to the registry of the
+        process, instrumentation.REGISTRY.
+        
+    change_detector : ChangeDetector or None, default None
+        Fingerprints of the pages scraped before, see change_detector.py.
+        If given, a page unchanged since it was last scraped is neither
+        parsed nor yielded, and its (symbol, expiry) is added to
+        change_detector.skipped instead. Pages let through only count as
+        scraped once change_detector.commit_pages() is called.
     
     Attributes:
     -----------
     data : Pandas DataFrame
         Contains the option data in the same tabular format seen at Yahoo.
+        Scraped tables are buffered and only combined when data is read, so
+        treat it as read-only and assign a new DataFrame to replace it.
         
     timer : dict
         Contains timer for post analysis purposes.
         Browser Open: time from startup to showing first blank page.
         Page load: time for each url load
-        DF Parse: time for parsing the data table from HTML
+        DF Parse: time for parsing the option tables from HTML
         Total Time: time for whole session
     """
     
-    def __init__(self, symbols, max_tries=3, explicit_wait=5, ext_path=None):
+    def __init__(self, symbols, max_tries=3, explicit_wait=5, ext_path=None,
+                 backend=None, pool=None, normalize=True, date_cache=None,
+                 symbol_cache=None, retry=None, profile=None, metrics=None,
+                 change_detector=None):
         # Parameters
         if not isinstance(symbols, list):
             self.symbols = [symbols]
@@ -63,10 +130,20 @@ class YahooScraper:
             
         self.max_tries = max_tries
         self.explicit_wait = explicit_wait
-        self.ext_path = None
+        self.backend = backend
+        self.pool = pool
+        self.normalize = normalize
+        self.date_cache = date_cache
+        self.symbol_cache = symbol_cache
+        self.change_detector = change_detector
+        self.metrics = metrics if metrics is not None else REGISTRY
+        self.retry = retry
+        if retry is None:
+            self.retry = RetryPolicy(max_attempts=max_tries, 
+                                     metrics=self.metrics)
         
         # Results
-        self.data = pd.DataFrame()
+        self._buffer = self._new_buffer()
         self.timer = {
             'Browser Open': [],
             'Page Load': [],
@@ -78,18 +155,79 @@ class YahooScraper:
         self.expiration_dates = {}
         for symbol in self.symbols:
             self.expiration_dates[symbol] = []
+        self.yahoo_symbols = {} # Symbol -> symbol on Yahoo, if renamed
             
         self.browser = None
-        self.profile = webdriver.ChromeOptions()
         self.new_symbol = None # In case if a symbol has been changed
         
-        if ext_path != None:
-            if os.path.isfile(str(ext_path)):
-                self.ext_path = ext_path
-                self.profile.add_extension(ext_path)
-            else:
-                print('File specified by ext_path does not exit!')
+        self.profile = profile
+        if profile is None:
+            self.profile = BrowserProfile(ext_path=ext_path)
+        self.ext_path = self.profile.ext_path
+
+    def _new_buffer(self, df=None):
+        """Make an OptionBuffer matching self.normalize"""
+        
+        kwargs = {}
+        if self.normalize:
+            kwargs = {'categorical': True, 'columns': list(SCHEMA)}
+            
+        if df is None:
+            return OptionBuffer(**kwargs)
+        return OptionBuffer.from_frame(df, **kwargs)
+    
+    @property
+    def data(self):
+        return self._buffer.to_frame()
+    
+    @data.setter
+    def data(self, df):
+        self._buffer = self._new_buffer(df)
 
+    def _open_browser(self):
+        """Launch a browser, or lease one if there is a pool"""
+        
+        timer = Timer() # Time browser opening
+        if self.pool is not None:
+            self.browser = self.pool.acquire()
+        else:
+            self.browser = self.profile.launch()
+        self._record_time('Browser Open', timer.stop())
+        
+    def _close_browser(self):
+        """Close the browser, or return it if it was leased from a pool"""
+        
+        if self.pool is not None:
+            self.pool.release(self.browser)
+        else:
+            self.browser.quit()
+        self.browser = None
+        
+    def _restart_browser(self):
+        """Replace a broken browser with a new one"""
+        
+        self.metrics.inc('browser_restarts_total')
+        if self.pool is not None:
+            self.browser = self.pool.replace(self.browser)
+        else:
+            self.browser.quit()
+            self.browser = self.profile.launch()
+
+    def _record_time(self, stage, seconds, **attrs):
+        """Add a timing to self.timer[stage] and to self.metrics as a span
+        
+        attrs such as symbol and expiry only go to the span log.
+        """
+        
+        self.timer[stage].append(seconds)
+        self.metrics.record(TIMER_METRICS[stage], seconds, **attrs)
+        
+    def _refresh(self, error=None):
+        """Reload a page that did not render. Used as before_retry"""
+        
+        self.metrics.inc('page_refreshes_total')
+        self.browser.refresh()
+        
     def _check_url(self, url):
         """Check if current url is as expected. Consumes 1 life if not"""
         
@@ -109,20 +247,6 @@ class YahooScraper:
         finally:
             return element
    
-    def _wait_for_elements(self, xpath_str):
-        """Wait for specified elements to load in WebDriver"""
-        
-        elements = None
-        try:
-            elements = WebDriverWait(
-                self.browser, self.explicit_wait).until(
-                EC.presence_of_all_elements_located((By.XPATH, xpath_str))
-            )
-        except:
-            raise ElementNotFoundError
-        finally:
-            return elements
-            
     def _get_expiration_dates(self, symbol, browser_quit=False):
         """Scrape the expiration dates for all available options"""
         
@@ -131,25 +255,22 @@ class YahooScraper:
         
         # Initiate a browser if there's none
         if self.browser is None:
-            timer = Timer() # Time browser opening
-            self.browser = webdriver.Chrome(chrome_options=self.profile)
-            self.timer['Browser Open'].append(timer.stop())
+            self._open_browser()
         
         timer = Timer() # Time page loading
         self._try_get_url(url)
         
         if self._check_url(url):
-            xpath_str = ('//*[@id="main-0-Quote-Proxy"]/section/div[2]/'
-                         'section/div/section/div[2]/div[1]/select/'
-                         'option[text()]')
-            
-            elements = self._wait_for_elements(xpath_str)
-            self.timer['Page Load'].append(timer.stop())
+            # All dates in one script call rather than two calls per date
+            dates = wait_until(
+                self.browser, 
+                lambda b: [tuple(x) for x in json.loads(b.execute_script(
+                    EXTRACT_JS, *EXTRACT_ARGS))['dates'] if x[1]],
+                self.explicit_wait)
+            self._record_time('Page Load', timer.stop(), symbol=symbol)
             
-            if elements is not None:
-                self.expiration_dates[symbol] = [
-                    (x.get_attribute('value'), x.text) for x in elements
-                ]
+            if dates:
+                self.expiration_dates[symbol] = dates
             else: # Empty page for a dead symbol
                 raise ElementEmptyError
         else:
@@ -162,49 +283,64 @@ class YahooScraper:
             xpath_str = ('//*[@id="lookup-page"]/div/div/div'
                          + '/div/div/fieldset/input')
             element = self._wait_for_element(xpath_str)
+            if element is None:
+                raise SymbolNotFoundError('Lookup page did not render')
+                
+            lookup_url = self.browser.current_url
             element.send_keys(symbol)
             element.send_keys(Keys.ENTER)
-            time.sleep(5)
+            url = wait_for_url_change(self.browser, lookup_url, 
+                                      self.explicit_wait)
             
-            if self.browser.current_url.find('quote') > -1: # if a quote page
-                url = self.browser.current_url
+            if url is not None and url.find('quote') > -1: # if a quote page
                 return (url[url.find('p=') + 2:], True)
             else:
                 raise SymbolNotFoundError('Symbol not found after redirect')
         else:
             return (symbol, False) # 404 Page
             
-    def _try_refresh_element(self, xpath_str):
-        """Try to refresh the page in case some element refuses to render"""
-        
-        element, i = None, 0
-        while (element is None) and (i < self.max_tries):
-            if i > 0:
-                self.browser.refresh()
-                
-            element = self._wait_for_element(xpath_str)
-            i += 1
+    def _extract_page(self):
+        """Read price, Yahoo time and option tables of the current page
+        
+        All of it comes back from a single injected script as compact JSON
+        instead of an element lookup per field plus the whole page_source.
+        The script is polled until the page has rendered the option rows,
+        which on a loaded page is one call, and the page is refreshed with
+        backoff if they never show up.
+        
+        Return:
+        -------
+        payload : dict
+            Decoded result of fetch_backends.EXTRACT_JS. Its tables may be
+            empty if the page never rendered option rows.
+        """
         
-        if element is None:
-            raise ElementEmptyError
-            
-        return element
+        last = {}
         
-    def _try_refresh_elements(self, xpath_str):
-        """Try to refresh the page in case some elements refuse to render"""
+        def is_ready(browser):
+            last['payload'] = json.loads(
+                browser.execute_script(EXTRACT_JS, *EXTRACT_ARGS))
+            payload = last['payload']
+            if (payload['ready'] and payload['price'] is not None 
+                    and any(payload['tables'])):
+                return payload
+            return False
         
-        elements, i = None, 0
-        while (elements is None) and (i < self.max_tries):
-            if i > 0:
-                self.browser.refresh() 
-                
-            elements = self._wait_for_elements(xpath_str)
-            i += 1
+        def extract():
+            payload = wait_until(self.browser, is_ready, self.explicit_wait)
+            if payload is None:
+                raise ElementEmptyError
+            return payload
         
-        if elements is None:
-            raise ElementEmptyError
-            
-        return elements
+        try:
+            return self.retry.call(
+                extract, retry_on=(ElementEmptyError,),
+                before_retry=self._refresh)
+        except ElementEmptyError:
+            payload = last.get('payload')
+            if payload is None or payload['price'] is None:
+                raise
+            return payload # Rendered, but without option rows
     
     def _try_get_url(self, url):
         """Try to get url loaded correctly
@@ -214,47 +350,181 @@ class YahooScraper:
         
         """
         
-        counter = 0
-        
-        while counter < self.max_tries:
+        def load():
             try:
                 self.browser.get(url)
-                break
-            except:
+            except Exception:
                 print('URL openning failed, restarting...')
-                self.browser.quit()
-                self.browser = webdriver.Chrome(chrome_options=self.profile)
-                counter += 1
+                self._restart_browser()
+                raise
+            if self.pool is not None:
+                self.pool.record_page_load(self.browser)
                 
-        if counter == self.max_tries:
+        try:
+            self.retry.call(load)
+        except Exception:
             raise Exception('Failed to open {} so many times, check your '
                             'router maybe?'.format(url))
+            
+    def _get_checked_url(self, url):
+        """Load url and raise Page404Error if Yahoo sent us elsewhere"""
+        
+        self._try_get_url(url)
+        if not self._check_url(url):
+            self.metrics.inc('page_404_total', source='browser')
+            raise Page404Error
     
-    def scrape_one_stock(self, symbol, browser_quit=True):
-        """Yahoo Finance Option Scraper Lite
+    def _append_tables(self, dfs, date, price, yahoo_time, symbol,
+                       yahoo_symbol, time_marks, buffer=None):
+        """Tag option tables of one expiration date and buffer them
         
-        Scrape and crawl one symbol.
+        Tables go to self.data unless another OptionBuffer is given.
+        """
         
-        Parameters:
-        -----------
-        symbol : str
-            Ticker of the stock of interest
+        if buffer is None:
+            buffer = self._buffer
+        
+        dl_time, dl_date, dl_datetime = time_marks
+        
+        for df in dfs:
+            # Buffer the table with the columns constant over its rows
+            if df.shape[1] == 10:
+                # Determine option type
+                idx = df['Contract Name'][0][5:].find('C')
+                option_type = 'Put'
+                if idx > -1:
+                    option_type = 'Call'
+                    
+                constants = {
+                    'Expiration Date': date[1],
+                    'Download Time': dl_time,
+                    'Download Date': dl_date,
+                    'Download DateTime': dl_datetime,
+                    'Download Source': 'Yahoo Finance',
+                    'Price @ DL Time': price,
+                    'Yahoo Time': yahoo_time,
+                    'Symbol': symbol,
+                    'Yahoo Symbol': yahoo_symbol,
+                    'Option Type': option_type
+                }
+                
+                if self.normalize:
+                    df = normalize_table(df)
+                    constants = normalize_constants(constants)
+                    
+                buffer.append(df, constants)
+                
+    def _load_cached_dates(self, symbol):
+        """Fill in expiration dates from self.date_cache. True if it hit"""
+        
+        if self.date_cache is None or self.expiration_dates.get(symbol):
+            return False
+        
+        cached = self.date_cache.get(symbol)
+        if cached is None:
+            return False
+        
+        self.expiration_dates[symbol] = cached
+        return True
+        
+    def _cache_dates(self, symbol):
+        """Store freshly scraped expiration dates in self.date_cache"""
+        
+        if self.date_cache is not None:
+            self.date_cache.put(symbol, self.expiration_dates[symbol])
             
-        browser_quit : boolean, default True
-            Browser behavior when function finishes or encounter an unhandled
-            error. True means browser will be closed.
+    def _reject_cached_dates(self, symbol):
+        """Drop cached expiration dates after Yahoo rejected one of them"""
+        
+        self.date_cache.invalidate(symbol)
+        self.expiration_dates[symbol] = []
+        
+    def symbol_dates(self, symbol):
+        """Expiration dates scraped for a symbol of self.symbols
+        
+        Follows the symbol to its new name on Yahoo if it was renamed, since
+        self.expiration_dates is keyed by the symbol actually scraped.
         """
         
-        yahoo_symbol = symbol
+        return self.expiration_dates.get(
+            self.yahoo_symbols.get(symbol, symbol)) or []
+        
+    def _select_dates(self, symbol, dates):
+        """Expiration dates of a symbol restricted to the given values"""
+        
+        if dates is None:
+            return self.expiration_dates[symbol]
+        
+        dates = set(str(x) for x in dates)
+        return [x for x in self.expiration_dates[symbol] if x[0] in dates]
+        
+    def _fetch_one_stock_backend(self, yahoo_symbol, dates=None):
+        """Fetch the pages of one symbol through self.backend
+        
+        Every page is fetched before any is returned, so a FetchError halfway
+        leaves no partial data behind for the browser fallback to duplicate.
+        
+        Return:
+        -------
+        pages : list of (date, OptionPage)
+        """
+        
+        if self._load_cached_dates(yahoo_symbol):
+            pages = []
+            try:
+                for date in self._select_dates(yahoo_symbol, dates):
+                    timer = Timer() # Time page loading
+                    pages.append((date, self.backend.get_option_page(
+                        yahoo_symbol, date[0])))
+                    self._record_time('Page Load', timer.stop(), 
+                                      symbol=yahoo_symbol, expiry=date[0])
+            except FetchError:
+                self._reject_cached_dates(yahoo_symbol)
+                raise
+                
+            if not all(page.tables for _, page in pages):
+                self._reject_cached_dates(yahoo_symbol)
+                
+            return pages
+        
+        timer = Timer() # Time page loading
+        page = self.backend.get_option_page(yahoo_symbol)
+        self._record_time('Page Load', timer.stop(), symbol=yahoo_symbol)
+        
+        if not page.expiration_dates:
+            raise FetchError('No expiration dates for ' + yahoo_symbol)
+        
+        self.expiration_dates[yahoo_symbol] = page.expiration_dates
+        self._cache_dates(yahoo_symbol)
+        
+        pages = []
+        for date in self._select_dates(yahoo_symbol, dates):
+            if date == page.expiration_dates[0]:
+                # The base page already holds the nearest expiration date
+                pages.append((date, page))
+                continue
+            timer = Timer() # Time page loading
+            pages.append((date, self.backend.get_option_page(yahoo_symbol, 
+                                                             date[0])))
+            self._record_time('Page Load', timer.stop(), 
+                              symbol=yahoo_symbol, expiry=date[0])
+            
+        return pages
+    
+    def _iter_one_stock_browser(self, symbol, yahoo_symbol, dates=None):
+        """Crawl the pages of one symbol in self.browser
+        
+        Yields (date, OptionPage, yahoo_symbol) as soon as each expiration
+        date is scraped. yahoo_symbol changes if Yahoo redirects the symbol.
+        """
         
         # Initiate a browser if there's none
         if self.browser is None:
-            timer = Timer() # Time browser opening
-            self.browser = webdriver.Chrome(chrome_options=self.profile)
-            self.timer['Browser Open'].append(timer.stop())
+            self._open_browser()
         
         # Scrape expiration dates if not available and check validity of symbol
-        if not len(self.expiration_dates[yahoo_symbol]):
+        from_cache = self._load_cached_dates(yahoo_symbol)
+        if not len(self.expiration_dates.get(yahoo_symbol, [])):
             status, i = False, 0
             while (not status) and (i < self.max_tries):
                 try:
@@ -265,149 +535,245 @@ class YahooScraper:
                     if status:
                         yahoo_symbol = symbol_tmp
                         self._get_expiration_dates(yahoo_symbol)
+                        self.new_symbol = yahoo_symbol
+                        self.yahoo_symbols[symbol] = yahoo_symbol
+                        if self.symbol_cache is not None:
+                            self.symbol_cache.add_alias(symbol, yahoo_symbol)
                 i += 1
             if not status: # Got only 404 pages
                 raise Page404Error
-        
-        # Generate time marks
-        now = datetime.now()
-        dl_time = str(now.time())
-        dl_date = str(now.date())
-        dl_datetime = str(now)
+            self._cache_dates(yahoo_symbol)
         
         # Crawl and scrape each page
-        for date in self.expiration_dates[yahoo_symbol]:
+        for date in self._select_dates(yahoo_symbol, dates):
             expiration_date = date[0]
             url = ('http://finance.yahoo.com/quote/' + yahoo_symbol + 
                    '/options?p=' + yahoo_symbol + '&date=' + expiration_date)
             timer = Timer() # Time page loading
-            self._try_get_url(url)
             
             # Handle random 404 pages
-            if not self._check_url(url):
-                status, i = False, 0
-                while (not status) and (i < self.max_tries):
-                    i += 1
-                    self._try_get_url(url)
-                    if self._check_url(url):
-                        status = True
-                if not status: # Got only 404 pages
-                    raise Page404Error
+            try:
+                self.retry.call(lambda: self._get_checked_url(url),
+                                retry_on=(Page404Error,))
+            except Page404Error: # Got only 404 pages
+                if from_cache:
+                    self._reject_cached_dates(yahoo_symbol)
+                raise
                         
-            # Current price
-            xpath_str = ('//*[@id="quote-header-info"]/div[2]/'
-                         'div[1]/div/span[1]')
-            
-            is_element_found = False
-            while not is_element_found:
-                try:
-                    element = self._try_refresh_element(xpath_str)
-                    price = element.text
-                    is_element_found = True
-                except StaleElementReferenceException:
-                    print('Element detached. Retrying...')
-                
+            # Current price, Yahoo time and option prices in one go
+            try:
+                payload = self._extract_page()
+            finally:
+                # Time the page loading regardless
+                self._record_time('Page Load', timer.stop(), 
+                                  symbol=yahoo_symbol, expiry=expiration_date)
             
-            # Current Yahoo time
-            xpath_str = '//*[@id="quote-market-notice"]/span'
+            if not self._page_changed(symbol, expiration_date, 
+                                      payload['time'], payload['tables']):
+                continue
             
-            is_element_found = False
-            while not is_element_found:
-                try:
-                    element = self._try_refresh_element(xpath_str) 
-                    yahoo_time = element.text
-                    is_element_found = True
-                except StaleElementReferenceException:
-                    print('Element detached. Retrying...')  
-                    
-            # Current option prices
-            xpath_str = ('//*[@id="main-0-Quote-Proxy"]/section/div[2]/'
-                         'section/div/section/section[1]/table/tbody/tr[1]')
+            timer = Timer() # Time table parsing
+            page = parse_option_extract(payload)
+            self._record_time('DF Parse', timer.stop(), symbol=yahoo_symbol, 
+                              expiry=expiration_date)
             
-            try:
-                element = self._try_refresh_element(
-                             xpath_str) # Make sure the content is loaded
-            except ElementEmptyError:
+            if not page.tables:
                 # This could happen when on the specific expiration date,
                 # only put option is available. Ignore the day and continue
                 # the loop.
                 print('No option price for {0} on expiration date: {1}'.format(
                         yahoo_symbol, expiration_date))
+                if from_cache:
+                    self._reject_cached_dates(yahoo_symbol)
+                    from_cache = False
                 continue
-            finally:
-                # Time the page loading regardless
-                self.timer['Page Load'].append(timer.stop())
             
-            timer = Timer() # Time table parsing
-            dfs = pd.read_html(self.browser.page_source)
-            self.timer['DF Parse'].append(timer.stop())
-            
-            for df in dfs:
-                # Modify and append data to self.data
-                if df.shape[1] == 10:
-                    # Determine option type
-                    idx = df['Contract Name'][0][5:].find('C')
-                    option_type = 'Put'
-                    if idx > -1:
-                        option_type = 'Call'
-                        
-                    df['Expiration Date'] = date[1]
-                    df['Download Time'] = dl_time
-                    df['Download Date'] = dl_date
-                    df['Download DateTime'] = dl_datetime
-                    df['Download Source'] = 'Yahoo Finance'
-                    df['Price @ DL Time'] = price
-                    df['Yahoo Time'] = yahoo_time
-                    df['Symbol'] = symbol
-                    df['Yahoo Symbol'] = yahoo_symbol
-                    df['Option Type'] = option_type
-        
-                    self.data = self.data.append(df, ignore_index=True)
-       
-        if browser_quit:
-            self.browser.quit()
-            self.browser = None
-            
-    def scrape_all(self, browser_quit=True):
-        """Scrape All Symbols
+            yield date, page, yahoo_symbol
+    
+    def _page_changed(self, symbol, expiry, yahoo_time, tables):
+        """False if self.change_detector has seen the page already"""
         
-        Scrape and crawl all symbols in the self.symbols
+        if self.change_detector is None:
+            return True
+        
+        if self.change_detector.page_changed(symbol, expiry, yahoo_time, 
+                                             tables):
+            return True
+        self.metrics.inc('pages_unchanged_total')
+        return False
+    
+    def _iter_one_stock(self, symbol, dates=None):
+        """Yield (date, OptionPage, yahoo_symbol) of one symbol
+        
+        If self.backend is set, the symbol is fetched without a browser first
+        and falls back to the browser on FetchError.
+        """
+        
+        # Skip the redirect of a symbol renamed before
+        yahoo_symbol = symbol
+        if self.symbol_cache is not None:
+            yahoo_symbol = self.symbol_cache.resolve(symbol)
+        self.yahoo_symbols[symbol] = yahoo_symbol
+        
+        if self.backend is not None:
+            try:
+                pages = self._fetch_one_stock_backend(yahoo_symbol, dates)
+            except FetchError as inst:
+                print('{0}: {1}. Falling back to browser...'.format(
+                        symbol, inst))
+            else:
+                for date, page in pages:
+                    if self._page_changed(symbol, date[0], page.yahoo_time, 
+                                          page.tables):
+                        yield date, page, yahoo_symbol
+                return
+                
+        yield from self._iter_one_stock_browser(symbol, yahoo_symbol, dates)
+    
+    def scrape_one_stock(self, symbol, browser_quit=True, dates=None):
+        """Yahoo Finance Option Scraper Lite
+        
+        Scrape and crawl one symbol. If self.backend is set, the symbol is
+        fetched without a browser first and falls back to the browser on
+        FetchError.
         
         Parameters:
         -----------
+        symbol : str
+            Ticker of the stock of interest
+            
         browser_quit : boolean, default True
             Browser behavior when function finishes or encounter an unhandled
             error. True means browser will be closed.
+            
+        dates : list of str, default None
+            Expiration date values (as in the &date= of the URL) to scrape.
+            None means all expiration dates.
         """
         
+        time_marks = make_time_marks()
+        for date, page, yahoo_symbol in self._iter_one_stock(symbol, dates):
+            self._append_tables(page.tables, date, page.price, 
+                                page.yahoo_time, symbol, yahoo_symbol, 
+                                time_marks)
+       
+        if browser_quit and self.browser is not None:
+            self._close_browser()
+            
+    def _iter_all(self, dates=None):
+        """Yield (symbol, date, OptionPage, yahoo_symbol, time_marks) of
+        every expiration date of every symbol, with the retries and error
+        handling of scrape_all()
+        """
+        
+        if dates is None:
+            dates = {}
+        
         for symbol in self.symbols:
+            if (self.symbol_cache is not None 
+                    and self.symbol_cache.is_dead(symbol)):
+                continue # Not found in the last rounds
+            
             timer = Timer() # Time each iteration
-            try_counter = 0
-            while try_counter < self.max_tries:
-                try:
-                    self.scrape_one_stock(symbol, browser_quit=False)
-                    break
-                except ElementNotFoundError:
-                    try_counter += 1
-                    self.browser.refresh()
-                    time.sleep(2) # Sometimes certain elements get stuck to be
-                                  # loaded. Wait a few seconds
-                except (SymbolNotFoundError, Page404Error):
-                    print(symbol + ' was not found.')
-                    break
-                except ElementEmptyError:
-                    print(symbol + ' has no option data')
-                    break
-                
-            if try_counter == self.max_tries:
+            done = set() # Dates already handed out survive a retry
+            attempt = 0
+            try:
+                while True:
+                    time_marks = make_time_marks()
+                    try:
+                        for date, page, yahoo_symbol in self._iter_one_stock(
+                                symbol, dates.get(symbol)):
+                            if date[0] in done:
+                                continue
+                            done.add(date[0])
+                            yield (symbol, date, page, yahoo_symbol, 
+                                   time_marks)
+                        break
+                    except ElementNotFoundError as inst:
+                        # Sometimes certain elements get stuck to be loaded.
+                        # Back off and scrape the symbol again
+                        attempt += 1
+                        if attempt >= self.retry.budget(inst):
+                            raise
+                        self.retry.record(inst)
+                        self.retry.sleep(attempt - 1)
+                        
+                if self.symbol_cache is not None:
+                    self.symbol_cache.mark_found(symbol)
+            except ElementNotFoundError:
                 print('Max tries reached. No data is available for '
                       'symbol ' + symbol)
+            except (SymbolNotFoundError, Page404Error):
+                if done: # Only a date page kept 404ing, the symbol is alive
+                    print('Max tries reached. No data is available for '
+                          'symbol ' + symbol)
+                else:
+                    print(symbol + ' was not found.')
+                    if self.symbol_cache is not None:
+                        # An alias may have been renamed again, redirect
+                        self.symbol_cache.remove_alias(symbol)
+                        self.symbol_cache.mark_missing(symbol)
+            except ElementEmptyError:
+                print(symbol + ' has no option data')
                 
-            self.timer['Total Time'].append(timer.stop())
+            self._record_time('Total Time', timer.stop(), symbol=symbol)
+            
+    def scrape_all(self, browser_quit=True, dates=None):
+        """Scrape All Symbols
+        
+        Scrape and crawl all symbols in the self.symbols
+        
+        Parameters:
+        -----------
+        browser_quit : boolean, default True
+            Browser behavior when function finishes or encounter an unhandled
+            error. True means browser will be closed.
+            
+        dates : dict, default None
+            Symbol -> list of expiration date values to scrape, see
+            scrape_one_stock(). Symbols not in it, or None, mean all dates.
+        """
+        
+        for symbol, date, page, yahoo_symbol, time_marks in self._iter_all(
+                dates):
+            self._append_tables(page.tables, date, page.price, 
+                                page.yahoo_time, symbol, yahoo_symbol, 
+                                time_marks)
                 
-        if browser_quit:
-            self.browser.quit()
-            self.browser = None
+        if browser_quit and self.browser is not None:
+            self._close_browser()
+            
+    def scrape_iter(self, browser_quit=True, dates=None):
+        """Scrape All Symbols as a Stream
+        
+        Same as scrape_all(), but each expiration date is yielded as soon as
+        it is scraped instead of piling up in self.data, which is left
+        untouched. Feed the batches to a stream_writer.StreamWriter to have
+        them persisted while the rest is still being scraped.
+        
+        Parameters:
+        -----------
+        See scrape_all().
+        
+        Yield:
+        ------
+        batch : DataFrame
+            Option data of one expiration date of one symbol, laid out as
+            self.data.
+        """
+        
+        try:
+            for symbol, date, page, yahoo_symbol, time_marks in \
+                    self._iter_all(dates):
+                buffer = self._new_buffer()
+                self._append_tables(page.tables, date, page.price, 
+                                    page.yahoo_time, symbol, yahoo_symbol, 
+                                    time_marks, buffer)
+                if len(buffer):
+                    yield buffer.to_frame()
+        finally:
+            if browser_quit and self.browser is not None:
+                self._close_browser()
             
     def save_to_csv(self, file_path):
         """Save dataframe to a flat file"""
@@ -415,17 +781,29 @@ class YahooScraper:
         self.data.to_csv(file_path)
         
     def save_to_sqlite(self, name, conn, if_exists='append', index=False):
-        """Save datafrom to sqlite3"""
+        """Save datafrom to sqlite3, dates as text like the data table"""
+        
+        to_text_format(self.data).to_sql(name, conn, if_exists=if_exists,
+                                         index=index)
+        
+    def save_to_parquet(self, store):
+        """Save dataframe to a partitioned parquet_store.ParquetStore"""
         
-        self.data.to_sql(name, conn, if_exists=if_exists, index=index)
+        store.write(self.data)
+
+def make_time_marks():
+    """Download time, date and datetime of now as strings"""
+    
+    now = datetime.now()
+    return (str(now.time()), str(now.date()), str(now))
 
 class Timer():
     """Time the time"""
     def __init__(self):
-        self.start = time.clock()
+        self.start = time.perf_counter()
         
     def stop(self):
-        return time.clock() - self.start
+        return time.perf_counter() - self.start
         
 class SymbolNotFoundError(Exception):
     """Symbol page could not be located"""